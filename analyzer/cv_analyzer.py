@@ -21,7 +21,8 @@ def analyze_cv(cv_text: str, job_description_text: str, hr_special_needs: str =
         model=ANALYZER_MODEL,
         system_prompt=analyzer_system_prompt,
         max_tokens=2000,
-        temperature=0.4
+        temperature=0.4,
+        stage="cv_analysis"
     )
     
     print("3. Analisi completata.")
@@ -1,5 +1,6 @@
 # Importiamo 'db' per interrogare la collection delle posizioni
-from services.data_manager import db, get_session_data, save_stage_output
+from services.data_manager import db, get_session_data, save_stage_output, get_single_position_data_from_db, SessionUnitOfWork
+from interviewer.llm_service import LLMServiceError
 from .cv_analyzer import analyze_cv
 
 def run_cv_analysis_pipeline(session_id: str) -> bool:
@@ -9,7 +10,7 @@ def run_cv_analysis_pipeline(session_id: str) -> bool:
     print(f"--- [PIPELINE] Avvio Analisi CV per sessione: {session_id} ---")
     
     # 1. Recupera i dati della sessione da MongoDB
-    session_data = get_session_data(session_id)
+    session_data = get_session_data(session_id, stages=("uploaded_cv_text",))
     if not session_data:
         print(f"  - ERRORE: Dati di sessione non trovati per {session_id}")
         return False
@@ -29,12 +30,8 @@ def run_cv_analysis_pipeline(session_id: str) -> bool:
         if db is None:
             raise ConnectionError("Connessione a MongoDB non disponibile.")
 
-        # Interroga la collection 'positions_data' per recuperare solo la JD
-        positions_collection = db["positions_data"]
-        position_document = positions_collection.find_one(
-            {"_id": position_id},
-            {"job_description": 1} # Proiezione: recupera solo il campo 'job_description'
-        )
+        # Recupera solo la JD (proiezione, servita dalla cache delle posizioni se presente)
+        position_document = get_single_position_data_from_db(position_id, fields=("job_description",))
         
         if not position_document or "job_description" not in position_document:
             print(f"  - ERRORE: Documento o campo 'job_description' non trovato per la posizione {position_id} nel DB.")
@@ -48,12 +45,17 @@ def run_cv_analysis_pipeline(session_id: str) -> bool:
 
     # 3. Esegui l'analisi del CV (logica esistente, ora ha tutti i dati)
     # Per ora, HR_NEEDS è vuoto, ma potrebbe essere letto dalla sessione in futuro
-    analysis_report = analyze_cv(cv_text=cv_text, job_description_text=jd_text, hr_special_needs="")
+    try:
+        analysis_report = analyze_cv(cv_text=cv_text, job_description_text=jd_text, hr_special_needs="")
+    except LLMServiceError as e:
+        print(f"  - Errore ricevuto dall'LLM: {e}")
+        analysis_report = None
     
     # 4. Salva il risultato nel documento di sessione
-    if analysis_report and "Errore" not in analysis_report:
-        save_stage_output(session_id, "cv_analysis_report", analysis_report)
-        save_stage_output(session_id, "cv_analysis_status", "Completed")
+    if analysis_report:
+        with SessionUnitOfWork(session_id) as uow:
+            uow.save_stage_output("cv_analysis_report", analysis_report)
+            uow.save_stage_output("cv_analysis_status", "Completed")
         print(f"  - Analisi CV completata e salvata per la sessione {session_id}.")
         return True
     else:
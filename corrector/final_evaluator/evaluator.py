@@ -37,7 +37,8 @@ def evaluate_candidate_performance(
         model=EVALUATION_MODEL,
         system_prompt=prompts_final_eval.SYSTEM_PROMPT,
         max_tokens=1500,
-        temperature=0.8
+        temperature=0.8,
+        stage="case_evaluation"
     )
     
     print("3. Report di valutazione generato.")
@@ -1,7 +1,9 @@
 import json
+from interviewer.llm_service import LLMServiceError
+from interviewer.transcript import conversation_messages
 from .final_evaluator.evaluator import evaluate_candidate_performance
 # Importiamo 'db' per interrogare la collection delle posizioni
-from services.data_manager import db, get_session_data, save_stage_output
+from services.data_manager import db, get_session_data, save_stage_output, get_single_position_data_from_db
 
 def execute_case_evaluation(session_id: str) -> bool:
     """
@@ -10,9 +12,9 @@ def execute_case_evaluation(session_id: str) -> bool:
     """
     print(f"--- [CORRECTOR] Avvio Valutazione per Sessione: {session_id} ---")
     
-    # 1. Recupera l'intero documento di sessione da MongoDB
+    # 1. Recupera dalla sessione MongoDB solo gli stage necessari
     print("  - Recupero dati di sessione da MongoDB...")
-    session_data = get_session_data(session_id)
+    session_data = get_session_data(session_id, stages=("conversation", "case_id", "seniority_level"))
     
     if not session_data or "stages" not in session_data:
         print(f"  - ERRORE: Dati di sessione o sotto-oggetto 'stages' non trovati per {session_id}")
@@ -24,7 +26,8 @@ def execute_case_evaluation(session_id: str) -> bool:
     
     # Tutti gli altri dati generati durante il processo sono figli diretti di 'stages'
     stages = session_data.get("stages", {})
-    conversation_json = stages.get("conversation")
+    # Il valutatore vede solo ruolo e testo (niente metadati della trascrizione, es. latenze)
+    conversation_json = conversation_messages(stages.get("conversation"))
     case_id_svolto = stages.get("case_id")
     seniority_level = stages.get("seniority_level")
 
@@ -41,8 +44,7 @@ def execute_case_evaluation(session_id: str) -> bool:
         if db is None:
             raise ConnectionError("Connessione a MongoDB non disponibile.")
         
-        positions_collection = db["positions_data"]
-        position_data = positions_collection.find_one({"_id": position_id})
+        position_data = get_single_position_data_from_db(position_id, fields=("icp", "all_cases", "evaluation_criteria"))
         
         if not position_data:
             print(f"  - ERRORE CRITICO: Nessun documento trovato su MongoDB per la position_id '{position_id}'.")
@@ -78,17 +80,21 @@ def execute_case_evaluation(session_id: str) -> bool:
 
     # 4. Esegui la valutazione (logica invariata)
     print("  - Avvio della valutazione con l'LLM...")
-    final_report = evaluate_candidate_performance(
-        icp_text=icp_text,
-        conversation_json_data=conversation_json,
-        all_cases_text=all_cases_text,
-        evaluation_criteria_text=evaluation_criteria_text,
-        seniority_level=seniority_level,
-        case_map_text=case_map_text
-    )
+    try:
+        final_report = evaluate_candidate_performance(
+            icp_text=icp_text,
+            conversation_json_data=conversation_json,
+            all_cases_text=all_cases_text,
+            evaluation_criteria_text=evaluation_criteria_text,
+            seniority_level=seniority_level,
+            case_map_text=case_map_text
+        )
+    except LLMServiceError as e:
+        print(f"  - Errore ricevuto dall'LLM: {e}")
+        final_report = None
     
-    # 5. Salva l'output nel DB (logica invariata)
-    if final_report and "Errore" not in final_report:
+    # 5. Salva l'output nel DB
+    if final_report:
         save_stage_output(session_id, "case_evaluation_report", final_report)
         print(f"  - Valutazione del caso completata e salvata nel DB per la sessione {session_id}.")
         return True
@@ -5,7 +5,8 @@ import re
 from typing import List, Dict, Optional
 from pydantic import BaseModel, Field
 from interviewer.llm_service import get_structured_llm_response
-from services.data_manager import db, get_session_data, save_stage_output
+from interviewer.transcript import conversation_messages
+from services.data_manager import db, get_session_data, save_stage_output, get_single_position_data_from_db
 
 from .prompts_skill_scorer import create_cv_scoring_prompt, create_interview_scoring_prompt
 
@@ -117,7 +118,10 @@ def _score_cv_relevance(cv_text: str, canonical_skills: List[dict]) -> Dict[str,
         tool_name="save_cv_skill_scores",
         tool_schema=CVScoreCollection.model_json_schema(),
         temperature=SKILL_SCORING_TEMPERATURE,
-        max_tokens=1800
+        max_tokens=1800,
+        use_cache=True,
+        validate=CVScoreCollection.model_validate_json,
+        stage="skill_scoring.cv"
     )
     if not tool_args:
         print("  - [Skill Scorer] Nessuna risposta strutturata per CV.")
@@ -151,7 +155,10 @@ def _score_interview_relevance(conversation_json: List[dict], canonical_skills:
         tool_name="save_interview_skill_scores",
         tool_schema=InterviewScoreCollection.model_json_schema(),
         temperature=SKILL_SCORING_TEMPERATURE,
-        max_tokens=2200
+        max_tokens=2200,
+        use_cache=True,
+        validate=InterviewScoreCollection.model_validate_json,
+        stage="skill_scoring.interview"
     )
     if not tool_args:
         print("  - [Skill Scorer] Nessuna risposta strutturata per colloquio.")
@@ -178,7 +185,7 @@ def compute_and_save_skill_relevance(session_id: str) -> bool:
     - salva in stages.skill_relevance
     """
     print(f"--- [SKILL SCORER] Avvio calcolo rilevanza skill per sessione: {session_id} ---")
-    session = get_session_data(session_id)
+    session = get_session_data(session_id, stages=("uploaded_cv_text", "conversation", "case_id"))
     if not session:
         print("  - ERRORE: sessione non trovata.")
         return False
@@ -186,15 +193,14 @@ def compute_and_save_skill_relevance(session_id: str) -> bool:
     position_id = session.get("position_id")
     stages = session.get("stages", {})
     cv_text = stages.get("uploaded_cv_text", "")
-    conversation_json = stages.get("conversation", [])
+    conversation_json = conversation_messages(stages.get("conversation"))
 
     if db is None:
         print("  - ERRORE: DB non disponibile.")
         return False
 
     # Carica posizione completa
-    positions_collection = db["positions_data"]
-    position_data = positions_collection.find_one({"_id": position_id})
+    position_data = get_single_position_data_from_db(position_id, fields=("all_cases", "evaluation_criteria"))
     if not position_data:
         print(f"  - ERRORE: posizione '{position_id}' non trovata.")
         return False
@@ -1,6 +1,6 @@
 # analyzer/case_guide_generator/guide_creator.py
 
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, LLMServiceError
 from . import prompts_guide
 
 GUIDE_MODEL = "gpt-4.1-2025-04-14"
@@ -14,16 +14,17 @@ def generate_case_guide(icp_text: str, seniority_level: str, hr_special_needs: s
 
     print(f"  - [Agente Guida] Invio della richiesta al modello '{GUIDE_MODEL}'...")
 
-    case_guide = get_llm_response(
-        prompt=guide_prompt,
-        model=GUIDE_MODEL,  
-        system_prompt=prompts_guide.SYSTEM_PROMPT,
-        temperature=0.2,
-        max_tokens=2000
-    )
-
-    if "Errore" in case_guide:
-        print(f"  - [Agente Guida] Errore ricevuto dall'LLM: {case_guide}")
+    try:
+        case_guide = get_llm_response(
+            prompt=guide_prompt,
+            model=GUIDE_MODEL,  
+            system_prompt=prompts_guide.SYSTEM_PROMPT,
+            temperature=0.2,
+            max_tokens=2000,
+            stage="data_preparation.case_guide"
+        )
+    except LLMServiceError as e:
+        print(f"  - [Agente Guida] Errore ricevuto dall'LLM: {e}")
         return None
 
     print("  - [Agente Guida] Guida alla generazione del caso creata.")
@@ -4,10 +4,12 @@ from pydantic import BaseModel, Field
 from interviewer.llm_service import get_structured_llm_response
 from . import prompts_final
 
+import os
 import json
+import asyncio
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from interviewer.llm_service import get_structured_llm_response
+from interviewer.llm_service import get_structured_llm_response, aget_structured_llm_response, run_async
 from . import prompts_final
 
 class SkillToTest(BaseModel):
@@ -31,21 +33,115 @@ class CaseCollection(BaseModel):
 
 FINAL_MODEL = "gpt-4.1-2025-04-14"
 
-def generate_final_cases(icp_text: str, guide_text: str, kb_summary: str, seniority_level: str, hr_special_needs: str = "") -> CaseCollection | None:
-    """
-    Genera una collezione di 5 casi di studio strutturati in formato JSON.
-    Integra le Indicazioni HR nella generazione.
-    """
+# --- MODALITÀ DI GENERAZIONE ---
+#   "fanout" -> una chiamata per caso, in parallelo, ciascuna con un tema distinto; ogni caso
+#               viene validato da solo e si ritentano solo i casi falliti (default)
+#   "single" -> una sola chiamata per l'intera CaseCollection
+CASE_GENERATION_MODE = os.getenv("CASE_GENERATION_MODE", "fanout")
+CASES_PER_POSITION = 5
+CASE_GENERATION_MAX_ATTEMPTS = int(os.getenv("CASE_GENERATION_MAX_ATTEMPTS", "3"))
+# Tetto dei token in uscita per un caso (testo + 4 step + JSON). Serve anche allo scheduler:
+# senza max_tokens ogni richiesta viene stimata con un completamento generico, non con quello reale.
+# Quanti casi partono davvero insieme dipende dal budget tpm del modello (LLM_RATE_LIMITS).
+CASE_MAX_TOKENS = int(os.getenv("CASE_MAX_TOKENS", "2500"))
+# Un tema per caso: differenzia le chiamate parallele (che non vedono gli altri casi)
+CASE_THEMES = [
+    "avvio o lancio di un nuovo progetto, prodotto o servizio",
+    "ottimizzazione di un processo o di un sistema esistente che mostra criticità",
+    "gestione di un imprevisto o di una situazione critica con vincoli di tempo",
+    "analisi di dati e informazioni incomplete per prendere una decisione motivata",
+    "pianificazione con risorse e budget limitati e priorità in conflitto",
+    "scalabilità e crescita: adattare l'organizzazione o la soluzione a volumi maggiori",
+    "integrazione o migrazione tra strumenti, metodologie o team diversi",
+]
+
+def _example_case() -> dict:
     example_skill = SkillToTest(skill_name="Esempio Skill", testing_method="Esempio metodo di test")
     example_step = {
         "id": 0, "title": "Titolo Esempio Step", "description": "Descrizione Esempio Step",
         "skills_to_test": [example_skill.model_dump()]
     }
-    example_case = {
+    return {
         "question_id": "case-example-01", "question_title": "Titolo Esempio Caso",
         "question_text": "Testo Esempio Caso", "reasoning_steps": [example_step]
     }
-    example_collection = {"cases": [example_case]}
+
+def generate_final_cases(icp_text: str, guide_text: str, kb_summary: str, seniority_level: str, hr_special_needs: str = "") -> CaseCollection | None:
+    """
+    Genera una collezione di 5 casi di studio strutturati in formato JSON.
+    Integra le Indicazioni HR nella generazione.
+    """
+    if CASE_GENERATION_MODE == "fanout":
+        return _generate_cases_fanout(icp_text, guide_text, kb_summary, seniority_level, hr_special_needs)
+    return _generate_cases_single_call(icp_text, guide_text, kb_summary, seniority_level, hr_special_needs)
+
+def _validate_case(tool_call_args: str | None) -> CaseStructure:
+    if not tool_call_args:
+        raise ValueError("nessun output strutturato ricevuto")
+    return CaseStructure.model_validate(json.loads(tool_call_args))
+
+def _generate_cases_fanout(icp_text: str, guide_text: str, kb_summary: str, seniority_level: str, hr_special_needs: str) -> CaseCollection | None:
+    """
+    Un caso per chiamata, tutte in parallelo: un caso malformato costa il ritentativo di quel
+    solo caso. Il tempo totale si avvicina a quello di un singolo caso solo se il budget tpm
+    del modello copre tutte le richieste (con il tier 1 di gpt-4.1 lo scheduler le scagliona).
+    """
+    json_example_str = json.dumps(_example_case(), indent=2)
+    themes = [CASE_THEMES[i % len(CASE_THEMES)] for i in range(CASES_PER_POSITION)]
+    prompts = [
+        prompts_final.create_single_case_prompt(
+            icp_text, guide_text, kb_summary, seniority_level, json_example_str, hr_special_needs,
+            case_number=i + 1, total_cases=CASES_PER_POSITION, theme=theme,
+            other_themes=[t for j, t in enumerate(themes) if j != i]
+        )
+        for i, theme in enumerate(themes)
+    ]
+
+    async def _generate(indexes: list):
+        return await asyncio.gather(*(
+            aget_structured_llm_response(
+                prompt=prompts[i],
+                model=FINAL_MODEL,
+                system_prompt=prompts_final.SYSTEM_PROMPT,
+                tool_name="save_generated_case",
+                tool_schema=CaseStructure.model_json_schema(),
+                max_tokens=CASE_MAX_TOKENS,
+                stage="data_preparation.cases"
+            )
+            for i in indexes
+        ), return_exceptions=True)
+
+    cases = {}
+    for attempt in range(1, CASE_GENERATION_MAX_ATTEMPTS + 1):
+        missing = [i for i in range(CASES_PER_POSITION) if i not in cases]
+        if not missing:
+            break
+        print(f"Generazione in parallelo di {len(missing)} casi con '{FINAL_MODEL}' (tentativo {attempt}/{CASE_GENERATION_MAX_ATTEMPTS})...")
+        for i, result in zip(missing, run_async(_generate(missing))):
+            try:
+                if isinstance(result, BaseException):
+                    raise result
+                cases[i] = _validate_case(result)
+            except Exception as e:
+                print(f"  - Caso {i + 1} ({themes[i]}) non valido: {e}")
+
+    if len(cases) < CASES_PER_POSITION:
+        print(f"Errore critico: {CASES_PER_POSITION - len(cases)} casi non generati dopo {CASE_GENERATION_MAX_ATTEMPTS} tentativi.")
+        return None
+
+    # Le chiamate sono indipendenti: gli ID scelti dal modello possono coincidere
+    seen_ids = set()
+    for i in range(CASES_PER_POSITION):
+        case = cases[i]
+        if case.question_id in seen_ids:
+            case.question_id = f"{case.question_id}-{i + 1:02d}"
+        seen_ids.add(case.question_id)
+
+    print(f"{CASES_PER_POSITION} casi generati e validati singolarmente. Generazione completata.")
+    return CaseCollection(cases=[cases[i] for i in range(CASES_PER_POSITION)])
+
+def _generate_cases_single_call(icp_text: str, guide_text: str, kb_summary: str, seniority_level: str, hr_special_needs: str) -> CaseCollection | None:
+    example_collection = {"cases": [_example_case()]}
     json_example_str = json.dumps(example_collection, indent=2)
 
     print("1. Creazione del prompt finale con esempio JSON...")
@@ -60,7 +156,9 @@ def generate_final_cases(icp_text: str, guide_text: str, kb_summary: str, senior
         model=FINAL_MODEL,
         system_prompt=prompts_final.SYSTEM_PROMPT,
         tool_name="save_generated_cases",
-        tool_schema=CaseCollection.model_json_schema()
+        tool_schema=CaseCollection.model_json_schema(),
+        max_tokens=CASE_MAX_TOKENS * CASES_PER_POSITION,
+        stage="data_preparation.cases"
     )
 
     if not tool_call_args:
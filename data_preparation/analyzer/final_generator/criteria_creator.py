@@ -31,7 +31,8 @@ def generate_final_criteria(icp_text: str, cases_json_str: str, seniority_level:
         model=FINAL_MODEL,
         system_prompt=prompts_criteria.SYSTEM_PROMPT,
         tool_name="save_generated_criteria",
-        tool_schema=CriteriaCollection.model_json_schema()
+        tool_schema=CriteriaCollection.model_json_schema(),
+        stage="data_preparation.chatbot_criteria"
     )
 
     if not tool_call_args:
@@ -7,15 +7,36 @@ def create_final_case_prompt(icp_text: str, guide_text: str, kb_summary: str, se
     """
     Assembla il prompt finale per la generazione dei case strutturati, integrando le Indicazioni HR.
     """
+    return _build_case_prompt(
+        "Produci 5 case complessi e strutturati, e decomponi il raggiungimento della soluzione in 6 step consecutivi (reasoning steps, da 1 a 6).",
+        icp_text, guide_text, kb_summary, seniority_level, json_example_str, hr_special_needs
+    )
+
+def create_single_case_prompt(icp_text: str, guide_text: str, kb_summary: str, seniority_level: str, json_example_str: str,
+                              hr_special_needs: str, case_number: int, total_cases: int, theme: str, other_themes: list) -> str:
+    """
+    Prompt per la generazione di UN solo case (modalità fan-out): stesse regole del prompt
+    completo, più un tema assegnato che lo distingue dagli altri case generati in parallelo.
+    """
+    others = "; ".join(other_themes) if other_themes else "nessuno"
+    task = (
+        f"Produci 1 case complesso e strutturato (il case {case_number} di {total_cases} per questa posizione), "
+        "e decomponi il raggiungimento della soluzione in 6 step consecutivi (reasoning steps, da 1 a 6).\n"
+        f"Lo scenario del case deve svilupparsi attorno a questo TEMA: {theme}.\n"
+        f"Gli altri case della posizione vengono generati separatamente sui temi: {others}. Evita sovrapposizioni con questi scenari."
+    )
+    return _build_case_prompt(task, icp_text, guide_text, kb_summary, seniority_level, json_example_str, hr_special_needs)
+
+def _build_case_prompt(task: str, icp_text: str, guide_text: str, kb_summary: str, seniority_level: str, json_example_str: str, hr_special_needs: str) -> str:
     hr_block = hr_special_needs.strip() if hr_special_needs else "Nessuna indicazione speciale fornita."
     return f"""
-Produci 5 case complessi e strutturati, e decomponi il raggiungimento della soluzione in 6 step consecutivi (reasoning steps, da 1 a 6).
+{task}
 Integra le INDICAZIONI SPECIALI HR come vincoli o preferenze operative nella costruzione degli scenari e nella scelta delle skill da testare.
 
 Indicazioni Speciali HR: usa questo interpretando le richieste in chiave di quanto richiesto nella ICP e guida alla generazione.
 {hr_block}
 
-Produci 5 case complessi e strutturati, e decomponi il raggiungimento della soluzione in 6 step consecutivi (reasoning steps, da 1 a 6).
+{task}
 Poiché per ciascun case dovranno essere verificate tutte le skill richieste dovrai, per ciascun reasoning step, indicare 3 skill da poter testare (estratte in modo accurato dalla ICP e basandoti sulle indicazioni della Guida alla generazione) all'interno del reasoning step stesso, esplictando brevemente in che modo (per questo lavoro aiutati con l'input GUIDA ALLA GENERAZIONE, che contiene tutti i requisiti da testare, e le modalità con cui è possibile farlo).
 Perché i Case, e relativi reasoning steps siano perfetti:
 o	Ciascun case dovrà essere in grado di verificare TUTTE le “Competenze tecniche richieste esplicitamente dall'annuncio”, "Competenze trasversali richieste esplicitamente dall'annuncio (escluse le lingue)" e "Responsabilità principali e attività operative attese" presentati nella ICP. Per fare ciò, dovrai quindi attribuire a ciascun reasoning step almeno 3 skill che secondo te sono ideali da verificare in quel contesto (secondo lo schema imposto).
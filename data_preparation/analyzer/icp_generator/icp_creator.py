@@ -1,6 +1,6 @@
 # analyzer/icp_generator/icp_creator.py
 
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, LLMServiceError
 from . import prompts_icp
 
 ICP_MODEL = "gpt-4.1-2025-04-14"
@@ -26,16 +26,17 @@ def generate_and_extract_icp(job_description_text: str, hr_special_needs: str =
     icp_prompt = prompts_icp.create_icp_generation_prompt(job_description_text, hr_special_needs)
 
     print(f"  - [Agente ICP] Invio della richiesta al modello '{ICP_MODEL}'...")
-    full_llm_output = get_llm_response(
-        prompt=icp_prompt,
-        model=ICP_MODEL,
-        system_prompt=prompts_icp.SYSTEM_PROMPT,
-        max_tokens=2500,
-        temperature=0.4 
-    )
-
-    if "Errore" in full_llm_output:
-        print(f"  - [Agente ICP] Errore ricevuto dall'LLM: {full_llm_output}")
+    try:
+        full_llm_output = get_llm_response(
+            prompt=icp_prompt,
+            model=ICP_MODEL,
+            system_prompt=prompts_icp.SYSTEM_PROMPT,
+            max_tokens=2500,
+            temperature=0.4,
+            stage="data_preparation.icp"
+        )
+    except LLMServiceError as e:
+        print(f"  - [Agente ICP] Errore ricevuto dall'LLM: {e}")
         return None
 
     print("  - [Agente ICP] Estrazione della sezione 'Ideal Candidate Profile'...")
@@ -1,12 +1,43 @@
 # analyzer/kb_summarizer/kb_processor.py
 
 import os
+import asyncio
+from typing import List
+from pydantic import BaseModel, Field, ValidationError
 # Assicuriamoci che l'import del servizio LLM sia corretto per la nuova struttura
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import (
+    get_llm_response, aget_llm_response, aget_structured_llm_response, run_async, LLMServiceError,
+    _cache_lookup, _cache_store,
+)
+from interviewer.llm_scheduler import scheduler, estimate_request_tokens
 from . import prompts_kb
 
 KB_MODEL = "gpt-4.1-2025-04-14" 
 
+# --- MAP-REDUCE PER KB GRANDI ---
+# Fino a KB_CHUNK_TOKENS la KB viene sintetizzata con una sola chiamata. Oltre, ogni documento
+# (spezzato in parti da KB_CHUNK_TOKENS se lungo) passa dalla fase 'map', che ne estrae gli
+# insight senza l'ICP; l'ICP entra solo nel 'reduce' (accorpamento a livelli finché gli insight
+# stanno in KB_REDUCE_MAX_TOKENS) e nella sintesi finale con KB_MODEL.
+# Gli insight di ciascun documento sono in cache con chiave = hash del suo contenuto (più modello
+# e istruzioni di map): modificare, aggiungere o cambiare ICP rielabora al più i documenti toccati.
+# I documenti da elaborare vengono impacchettati in richieste da KB_CHUNK_TOKENS solo per ridurre
+# il numero di chiamate; l'output è per documento, quindi il pacchetto non entra nella cache.
+# Le chiamate map usano un modello economico con budget tpm ampio (KB_MAP_MODEL): su gpt-4.1
+# (tier 1, 30k tpm) 20 documenti restavano minuti in attesa dello scheduler, togliendo budget
+# agli altri stage della pipeline. In volo ne restano solo quante ne stanno nel budget tpm.
+KB_CHUNK_TOKENS = int(os.getenv("KB_CHUNK_TOKENS", "6000"))
+KB_REDUCE_MAX_TOKENS = int(os.getenv("KB_REDUCE_MAX_TOKENS", "12000"))
+KB_MAP_MODEL = os.getenv("KB_MAP_MODEL", "gpt-4o-mini")
+KB_MAP_MAX_TOKENS = 800
+
+class DocumentInsights(BaseModel):
+    document_id: int = Field(description="Numero del documento, come indicato nella sua intestazione ([DOC n]).")
+    insights: str = Field(description="Elenco puntato degli insight del documento, oppure 'Nessun insight rilevante'.")
+
+class MapInsights(BaseModel):
+    documents: List[DocumentInsights] = Field(description="Un elemento per ciascun documento ricevuto.")
+
 def _extract_kb_insight_from_response(full_response: str) -> str:
     """
     Estrae solo la sezione 'Knowledge Base Insight' dall'output completo dell'LLM,
@@ -42,6 +73,190 @@ def _extract_kb_insight_from_response(full_response: str) -> str:
         # la pipeline e permettere un debug manuale.
         return full_response
 
+def _estimate_tokens(text: str) -> int:
+    # Stessa approssimazione dello scheduler: ~4 caratteri per token
+    return len(text) // 4
+
+def _format_document(title: str, content: str) -> str:
+    return f"--- INIZIO DOCUMENTO: {title} ---\n{content}\n--- FINE DOCUMENTO ---"
+
+def _split_content(content: str, max_tokens: int) -> list:
+    """Divide un testo in parti di al più max_tokens, preferibilmente tra paragrafi."""
+    max_chars = max_tokens * 4
+    if len(content) <= max_chars:
+        return [content]
+    parts, current = [], ""
+    for paragraph in content.split("\n\n"):
+        # Paragrafi più lunghi di una parte intera vengono tagliati a misura
+        while len(paragraph) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        parts.append(current)
+    return parts
+
+def _map_units(kb_documents: list, max_tokens: int) -> list:
+    """[(etichetta, testo)]: un'unità per documento; un documento che da solo supera max_tokens viene spezzato in parti."""
+    units = []
+    for doc in kb_documents:
+        title = doc.get('title', 'Senza Titolo')
+        content = doc.get('content', '') or ''
+        if _estimate_tokens(_format_document(title, content)) <= max_tokens:
+            units.append((title, content))
+            continue
+        parts = _split_content(content, max_tokens)
+        units.extend((f"{title} (parte {i + 1}/{len(parts)})", part) for i, part in enumerate(parts))
+    return units
+
+def _unit_cache_kwargs(label: str, content: str) -> dict:
+    """
+    Richiesta "canonica" di un'unità, usata solo come chiave della cache: dipende dal contenuto
+    dell'unità, dal modello e dalle istruzioni di map, non dai documenti vicini né dall'ICP.
+    """
+    return {
+        "model": KB_MAP_MODEL,
+        "messages": [
+            {"role": "system", "content": prompts_kb.SYSTEM_PROMPT},
+            {"role": "user", "content": prompts_kb.create_kb_map_prompt(_format_document(label, content))},
+        ],
+        "temperature": 0.2,
+        "max_tokens": KB_MAP_MAX_TOKENS,
+    }
+
+def _pack_units(indexes: list, units: list, max_tokens: int) -> list:
+    """Raggruppa, nell'ordine, le unità da elaborare in richieste entro max_tokens (solo per il budget delle richieste)."""
+    packs, current, current_tokens = [], [], 0
+    for i in indexes:
+        tokens = _estimate_tokens(_format_document(*units[i]))
+        if current and current_tokens + tokens > max_tokens:
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def _max_in_flight(requests: list) -> int | None:
+    """Chiamate contemporanee che stanno nel budget tpm del modello (None = nessun limite attivo)."""
+    limits = scheduler.limits_for(requests[0]["model"]) if requests else None
+    if not limits:
+        return None
+    largest = max(
+        estimate_request_tokens({
+            "messages": [{"content": r["system_prompt"]}, {"content": r["prompt"]}],
+            "max_tokens": r.get("max_tokens"),
+        })
+        for r in requests
+    )
+    return max(1, limits["tpm"] // largest)
+
+def _gather_llm(requests: list, call=aget_llm_response) -> list:
+    """
+    Esegue in parallelo le chiamate LLM (testuali, o strutturate con 'call'), senza tenerne in volo più di quante ne stanno nel
+    budget tpm del modello (le altre attenderebbero comunque lo scheduler). Le chiamate fallite
+    restituiscono None.
+    """
+    max_in_flight = _max_in_flight(requests)
+    semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+
+    async def _call(request: dict):
+        if semaphore is None:
+            return await call(**request)
+        async with semaphore:
+            return await call(**request)
+
+    async def _run_all():
+        return await asyncio.gather(*(_call(request) for request in requests), return_exceptions=True)
+    results = run_async(_run_all()) if requests else []
+    return [None if isinstance(r, BaseException) or not r else r for r in results]
+
+def _map_insights(kb_documents: list) -> list:
+    units = _map_units(kb_documents, KB_CHUNK_TOKENS)
+    stage = "data_preparation.kb_summary.map"
+    results, cache_keys = {}, {}
+    for i, (label, content) in enumerate(units):
+        cache_keys[i], cached = _cache_lookup(_unit_cache_kwargs(label, content), True, stage)
+        if cached is not None:
+            results[i] = cached
+    packs = _pack_units([i for i in range(len(units)) if i not in results], units, KB_CHUNK_TOKENS)
+    print(f"  - [Agente KB] Map: {len(units)} documenti/parti, {len(results)} dalla cache, "
+          f"{sum(len(pack) for pack in packs)} da elaborare in {len(packs)} richieste con '{KB_MAP_MODEL}'...")
+    requests = [
+        {
+            "prompt": prompts_kb.create_kb_map_prompt("\n\n".join(
+                _format_document(f"[DOC {n}] {units[i][0]}", units[i][1]) for n, i in enumerate(pack, start=1)
+            )),
+            "model": KB_MAP_MODEL,
+            "system_prompt": prompts_kb.SYSTEM_PROMPT,
+            "tool_name": "save_document_insights",
+            "tool_schema": MapInsights.model_json_schema(),
+            "temperature": 0.2,
+            "max_tokens": KB_MAP_MAX_TOKENS * len(pack),
+            "stage": stage,
+        }
+        for pack in packs
+    ]
+    for pack, result in zip(packs, _gather_llm(requests, aget_structured_llm_response)):
+        try:
+            by_number = {d.document_id: d.insights.strip() for d in MapInsights.model_validate_json(result).documents} if result else {}
+        except ValidationError as e:
+            print(f"  - [Agente KB] Attenzione: output della map non valido: {e}")
+            by_number = {}
+        for n, i in enumerate(pack, start=1):
+            if not by_number.get(n):
+                print(f"  - [Agente KB] Attenzione: insight non estratti da: {units[i][0]}.")
+                continue
+            results[i] = by_number[n]
+            # In cache per singola unità: rielaborare un documento non invalida gli altri
+            _cache_store(cache_keys[i], results[i], KB_MAP_MODEL)
+    return [
+        f"--- INSIGHT DAL DOCUMENTO: {units[i][0]} ---\n{results[i]}"
+        for i in range(len(units))
+        if i in results and not results[i].lower().startswith("nessun insight rilevante")
+    ]
+
+def _reduce_insights(icp_text: str, insights: list) -> list:
+    """Accorpa gli insight a livelli (gruppi entro KB_REDUCE_MAX_TOKENS) finché stanno in un'unica sintesi."""
+    level = 1
+    while len(insights) > 1 and _estimate_tokens("\n\n".join(insights)) > KB_REDUCE_MAX_TOKENS:
+        groups, current = [], []
+        for insight in insights:
+            if current and _estimate_tokens("\n\n".join(current + [insight])) > KB_REDUCE_MAX_TOKENS:
+                groups.append(current)
+                current = []
+            current.append(insight)
+        groups.append(current)
+        if len(groups) == len(insights):
+            # Ogni insight supera da solo il budget: accorpiamo comunque a coppie
+            groups = [insights[i:i + 2] for i in range(0, len(insights), 2)]
+        print(f"  - [Agente KB] Reduce (livello {level}): {len(insights)} blocchi di insight -> {len(groups)}...")
+        requests = [
+            {
+                "prompt": prompts_kb.create_kb_reduce_prompt(icp_text, "\n\n".join(group)),
+                "model": KB_MODEL,
+                "system_prompt": prompts_kb.SYSTEM_PROMPT,
+                "temperature": 0.2,
+                "max_tokens": 2000,
+                "stage": "data_preparation.kb_summary.reduce",
+            }
+            for group in groups
+        ]
+        # Un gruppo non accorpato viene riportato così com'è al livello successivo
+        insights = [
+            result if result else "\n\n".join(group)
+            for group, result in zip(groups, _gather_llm(requests))
+        ]
+        level += 1
+    return insights
+
 def summarize_knowledge_base(icp_text: str, kb_documents: list) -> str | None:
     """
     Genera una sintesi della KB contestualizzata sull'ICP e ne estrae la parte rilevante.
@@ -59,25 +274,34 @@ def summarize_knowledge_base(icp_text: str, kb_documents: list) -> str | None:
 
     # Formatta i documenti in un'unica stringa per il prompt
     kb_content = "\n\n".join(
-        f"--- INIZIO DOCUMENTO: {doc.get('title', 'Senza Titolo')} ---\n{doc.get('content', '')}\n--- FINE DOCUMENTO ---"
+        _format_document(doc.get('title', 'Senza Titolo'), doc.get('content', ''))
         for doc in kb_documents
     )
 
+    if _estimate_tokens(kb_content) > KB_CHUNK_TOKENS:
+        # KB grande: il report finale viene sintetizzato dagli insight estratti per documento
+        insights = _reduce_insights(icp_text, _map_insights(kb_documents))
+        if not insights:
+            print("  - [Agente KB] Nessun insight estratto dai documenti della Knowledge Base.")
+            return None
+        kb_content = "\n\n".join(insights)
+
     print("  - [Agente KB] Creazione del prompt per la sintesi...")
     synthesis_prompt = prompts_kb.create_kb_synthesis_prompt(icp_text, kb_content)
     
     print(f"  - [Agente KB] Invio della richiesta al modello '{KB_MODEL}' per la sintesi...")
     # La chiamata LLM ora restituisce l'output completo, inclusa la parte di ragionamento
-    full_llm_output = get_llm_response(
-        prompt=synthesis_prompt,
-        model=KB_MODEL,
-        system_prompt=prompts_kb.SYSTEM_PROMPT,
-        temperature=0.2,
-        max_tokens=2000
-    )
-    
-    if "Errore" in full_llm_output:
-        print(f"  - [Agente KB] Errore ricevuto dall'LLM: {full_llm_output}")
+    try:
+        full_llm_output = get_llm_response(
+            prompt=synthesis_prompt,
+            model=KB_MODEL,
+            system_prompt=prompts_kb.SYSTEM_PROMPT,
+            temperature=0.2,
+            max_tokens=2000,
+            stage="data_preparation.kb_summary"
+        )
+    except LLMServiceError as e:
+        print(f"  - [Agente KB] Errore ricevuto dall'LLM: {e}")
         return None
 
     print("  - [Agente KB] Output completo ricevuto. Estrazione della sezione 'Knowledge Base Insight'...")
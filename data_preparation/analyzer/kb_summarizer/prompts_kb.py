@@ -35,4 +35,43 @@ Attenzione: Non produrre ulteriore testo oltre alle due parti sopra citate. Nien
 
 **PROFILO DEL CANDIDATO IDEALE (ICP):**
 {icp_text}
-"""
\ No newline at end of file
+"""
+def create_kb_map_prompt(documents: str) -> str:
+    """
+    Prompt della fase 'map': estrae gli insight di ciascun documento, separatamente e senza
+    l'ICP (l'estrazione di un documento resta così valida per qualunque posizione).
+    """
+    return f"""
+Dai documenti aziendali seguenti estrai, separatamente per ciascun documento, gli insight concreti da cui prendere spunto per costruire use-case di verifica delle competenze: progetti, attività, processi, strumenti, ruoli e contesti operativi.
+---
+**Istruzioni**:
+o	Restituisci un elemento per ogni documento, con il numero indicato nella sua intestazione ([DOC n]).
+o	Riporta solo insight presenti nel documento; se non ce ne sono, scrivi "Nessun insight rilevante".
+o	Usa un elenco puntato sintetico, un insight per punto.
+o	Non lasciar trapelare alcun tipo di dato reale e potenzialmente confidenziale dell’azienda.
+o	Non usare emoji e non aggiungere introduzioni o conclusioni.
+---
+**DOCUMENTI:**
+{documents}
+"""
+
+def create_kb_reduce_prompt(icp_text: str, partial_insights: str) -> str:
+    """
+    Prompt della fase 'reduce' intermedia: accorpa gli insight di più documenti in un
+    elenco unico, eliminando ripetizioni, senza ancora produrre il report finale.
+    """
+    return f"""
+Di seguito trovi gli insight estratti da più documenti della Knowledge Base aziendale. Valutali in relazione alla ICP riportata in fondo.
+Accorpali in un unico elenco puntato: unisci gli insight ripetuti o molto simili, mantieni quelli specifici e più utili a costruire use-case per la ICP, scarta quelli generici o non pertinenti alla ICP.
+---
+**Istruzioni**:
+o	Mantieni il riferimento al documento di origine quando è utile a contestualizzare l'insight.
+o	Non lasciar trapelare alcun tipo di dato reale e potenzialmente confidenziale dell’azienda.
+o	Non usare emoji e non aggiungere introduzioni o conclusioni.
+---
+**INSIGHT DA ACCORPARE:**
+{partial_insights}
+
+**PROFILO DEL CANDIDATO IDEALE (ICP):**
+{icp_text}
+"""
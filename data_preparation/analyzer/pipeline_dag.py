@@ -0,0 +1,170 @@
+# data_preparation/analyzer/pipeline_dag.py
+
+import time
+import json
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- CONFIGURAZIONE ---
+# Stage pronti eseguiti in parallelo (sono quasi solo attese su chiamate LLM)
+PIPELINE_MAX_WORKERS = 4
+
+
+class PipelineStage:
+    """
+    Stage della pipeline: 'func' riceve come keyword gli output degli stage indicati in
+    'inputs' e restituisce il proprio output (falsy = fallimento). 'on_success' riceve
+    l'output appena prodotto (es. per salvarlo sul documento della posizione).
+    Uno stage non 'required' che fallisce non interrompe la pipeline.
+    'params' sono gli altri valori che influenzano l'output (entrano nell'hash degli input);
+    'restore' ricostruisce l'output dal valore salvato in un checkpoint.
+    """
+
+    def __init__(self, name: str, func, inputs: tuple = (), label: str = "", on_success=None, required: bool = True,
+                 params: dict | None = None, restore=None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.label = label or name
+        self.on_success = on_success
+        self.required = required
+        self.params = params or {}
+        self.restore = restore
+
+
+def _canonical(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return value
+
+
+def stage_input_hash(stage: PipelineStage, kwargs: dict) -> str:
+    """Hash del contenuto degli input di uno stage (output a monte inclusi) e dei suoi parametri."""
+    payload = {
+        "stage": stage.name,
+        "inputs": {name: _canonical(value) for name, value in kwargs.items()},
+        "params": stage.params,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _validate(stages: list, initial: dict):
+    names = [stage.name for stage in stages]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Stage duplicati nella pipeline: {names}")
+    available = set(initial) | set(names)
+    for stage in stages:
+        missing = [i for i in stage.inputs if i not in available]
+        if missing:
+            raise ValueError(f"Lo stage '{stage.name}' dipende da input inesistenti: {missing}")
+
+
+def _run_stage(stage: PipelineStage, kwargs: dict, started_at: float):
+    start = time.perf_counter()
+    try:
+        output = stage.func(**kwargs)
+        if output and stage.on_success:
+            stage.on_success(output)
+        error = None
+    except Exception as e:
+        output, error = None, e
+    end = time.perf_counter()
+    return output, error, {"start_s": round(start - started_at, 3), "duration_s": round(end - start, 3)}
+
+
+def run_pipeline_dag(stages: list, initial: dict | None = None, max_workers: int = PIPELINE_MAX_WORKERS,
+                     checkpoint=None, force_stages=()) -> tuple[bool, dict, dict]:
+    """
+    Esegue gli stage rispettando le dipendenze: appena gli input di uno stage sono
+    disponibili lo stage parte, in parallelo agli altri pronti. Al primo fallimento di
+    uno stage obbligatorio non ne vengono avviati altri (quelli in corso terminano).
+
+    Con un 'checkpoint' (oggetto con load(stage, input_hash) e save(stage, input_hash))
+    uno stage il cui hash degli input coincide con quello salvato non viene rieseguito:
+    si riprende dal primo stage con input cambiati e da tutto ciò che ne dipende.
+    'force_stages' (nomi, o "all") forza la rigenerazione anche con hash invariato.
+
+    Restituisce (ok, risultati, tempi): tempi = {stage: {start_s, duration_s, status}}.
+    """
+    results = dict(initial or {})
+    _validate(stages, results)
+    unknown = set(force_stages) - {stage.name for stage in stages} - {"all"}
+    if unknown:
+        raise ValueError(f"Stage da forzare inesistenti: {sorted(unknown)}")
+    input_hashes = {}
+    pending = list(stages)
+    timings = {}
+    failed = False
+    started_at = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-stage") as executor:
+        running = {}
+        while pending or running:
+            if not failed:
+                ready = [stage for stage in pending if all(i in results for i in stage.inputs)]
+                for stage in ready:
+                    pending.remove(stage)
+                    kwargs = {i: results[i] for i in stage.inputs}
+                    if checkpoint is not None:
+                        input_hashes[stage.name] = stage_input_hash(stage, kwargs)
+                        forced = "all" in force_stages or stage.name in force_stages
+                        cached = None if forced else checkpoint.load(stage, input_hashes[stage.name])
+                        if cached:
+                            results[stage.name] = cached
+                            timings[stage.name] = {"start_s": round(time.perf_counter() - started_at, 3), "duration_s": 0.0, "status": "cached"}
+                            print(f"\n[STAGE] {stage.label}: input invariati, output dal checkpoint.")
+                            continue
+                    print(f"\n[STAGE] Avvio: {stage.label}...")
+                    # Il contesto (llm_context, telemetria) segue lo stage nel thread
+                    future = executor.submit(contextvars.copy_context().run, _run_stage, stage, kwargs, started_at)
+                    running[future] = stage
+            if not running:
+                # Stage appena serviti dal checkpoint possono aver sbloccato altri stage
+                if not failed and any(all(i in results for i in stage.inputs) for stage in pending):
+                    continue
+                # Stage rimasti con input mai prodotti (dipendenze da stage opzionali falliti)
+                for stage in pending:
+                    timings[stage.name] = {"start_s": None, "duration_s": None, "status": "skipped"}
+                    failed = failed or stage.required
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                output, error, timing = future.result()
+                if output:
+                    results[stage.name] = output
+                    timing["status"] = "ok"
+                    if checkpoint is not None:
+                        checkpoint.save(stage, input_hashes[stage.name])
+                    print(f"  - [{stage.name}] completato in {timing['duration_s']:.1f}s.")
+                else:
+                    timing["status"] = "failed"
+                    reason = f": {error}" if error else ""
+                    print(f"  - [{stage.name}] FALLITO dopo {timing['duration_s']:.1f}s{reason}")
+                    failed = failed or stage.required
+                timings[stage.name] = timing
+
+    total = round(time.perf_counter() - started_at, 3)
+    timings["_total"] = {"start_s": 0.0, "duration_s": total, "status": "failed" if failed else "ok"}
+    return not failed, results, timings
+
+
+def format_timings(timings: dict) -> str:
+    """Riepilogo testuale dei tempi, in ordine di avvio."""
+    lines = []
+    ordered = sorted(
+        ((name, t) for name, t in timings.items() if name != "_total"),
+        key=lambda item: item[1]["start_s"] if item[1]["start_s"] is not None else float("inf")
+    )
+    for name, t in ordered:
+        if t["start_s"] is None:
+            lines.append(f"  - {name:<28} {'-':>8} {'-':>8}  {t['status']}")
+        else:
+            lines.append(f"  - {name:<28} {t['start_s']:>7.1f}s {t['duration_s']:>7.1f}s  {t['status']}")
+    total = timings.get("_total")
+    if total:
+        lines.append(f"  - {'TOTALE':<28} {'':>8} {total['duration_s']:>7.1f}s  {total['status']}")
+    return "\n".join(lines)
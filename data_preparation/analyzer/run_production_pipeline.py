@@ -3,21 +3,54 @@
 import sys
 import os
 import json
+from datetime import datetime
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 from .icp_generator.icp_creator import generate_and_extract_icp
 from .case_guide_generator.guide_creator import generate_case_guide
+from .kb_summarizer import kb_processor
 from .kb_summarizer.kb_processor import summarize_knowledge_base
-from .final_generator.case_creator import generate_final_cases
-from .final_generator.criteria_creator import generate_final_criteria
-from ..corrector.evaluation_criteria_generator.criteria_generator import generate_evaluation_criteria
-
-from services.data_manager import db
-
-def run_full_generation_pipeline(position_id: str) -> bool:
+from .final_generator import case_creator
+from .final_generator.case_creator import generate_final_cases, CaseCollection
+from .final_generator.criteria_creator import generate_final_criteria, CriteriaCollection
+from ..corrector.evaluation_criteria_generator.criteria_generator import generate_evaluation_criteria, EvaluationCriteriaCollection
+from interviewer.chatbot import generate_opening_pool, OPENING_POOL_SIZE
+from .pipeline_dag import PipelineStage, run_pipeline_dag, format_timings
+
+from services.data_manager import db, position_repository
+
+# --- CHECKPOINT ---
+# Accanto a ogni output la posizione salva l'hash dei suoi input in 'pipeline_checkpoints':
+# una nuova esecuzione riusa gli output con hash invariato e rigenera solo gli stage con
+# input cambiati (es. modificando solo la KB: sintesi KB e tutto ciò che ne dipende).
+
+class PositionCheckpoint:
+    def __init__(self, position_id: str, position_document: dict):
+        self.position_id = position_id
+        self.document = position_document
+        self.checkpoints = position_document.get("pipeline_checkpoints") or {}
+
+    def load(self, stage, input_hash: str):
+        saved = self.checkpoints.get(stage.name) or {}
+        value = self.document.get(stage.name)
+        if saved.get("input_hash") != input_hash or not value:
+            return None
+        try:
+            return stage.restore(value) if stage.restore else value
+        except Exception as e:
+            print(f"  - Checkpoint di '{stage.name}' non riutilizzabile ({e}): lo stage verrà rigenerato.")
+            return None
+
+    def save(self, stage, input_hash: str):
+        checkpoint = {"input_hash": input_hash, "completed_at": datetime.now().isoformat(timespec="seconds")}
+        self.checkpoints[stage.name] = checkpoint
+        position_repository.update(self.position_id, {f"pipeline_checkpoints.{stage.name}": checkpoint})
+
+def run_full_generation_pipeline(position_id: str, force_stages=()) -> bool:
     """
     Orchestra l'intera pipeline di generazione dei dati per una nuova posizione.
+    Riprende dal primo stage con input cambiati; 'force_stages' (nomi o "all") forza la rigenerazione.
     """
     print(f"--- [PIPELINE 'PRODUCTION'] Avvio per la posizione: {position_id} ---")
 
@@ -25,8 +58,8 @@ def run_full_generation_pipeline(position_id: str) -> bool:
     print(f"\n[STEP 0/6] Recupero dati iniziali da MongoDB...")
     try:
         if db is None: raise ConnectionError("Connessione a MongoDB non disponibile.")
-        positions_collection = db["positions_data"]
-        position_document = positions_collection.find_one({"_id": position_id})
+        # Lettura diretta: la pipeline deve partire dai dati aggiornati, non dalla cache
+        position_document = position_repository.get(position_id, use_cache=False)
 
         if not position_document:
             print(f"  - ERRORE: Documento non trovato per '{position_id}'.")
@@ -45,67 +78,127 @@ def run_full_generation_pipeline(position_id: str) -> bool:
         print(f"  - ERRORE durante il recupero dei dati iniziali da MongoDB: {e}")
         return False
 
-    # --- STEP 1: GENERAZIONE ICP ---
-    print(f"\n[STEP 1/6] Generazione dell'Ideal Candidate Profile (ICP)...")
-    icp_text = generate_and_extract_icp(job_description_text=jd_text, hr_special_needs=hr_special_needs)
-    if not icp_text:
-        print("  - Fallimento nella generazione dell'ICP. Pipeline interrotta.")
-        return False
-    positions_collection.update_one({"_id": position_id}, {"$set": {"icp": icp_text}})
-    print(f"  - ICP salvato con successo per '{position_id}'.")
-
-    # --- STEP 2: GENERAZIONE GUIDA AL CASO ---
-    print(f"\n[STEP 2/6] Generazione della Guida alla Creazione dei Casi...")
-    case_guide_text = generate_case_guide(icp_text=icp_text, seniority_level=seniority_level, hr_special_needs=hr_special_needs)
-    if not case_guide_text:
-        print("  - Fallimento nella generazione della Guida. Pipeline interrotta.")
-        return False
-    positions_collection.update_one({"_id": position_id}, {"$set": {"case_guide": case_guide_text}})
-    print(f"  - Guida salvata con successo per '{position_id}'.")
-
-    # --- STEP 3: SINTESI KNOWLEDGE BASE ---
-    print(f"\n[STEP 3/6] Sintesi della Knowledge Base...")
-    kb_summary = summarize_knowledge_base(icp_text=icp_text, kb_documents=kb_docs)
-    if not kb_summary:
-        print("  - Fallimento nella sintesi della KB. Pipeline interrotta.")
-        return False
-    positions_collection.update_one({"_id": position_id}, {"$set": {"kb_summary": kb_summary}})
-    print(f"  - Sintesi KB salvata con successo per '{position_id}'.")
-
-    # --- STEP 4: GENERAZIONE DEI CASI ---
-    print(f"\n[STEP 4/6] Generazione finale dei casi strutturati...")
-    case_collection = generate_final_cases(icp_text, case_guide_text, kb_summary, seniority_level, hr_special_needs)
-    if not case_collection:
-        print("  - Fallimento nella generazione dei Casi. Pipeline interrotta.")
-        return False
-    positions_collection.update_one({"_id": position_id}, {"$set": {"all_cases": case_collection.model_dump()}})
-    print(f"  - Casi salvati con successo per '{position_id}'.")
-
-    # --- STEP 5: GENERAZIONE DEI CRITERI PER IL CHATBOT ---
-    print(f"\n[STEP 5/6] Generazione dei criteri per il chatbot...")
-    cases_json_str = case_collection.model_dump_json()
-    criteria_collection = generate_final_criteria(icp_text, cases_json_str, seniority_level, hr_special_needs)
-    if not criteria_collection:
-        print("  - Fallimento nella generazione dei Criteri. Pipeline interrotta.")
+    # --- STEP 1-6: GENERAZIONE (DAG) ---
+    # Guida al caso e sintesi KB dipendono solo dall'ICP; i due set di criteri solo dai casi:
+    # gli stage indipendenti girano in parallelo (percorso critico: 4 chiamate invece di 6).
+    stages = build_generation_stages(position_id, seniority_level, hr_special_needs)
+    print(f"\n[STEP 1-6] Esecuzione di {len(stages)} stage di generazione (dipendenze in parallelo)...")
+    try:
+        ok, _, timings = run_pipeline_dag(
+            stages, initial={"job_description": jd_text, "kb_documents": kb_docs},
+            checkpoint=PositionCheckpoint(position_id, position_document), force_stages=force_stages
+        )
+    except ValueError as e:
+        print(f"  - ERRORE di configurazione della pipeline: {e}")
         return False
-    positions_collection.update_one({"_id": position_id}, {"$set": {"all_criteria": criteria_collection.model_dump()}})
-    print(f"  - Criteri per il chatbot salvati con successo per '{position_id}'.")
-
-    # --- STEP 6: GENERAZIONE DEI CRITERI DI VALUTAZIONE FINALE ---
-    print(f"\n[STEP 6/6] Generazione dei Criteri di ValUTazione Finale...")
-    eval_criteria_collection = generate_evaluation_criteria(icp_text, cases_json_str, seniority_level, hr_special_needs)
-    if not eval_criteria_collection:
-        print("  - Fallimento nella generazione dei Criteri di Valutazione. Pipeline interrotta.")
+
+    print("\n[TEMPI] Stage della pipeline (avvio, durata, esito):")
+    print(format_timings(timings))
+    position_repository.update(position_id, {"pipeline_timings": timings})
+
+    if not ok:
+        print("\n--- [PIPELINE 'PRODUCTION'] Pipeline interrotta: uno stage obbligatorio è fallito. ---")
         return False
-    positions_collection.update_one({"_id": position_id}, {"$set": {"evaluation_criteria": eval_criteria_collection.model_dump()}})
-    print(f"  - Criteri di valutazione finale salvati con successo per '{position_id}'.")
 
     print("\n--- [PIPELINE 'PRODUCTION'] Tutti i dati per la posizione sono stati generati e salvati su MongoDB. ---")
     return True
 
+def build_generation_stages(position_id: str, seniority_level: str, hr_special_needs: str) -> list:
+    """
+    Stage della pipeline di generazione: ciascuno dichiara gli input (output di altri
+    stage o dati iniziali) e salva il proprio risultato sul documento della posizione.
+    """
+    def _save(field: str, serialize=lambda value: value):
+        def _on_success(value):
+            position_repository.update(position_id, {field: serialize(value)})
+            print(f"  - '{field}' salvato con successo per '{position_id}'.")
+        return _on_success
+
+    def _model_dump(value):
+        return value.model_dump()
+
+    # Parametri della posizione che, oltre agli input, determinano l'output degli stage
+    params = {"seniority_level": seniority_level, "hr_special_needs": hr_special_needs}
+    # Configurazione che cambia l'output di uno stage: cambiandola lo stage va rigenerato
+    kb_params = {
+        "kb_model": kb_processor.KB_MODEL,
+        "map_model": kb_processor.KB_MAP_MODEL,
+        "chunk_tokens": kb_processor.KB_CHUNK_TOKENS,
+        "reduce_max_tokens": kb_processor.KB_REDUCE_MAX_TOKENS,
+    }
+    case_params = {
+        **params,
+        "generation_mode": case_creator.CASE_GENERATION_MODE,
+        "max_tokens": case_creator.CASE_MAX_TOKENS,
+        "cases_per_position": case_creator.CASES_PER_POSITION,
+        "model": case_creator.FINAL_MODEL,
+    }
+
+    stages = [
+        PipelineStage(
+            "icp", label="Generazione dell'Ideal Candidate Profile (ICP)",
+            inputs=("job_description",),
+            func=lambda job_description: generate_and_extract_icp(job_description_text=job_description, hr_special_needs=hr_special_needs),
+            params={"hr_special_needs": hr_special_needs},
+            on_success=_save("icp"),
+        ),
+        PipelineStage(
+            "case_guide", label="Generazione della Guida alla Creazione dei Casi",
+            inputs=("icp",),
+            func=lambda icp: generate_case_guide(icp_text=icp, seniority_level=seniority_level, hr_special_needs=hr_special_needs),
+            params=params,
+            on_success=_save("case_guide"),
+        ),
+        PipelineStage(
+            "kb_summary", label="Sintesi della Knowledge Base",
+            inputs=("icp", "kb_documents"),
+            func=lambda icp, kb_documents: summarize_knowledge_base(icp_text=icp, kb_documents=kb_documents),
+            params=kb_params,
+            on_success=_save("kb_summary"),
+        ),
+        PipelineStage(
+            "all_cases", label="Generazione finale dei casi strutturati",
+            inputs=("icp", "case_guide", "kb_summary"),
+            func=lambda icp, case_guide, kb_summary: generate_final_cases(icp, case_guide, kb_summary, seniority_level, hr_special_needs),
+            on_success=_save("all_cases", _model_dump),
+            params=case_params, restore=CaseCollection.model_validate,
+        ),
+        PipelineStage(
+            "all_criteria", label="Generazione dei criteri per il chatbot",
+            inputs=("icp", "all_cases"),
+            func=lambda icp, all_cases: generate_final_criteria(icp, all_cases.model_dump_json(), seniority_level, hr_special_needs),
+            on_success=_save("all_criteria", _model_dump),
+            params=params, restore=CriteriaCollection.model_validate,
+        ),
+        PipelineStage(
+            "evaluation_criteria", label="Generazione dei Criteri di Valutazione Finale",
+            inputs=("icp", "all_cases"),
+            func=lambda icp, all_cases: generate_evaluation_criteria(icp, all_cases.model_dump_json(), seniority_level, hr_special_needs),
+            on_success=_save("evaluation_criteria", _model_dump),
+            params=params, restore=EvaluationCriteriaCollection.model_validate,
+        ),
+    ]
+
+    # --- STAGE OPZIONALE: POOL DI APERTURE DEL COLLOQUIO ---
+    # Non bloccante: senza pool l'apertura viene generata durante la preparazione della sessione
+    if OPENING_POOL_SIZE > 0:
+        stages.append(PipelineStage(
+            "interview_openings", label=f"Pre-generazione di {OPENING_POOL_SIZE} aperture del colloquio per caso",
+            inputs=("all_cases",),
+            func=lambda all_cases: generate_opening_pool(all_cases.model_dump().get("cases", []), OPENING_POOL_SIZE),
+            on_success=_save("interview_openings"),
+            params={"pool_size": OPENING_POOL_SIZE},
+            required=False,
+        ))
+    return stages
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        test_position_id = sys.argv[1]
-        run_full_generation_pipeline(test_position_id)
+    args = sys.argv[1:]
+    # --force-stage <nome> (ripetibile, o "all"): rigenera lo stage anche se gli input non sono cambiati
+    forced = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == "--force-stage"]
+    positional = [arg for i, arg in enumerate(args) if arg != "--force-stage" and (i == 0 or args[i - 1] != "--force-stage")]
+    if positional:
+        test_position_id = positional[0]
+        run_full_generation_pipeline(test_position_id, force_stages=forced)
     else:
-        print("Uso: python -m data_preparation.analyzer.run_production_pipeline \"<position_id_da_mongodb>\"")
\ No newline at end of file
+        print("Uso: python -m data_preparation.analyzer.run_production_pipeline \"<position_id_da_mongodb>\" [--force-stage <stage>|all ...]")
\ No newline at end of file
@@ -35,7 +35,8 @@ def generate_evaluation_criteria(icp_text: str, cases_json_str: str, seniority_l
         model=GENERATION_MODEL,
         system_prompt=prompts_eval_criteria.SYSTEM_PROMPT,
         tool_name="save_evaluation_criteria",
-        tool_schema=output_schema_example
+        tool_schema=output_schema_example,
+        stage="data_preparation.evaluation_criteria"
     )
 
     if not structured_response_str:
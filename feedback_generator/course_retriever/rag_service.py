@@ -4,6 +4,7 @@ import streamlit as st
 from sentence_transformers import SentenceTransformer
 # Importiamo l'oggetto 'db' dal nostro servizio dati centralizzato
 from services.data_manager import db
+from services.async_repository import sync_repositories
 
 # --- Configurazione ---
 # Il modello di embedding rimane lo stesso, locale e performante
@@ -35,12 +36,9 @@ class RAGService:
             if db is None:
                 raise ConnectionError("Connessione al database MongoDB non disponibile.")
             
-            # Seleziona la collection
-            collection = db[COURSES_COLLECTION_NAME]
             print(f"  - Recupero corsi dalla collection '{COURSES_COLLECTION_NAME}' su MongoDB...")
-            
-            # find({}) recupera tutti i documenti. list(...) li converte in una lista di dizionari Python.
-            courses = list(collection.find({}))
+            # Repository dei corsi tramite la facciata sincrona del client asincrono
+            courses = sync_repositories.courses.all()
             
             if not courses:
                 print(f"  - ATTENZIONE: Nessun corso trovato nella collection '{COURSES_COLLECTION_NAME}'.")
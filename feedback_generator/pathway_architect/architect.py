@@ -68,7 +68,8 @@ def create_final_feedback_content(
         model=ARCHITECT_MODEL,
         system_prompt=prompts_pathway.SYSTEM_PROMPT,
         tool_name="save_final_feedback_report",
-        tool_schema=FinalReportContent.model_json_schema()
+        tool_schema=FinalReportContent.model_json_schema(),
+        stage="feedback.pathway"
     )
 
     if not structured_response_str:
@@ -13,12 +13,14 @@ import base64
 from io import BytesIO
 import re
 
-def create_feedback_pdf(report_content: FinalReportContent, output_path: str, **kwargs):
+def create_feedback_pdf(report_content: FinalReportContent, output_path, **kwargs):
     """
     Crea un file PDF completo, con tutte le sezioni, i grafici Base64
-    e la formattazione corretta dei titoli.
+    e la formattazione corretta dei titoli. 'output_path' può essere un percorso
+    o un buffer in memoria (es. BytesIO).
     """
-    print(f"Creazione del file PDF completo: {output_path}...")
+    target = output_path if isinstance(output_path, str) else "buffer in memoria"
+    print(f"Creazione del file PDF completo: {target}...")
     doc = SimpleDocTemplate(output_path, rightMargin=inch, leftMargin=inch, topMargin=inch, bottomMargin=inch)
     
     # Definizione degli stili
@@ -124,6 +126,6 @@ def create_feedback_pdf(report_content: FinalReportContent, output_path: str, **
     # --- Costruzione Finale del PDF ---
     try:
         doc.build(story)
-        print(f"PDF creato con successo in '{output_path}'")
+        print(f"PDF creato con successo in '{target}'")
     except Exception as e:
         print(f"Errore durante la creazione del PDF: {e}")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, LLMServiceError
 from . import prompts_consolidator
 
 CONSOLIDATOR_MODEL = "gpt-4.1-2025-04-14"
@@ -14,16 +14,17 @@ def create_consolidated_report(cv_analysis_report: str, case_evaluation_report:
     
     print(f"2. Invio della richiesta al modello '{CONSOLIDATOR_MODEL}' per il consolidamento...")
     
-    consolidated_report = get_llm_response(
-        prompt=prompt,
-        model=CONSOLIDATOR_MODEL,
-        system_prompt=prompts_consolidator.SYSTEM_PROMPT,
-        temperature=0.2,
-        max_tokens=2000
-    )
-    
-    if "Errore" in consolidated_report:
-        print(f"Errore ricevuto dall'LLM: {consolidated_report}")
+    try:
+        consolidated_report = get_llm_response(
+            prompt=prompt,
+            model=CONSOLIDATOR_MODEL,
+            system_prompt=prompts_consolidator.SYSTEM_PROMPT,
+            temperature=0.2,
+            max_tokens=2000,
+            stage="feedback.consolidation"
+        )
+    except LLMServiceError as e:
+        print(f"Errore ricevuto dall'LLM: {e}")
         return "" # Restituisce una stringa vuota in caso di errore
 
     print("3. Report consolidato generato con successo.")
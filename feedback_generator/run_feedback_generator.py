@@ -1,19 +1,21 @@
 import os
 import sys
 import json
+from io import BytesIO
 from bson import ObjectId 
 
 # Logica per aggiungere la root al path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import dei moduli necessari (tutti DOPO l'append)
-from services.data_manager import get_session_data, save_stage_output, save_pdf_report, db
+from services.data_manager import get_session_data, save_pdf_report, db, SessionUnitOfWork
+from services.async_repository import async_repositories, run_in_background
 from .report_consolidator.consolidator import create_consolidated_report
 from .gap_analyzer.gap_identifier import identify_skill_gaps
 from .course_retriever.prompts_retriever import create_query_refinement_prompt
 from .pathway_architect.architect import create_final_feedback_content
 from .pathway_architect.pdf_service import create_feedback_pdf
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, LLMServiceError
 
 # IMPORTA QUI (DOPO il sys.path.append)
 from .market_integration import run_market_benchmark_from_text
@@ -25,9 +27,17 @@ class MongoJSONEncoder(json.JSONEncoder):
         return super().default(o)
 
 def run_feedback_pipeline(session_id: str) -> str | None:
+    """Genera il report di feedback e restituisce l'id del PDF nello store dei report."""
+    # Gli stage prodotti dal feedback vengono salvati insieme, con un solo update a fine pipeline
+    with SessionUnitOfWork(session_id) as uow:
+        return _run_feedback_pipeline(session_id, uow)
+
+def _run_feedback_pipeline(session_id: str, uow: SessionUnitOfWork) -> str | None:
     print(f"--- [PIPELINE] Avvio Generazione Feedback per sessione: {session_id} ---")
     
-    session_data = get_session_data(session_id)
+    session_data = get_session_data(
+        session_id, stages=("consolidated_report", "cv_analysis_report", "case_evaluation_report", "uploaded_cv_text")
+    )
     if not session_data:
         print(f"Errore: Dati di sessione non trovati per l'ID: {session_id}")
         return None
@@ -35,6 +45,12 @@ def run_feedback_pipeline(session_id: str) -> str | None:
     candidate_name = session_data.get("candidate_name", "Candidato")
     target_role = session_data.get("position_id", "Ruolo non specificato")
     stages_data = session_data.get("stages", {})
+
+    # La JD serve solo al benchmark (step 4A): la lettura parte subito sul client asincrono
+    # e si sovrappone alle chiamate LLM di consolidamento e gap analysis
+    position_prefetch = None
+    if db is not None:
+        position_prefetch = run_in_background(async_repositories.positions.get(target_role, ("job_description", "position_name")))
     
     # STEP 1: Consolidamento. Rimane NECESSARIO per l'analisi dei gap, che ha bisogno di una visione unificata.
     consolidated_report = stages_data.get("consolidated_report")
@@ -48,7 +64,7 @@ def run_feedback_pipeline(session_id: str) -> str | None:
             return None
         consolidated_report = create_consolidated_report(original_cv_report, case_eval_report)
         if not consolidated_report: return None
-        save_stage_output(session_id, "consolidated_report", consolidated_report)
+        uow.save_stage_output("consolidated_report", consolidated_report)
     else:
         print("\n[STEP 1/5] Report consolidato già presente.")
 
@@ -56,7 +72,7 @@ def run_feedback_pipeline(session_id: str) -> str | None:
     print("\n[STEP 2/5] Identificazione gap...")
     gap_analysis = identify_skill_gaps(consolidated_report)
     if not gap_analysis: return None
-    save_stage_output(session_id, "gap_analysis", gap_analysis.model_dump())
+    uow.save_stage_output("gap_analysis", gap_analysis.model_dump())
 
     # STEP 3: Recupero Corsi. Invariato.
     print("\n[STEP 3/5] Recupero corsi...")
@@ -66,7 +82,12 @@ def run_feedback_pipeline(session_id: str) -> str | None:
     enriched_skill_families = []
     for family in gap_analysis.skill_families:
         family_name, gap_names = family.skill_family_gap, [g.skill_gap for g in family.skill_gaps]
-        query = get_llm_response(create_query_refinement_prompt(family_name, gap_names), "gpt-4o-mini", "Sei un esperto di formazione.", temperature=0.1)
+        try:
+            query = get_llm_response(create_query_refinement_prompt(family_name, gap_names), "gpt-4o-mini", "Sei un esperto di formazione.", temperature=0.1, use_cache=True, stage="feedback.query_refinement")
+        except LLMServiceError as e:
+            # Senza raffinamento la ricerca usa direttamente famiglia e gap
+            print(f"Avviso: raffinamento query fallito ({e}), uso la query grezza.")
+            query = f"{family_name}: {', '.join(gap_names)}"
         
         retrieved_courses = rag_service.search(query, k=8)
 
@@ -79,7 +100,7 @@ def run_feedback_pipeline(session_id: str) -> str | None:
         ensure_ascii=False,
         cls=MongoJSONEncoder
     )
-    save_stage_output(session_id, "gaps_with_courses", json.loads(enriched_gaps_content_str))
+    uow.save_stage_output("gaps_with_courses", json.loads(enriched_gaps_content_str))
 
     # --- STEP 4A: Benchmark di mercato (recruitment suite, no-file) ---
     print("\n[STEP 4A] Benchmark di mercato (recruitment suite, no-file)...")
@@ -97,8 +118,7 @@ def run_feedback_pipeline(session_id: str) -> str | None:
     try:
         if db is None:
             raise ConnectionError("Connessione a MongoDB non disponibile.")
-        positions_collection = db["positions_data"]
-        pos_doc = positions_collection.find_one({"_id": target_role}, {"job_description": 1, "position_name": 1})
+        pos_doc = position_prefetch.result() if position_prefetch else None
         if pos_doc:
             jd_text = pos_doc.get("job_description", "") or ""
             role_title = pos_doc.get("position_name", role_title) or role_title
@@ -115,11 +135,11 @@ def run_feedback_pipeline(session_id: str) -> str | None:
         )
         # Salva i risultati nella sessione per persistenza e debug
         if qualitative_text:
-            save_stage_output(session_id, "market_benchmark_text", qualitative_text)
+            uow.save_stage_output("market_benchmark_text", qualitative_text)
         if chart_cat_b64:
-            save_stage_output(session_id, "market_chart_categories_base64", chart_cat_b64)
+            uow.save_stage_output("market_chart_categories_base64", chart_cat_b64)
         if market_skills_list:
-            save_stage_output(session_id, "market_chart_skills_base64", market_skills_list)
+            uow.save_stage_output("market_chart_skills_base64", market_skills_list)
     else:
         print("Avviso: JD o testo CV non disponibili; benchmark di mercato saltato.")
 
@@ -149,24 +169,23 @@ def run_feedback_pipeline(session_id: str) -> str | None:
     
     # STEP 5: Generazione PDF. La chiamata è la stessa, ma il contenuto è diverso.
     print("\n[STEP 5/5] Generazione del file PDF...")
-    temp_dir = "temp_pdf"
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_pdf_path = os.path.join(temp_dir, f"{session_id}.pdf")
+    # Il PDF viene generato in memoria e salvato direttamente nello store dei report
+    pdf_buffer = BytesIO()
     create_feedback_pdf(
         report_content=final_report_content,
-        output_path=temp_pdf_path,
+        output_path=pdf_buffer,
         # Passiamo i dati che la funzione si aspetta ora:
         market_benchmark_text=qualitative_text,
         market_chart_categories_base64=chart_cat_b64,
         market_skills_list=market_skills_list 
     )
     
-    pdf_path = ""
-    if os.path.exists(temp_pdf_path):
-        with open(temp_pdf_path, "rb") as f:
-            pdf_bytes = f.read()
-        pdf_path = save_pdf_report(pdf_bytes, session_id)
-        os.remove(temp_pdf_path)
+    report_id = ""
+    pdf_bytes = pdf_buffer.getvalue()
+    if pdf_bytes:
+        report_id = save_pdf_report(pdf_bytes, session_id)
+        if report_id:
+            uow.save_stage_output("feedback_report_id", report_id)
         
     print("--- [PIPELINE] Generazione Feedback completata. ---")
-    return pdf_path
\ No newline at end of file
+    return report_id
\ No newline at end of file
@@ -5,6 +5,7 @@ import pandas as pd
 import numpy as np
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from services.mongo_indexes import ensure_indexes
 
 load_dotenv()
 
@@ -76,6 +77,8 @@ def import_embeddings_npz_chunked(file_name, collection_name, client):
         
         print("Pulizia collezione embeddings esistente...")
         collection.delete_many({})
+        # Indice (embedding_id, chunk_index): il caricamento a chunk del normalizer non fa COLLSCAN
+        ensure_indexes(db, [collection_name])
 
         with np.load(file_path) as npz_data:
             for key in npz_data.files:
@@ -1,10 +1,22 @@
 # interviewer/chatbot.py
 
-from .llm_service import get_llm_response
+from typing import Iterator, Literal, Optional
+from pydantic import BaseModel, Field, ValidationError
+from .llm_service import get_llm_response, aget_llm_response, get_structured_llm_response, stream_llm_response, run_async, LLMServiceError
 from . import prompts
-import json
+from .question_classifier import get_question_classifier
+from .conversation_memory import ConversationMemory
+from .transcript import TranscriptWriter, conversation_messages
 import os
-from datetime import datetime
+import time
+import asyncio
+
+
+class TurnDecision(BaseModel):
+    input_type: Literal["question", "answer"] = Field(description="'question' se il candidato chiede informazioni sul caso, altrimenti 'answer'.")
+    step_accomplished: bool = Field(description="True se lo step corrente può considerarsi concluso (solo per input_type 'answer').")
+    next_step_id: Optional[int] = Field(description="ID dello step da affrontare dopo quello corrente, null se non ce ne sono altri.")
+
 
 class SmartCaseStudyChatbot:
     MAX_ATTEMPTS = 5
@@ -14,154 +26,564 @@ class SmartCaseStudyChatbot:
     INTERVIEWER_MODEL = "gpt-4.1-2025-04-14"
     CLASSIFICATION_MODEL = "gpt-4o-mini" 
 
-    def __init__(self, steps: dict, case_title: str, case_text: str, case_id: str):
+    # Turn planner: una sola chiamata strutturata per classificazione, valutazione e scelta
+    # dello step successivo. Con INTERVIEW_TURN_PLANNER=0 si torna alle chiamate separate.
+    USE_TURN_PLANNER = os.getenv("INTERVIEW_TURN_PLANNER", "1") == "1"
+
+    # Esecuzione speculativa del percorso a chiamate separate:
+    #   "off"      -> classificazione, poi valutazione (sequenziale)
+    #   "evaluate" -> classificazione e valutazione dello step in parallelo
+    #   "full"     -> in più pre-genera la risposta all'eventuale domanda del candidato
+    # Il ramo escluso dal classificatore viene annullato: più token, meno latenza per turno.
+    SPECULATION_MODE = os.getenv("INTERVIEW_SPECULATION", "off")
+
+    # Memoria della conversazione: ultimi messaggi testuali + riassunto degli step conclusi,
+    # con budget di token fisso per i prompt che usano la cronologia completa.
+    # Con INTERVIEW_MEMORY=0 si torna alla cronologia integrale.
+    USE_CONVERSATION_MEMORY = os.getenv("INTERVIEW_MEMORY", "1") == "1"
+
+    def __init__(self, steps: dict, case_title: str, case_text: str, case_id: str,
+                 use_turn_planner: bool | None = None, speculation_mode: str | None = None,
+                 use_memory: bool | None = None, session_id: str | None = None):
         self.steps = steps
         self.case_title = case_title
         self.case_text = case_text
         self.case_id = case_id
+        self.session_id = session_id
+        # Trascrizione append-only: un record per turno, scritto appena il turno si chiude
+        self.transcript = TranscriptWriter(case_id, session_id)
         self.questions_asked_count = 0
         self.current_step_id = None
         self.completed_step_ids = set()
         self.attempts_on_current_step = 0
         self.conversation_history = []
         self.is_finished = False
+        self.use_turn_planner = self.USE_TURN_PLANNER if use_turn_planner is None else use_turn_planner
+        self.speculation_mode = speculation_mode or self.SPECULATION_MODE
+        use_memory = self.USE_CONVERSATION_MEMORY if use_memory is None else use_memory
+        self.memory = ConversationMemory() if use_memory else None
+        self.speculation_metrics = {
+            "turns": 0,                # turni eseguiti in modalità speculativa
+            "branches_started": 0,     # rami avviati prima di conoscere la classificazione
+            "branches_cancelled": 0,   # rami annullati mentre erano in volo
+            "branches_discarded": 0,   # rami completati ma scartati (token spesi inutilmente)
+            "latency_saved_s": 0.0,    # stima: durata sequenziale - durata effettiva
+        }
+        # Stato completo già scritto nel documento di sessione (poi solo aggiornamenti per turno)
+        self.state_persisted = False
+        # Apertura già pronta (pool del caso o generata durante la preparazione della sessione)
+        self.prepared_opening = None
 
-    def _save_conversation_history(self):
-        output_dir = "output"
-        os.makedirs(output_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{self.case_id}_{timestamp}.json"
-        filepath = os.path.join(output_dir, filename)
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.conversation_history, f, ensure_ascii=False, indent=2)
-            print(f"\n[INFO] Conversazione salvata in: {filepath}")
-        except Exception as e:
-            print(f"\n[ERRORE] Impossibile salvare la conversazione: {e}")
+    # --- STATO SERIALIZZABILE ---
+    # Schema compatto e JSON/BSON-compatibile: il caso viene scritto una sola volta, a ogni turno
+    # si sovrascrivono contatori, memoria e trascrizione ($set). I messaggi non fanno parte dello
+    # stato: sono già nel blob 'conversation' (TranscriptWriter) e da lì vengono ricaricati.
+    STATE_VERSION = 1
 
-    def start_interview(self) -> str:
-        self.current_step_id = 0
-        step_zero_info = self.steps[self.current_step_id]
-        skills_str = ", ".join([s.get('skill_name', '') for s in step_zero_info.get('skills_to_test', []) if s.get('skill_name')])
+    def _counters_state(self) -> dict:
+        return {
+            "current_step_id": self.current_step_id,
+            "completed_step_ids": sorted(self.completed_step_ids),
+            "attempts_on_current_step": self.attempts_on_current_step,
+            "questions_asked_count": self.questions_asked_count,
+            "is_finished": self.is_finished,
+        }
+
+    def to_state(self) -> dict:
+        return {
+            "version": self.STATE_VERSION,
+            "case": {
+                "case_id": self.case_id,
+                "case_title": self.case_title,
+                "case_text": self.case_text,
+                # Le chiavi dei documenti Mongo devono essere stringhe: gli step si salvano come lista
+                "steps": list(self.steps.values()),
+            },
+            "config": {
+                "use_turn_planner": self.use_turn_planner,
+                "speculation_mode": self.speculation_mode,
+                "use_memory": self.memory is not None,
+            },
+            "transcript": self.transcript.to_state(),
+            "counters": self._counters_state(),
+            "memory": self.memory.to_state() if self.memory else None,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, conversation: list | None = None) -> "SmartCaseStudyChatbot":
+        """
+        Ricostruisce il chatbot dallo stato salvato e dalla conversazione (righe del blob
+        'conversation', con i metadati dei turni). Le righe rimaste in sospeso nella
+        trascrizione vengono accodate; i vecchi stati con 'messages' restano leggibili.
+        """
+        if state.get("version") != cls.STATE_VERSION:
+            raise ValueError(f"Versione dello stato del colloquio non supportata: {state.get('version')}")
+        case, config, counters = state["case"], state.get("config", {}), state["counters"]
+        chatbot = cls(
+            steps={step["id"]: step for step in case["steps"]},
+            case_title=case["case_title"],
+            case_text=case["case_text"],
+            case_id=case["case_id"],
+            use_turn_planner=config.get("use_turn_planner"),
+            speculation_mode=config.get("speculation_mode"),
+            use_memory=config.get("use_memory"),
+        )
+        if state.get("transcript"):
+            chatbot.transcript = TranscriptWriter.from_state(chatbot.case_id, state["transcript"])
+            chatbot.session_id = chatbot.transcript.session_id
+        chatbot.current_step_id = counters["current_step_id"]
+        chatbot.completed_step_ids = set(counters["completed_step_ids"])
+        chatbot.attempts_on_current_step = counters["attempts_on_current_step"]
+        chatbot.questions_asked_count = counters["questions_asked_count"]
+        chatbot.is_finished = counters["is_finished"]
+        if conversation is None:
+            conversation = state.get("messages", [])
+        else:
+            conversation = list(conversation) + chatbot.transcript.pending_mongo
+        chatbot.conversation_history = conversation_messages(conversation)
+        if chatbot.memory and state.get("memory"):
+            chatbot.memory = ConversationMemory.from_state(state["memory"], chatbot.conversation_history)
+        chatbot.state_persisted = True
+        return chatbot
+
+    def pending_state_update(self) -> dict:
+        """Delta da salvare dopo un turno: contatori, memoria e trascrizione (da sovrascrivere)."""
+        return {
+            "counters": self._counters_state(),
+            "memory": self.memory.to_state() if self.memory else None,
+            "transcript": self.transcript.to_state(),
+        }
+
+    def mark_state_persisted(self):
+        self.state_persisted = True
+
+    def _on_interview_finished(self):
+        # I turni sono già stati scritti uno alla volta: qui non serve alcun salvataggio finale
+        if self.transcript.path:
+            print(f"\n[INFO] Trascrizione del colloquio in: {self.transcript.path}")
+        if self.speculation_metrics["turns"]:
+            print(f"[INFO] Esecuzione speculativa ({self.speculation_mode}): {self.get_speculation_metrics()}")
+
+    @classmethod
+    def opening_request(cls, case_title: str, case_text: str, step_zero: dict) -> dict:
+        """Richiesta per il messaggio di apertura: dipende solo dal caso, non dal candidato."""
+        skills_str = ", ".join([s.get('skill_name', '') for s in step_zero.get('skills_to_test', []) if s.get('skill_name')])
         prompt = prompts.create_start_prompt(
-            self.case_title,
-            self.case_text,
-            step_zero_info.get('description', 'N/D'),
+            case_title,
+            case_text,
+            step_zero.get('description', 'N/D'),
             skills_str
         )
-        initial_message = get_llm_response(
+        return dict(
             prompt=prompt, 
-            model=self.INTERVIEWER_MODEL, 
+            model=cls.INTERVIEWER_MODEL, 
             system_prompt=prompts.SYSTEM_PROMPT,
-            temperature=0.7
+            temperature=0.7,
+            stage="interview.start"
         )
+
+    def generate_opening(self) -> str:
+        """Genera l'apertura senza avviare il colloquio (es. in parallelo all'analisi del CV)."""
+        return get_llm_response(**self.opening_request(self.case_title, self.case_text, self.steps[0]))
+
+    def start_interview(self) -> str:
+        started = time.perf_counter()
+        # Con un'apertura già pronta (pre-generata o dal pool del caso) non serve alcuna chiamata
+        initial_message = self.prepared_opening or self.generate_opening()
+        self.current_step_id = 0
+        self._open_memory_step(self.current_step_id)
         self.conversation_history.append({"role": "assistant", "content": initial_message})
+        self.transcript.record_turn(self.conversation_history[-1:], time.perf_counter() - started, self.current_step_id)
         return initial_message
 
-    def _is_user_input_a_question(self, user_input: str) -> bool:
-        prompt = prompts.create_input_classification_prompt(user_input)
-        response = get_llm_response(
-            prompt=prompt,
+    def _classification_request(self, user_input: str) -> dict:
+        return dict(
+            prompt=prompts.create_input_classification_prompt(user_input),
             model=self.CLASSIFICATION_MODEL, 
-            system_prompt="Sei un classificatore di testo estremamente preciso e letterale. Il tuo unico scopo è restituire una delle due opzioni fornite.",
+            system_prompt=prompts.CLASSIFICATION_SYSTEM_PROMPT,
             temperature=0.0,
-            max_tokens=10
+            max_tokens=10,
+            use_cache=True,
+            stage="interview.classify"
         )
+
+    def _classify_locally(self, user_input: str) -> bool | None:
+        """Classificazione locale (embedding); None se non disponibile o poco confidente."""
+        classifier = get_question_classifier()
+        if classifier is None:
+            return None
+        try:
+            return classifier.predict(user_input)
+        except Exception as e:
+            print(f"[QUESTION CLASSIFIER] Errore nella classificazione locale, uso l'LLM: {e}")
+            return None
+
+    def _is_user_input_a_question(self, user_input: str) -> bool:
+        response = get_llm_response(**self._classification_request(user_input))
         return "DOMANDA_SUL_CASO" in response.upper()
 
-    def _answer_candidate_question(self, user_question: str) -> str:
-        self.questions_asked_count += 1
-        remaining_q = self.MAX_QUESTIONS - self.questions_asked_count
+    # --- PIANI DI RISPOSTA ---
+    # Ogni ramo del turno aggiorna lo stato e restituisce un "piano": un testo statico
+    # ({"text": ...}) oppure il prompt da inviare all'intervistatore ({"prompt": ...}).
+    # Il piano viene poi eseguito in modo bloccante o in streaming.
+
+    @staticmethod
+    def _static_reply(text: str) -> dict:
+        return {"text": text}
+
+    @staticmethod
+    def _llm_reply(prompt: str, suffix: str = "", **llm_kwargs) -> dict:
+        return {"prompt": prompt, "suffix": suffix, "llm_kwargs": llm_kwargs}
+
+    def _render_reply(self, plan: dict) -> str:
+        if "text" in plan:
+            return plan["text"]
+        response = get_llm_response(
+            prompt=plan["prompt"],
+            model=self.INTERVIEWER_MODEL,
+            system_prompt=prompts.SYSTEM_PROMPT,
+            stage="interview.reply",
+            **plan["llm_kwargs"]
+        )
+        return response + plan["suffix"]
+
+    def _stream_reply(self, plan: dict) -> Iterator[str]:
+        if "text" in plan:
+            yield plan["text"]
+            return
+        yield from stream_llm_response(
+            prompt=plan["prompt"],
+            model=self.INTERVIEWER_MODEL,
+            system_prompt=prompts.SYSTEM_PROMPT,
+            stage="interview.reply",
+            **plan["llm_kwargs"]
+        )
+        if plan["suffix"]:
+            yield plan["suffix"]
+
+    def _answer_prompt(self, user_question: str) -> str:
         current_step_info = self.steps[self.current_step_id]
-        answer_prompt = prompts.create_answer_to_candidate_question_prompt(
+        return prompts.create_answer_to_candidate_question_prompt(
             case_text=self.case_text,
             current_step_description=current_step_info.get('description', ''),
             user_question=user_question
         )
-        answer = get_llm_response(
-            prompt=answer_prompt,
-            model=self.INTERVIEWER_MODEL,
-            system_prompt=prompts.SYSTEM_PROMPT
-        )
-        answer += f"\n\n*(Hai ancora {remaining_q} domande a disposizione.)*"
-        return answer
+
+    def _answer_candidate_question(self, user_question: str, prepared_answer: str | None = None) -> dict:
+        self.questions_asked_count += 1
+        remaining_q = self.MAX_QUESTIONS - self.questions_asked_count
+        suffix = f"\n\n*(Hai ancora {remaining_q} domande a disposizione.)*"
+        # Risposta già generata in modo speculativo: nessuna ulteriore chiamata
+        if prepared_answer is not None:
+            return self._static_reply(prepared_answer + suffix)
+        return self._llm_reply(self._answer_prompt(user_question), suffix=suffix)
+
+    # Messaggio mostrato al candidato se il servizio LLM non risponde nemmeno dopo i retry
+    SERVICE_UNAVAILABLE_MESSAGE = "Al momento non riesco a elaborare la tua risposta per un problema temporaneo. Per favore, invia di nuovo il messaggio tra qualche istante."
+
+    def _snapshot_state(self) -> dict:
+        return {
+            "questions_asked_count": self.questions_asked_count,
+            "current_step_id": self.current_step_id,
+            "completed_step_ids": set(self.completed_step_ids),
+            "attempts_on_current_step": self.attempts_on_current_step,
+            "history_len": len(self.conversation_history),
+            "is_finished": self.is_finished,
+            "memory": self.memory.snapshot() if self.memory else None,
+        }
+
+    def _restore_state(self, snapshot: dict):
+        self.questions_asked_count = snapshot["questions_asked_count"]
+        self.current_step_id = snapshot["current_step_id"]
+        self.completed_step_ids = snapshot["completed_step_ids"]
+        self.attempts_on_current_step = snapshot["attempts_on_current_step"]
+        del self.conversation_history[snapshot["history_len"]:]
+        self.is_finished = snapshot["is_finished"]
+        if self.memory:
+            self.memory.restore(snapshot["memory"])
 
     def process_user_response(self, user_input: str) -> str:
         if self.is_finished:
             return "Il colloquio è terminato. Grazie per la tua partecipazione! Riceverai l'esito appena avremo valutato il tuo esercizio"
+        # Se una chiamata LLM fallisce il turno viene annullato: il candidato può reinviare il messaggio
+        snapshot = self._snapshot_state()
+        started = time.perf_counter()
+        try:
+            response = self._process_turn(user_input)
+        except LLMServiceError as e:
+            print(f"[ERRORE] Turno non elaborato: {e}")
+            self._restore_state(snapshot)
+            return self.SERVICE_UNAVAILABLE_MESSAGE
+        except BaseException:
+            # Qualsiasi altro errore: lo stato non deve restare a metà turno
+            self._restore_state(snapshot)
+            raise
+        self._record_turn(snapshot, started)
+        return response
+
+    def process_user_response_stream(self, user_input: str) -> Iterator[str]:
+        """
+        Come process_user_response, ma restituisce la risposta un frammento alla volta
+        (guida, transizioni e risposte alle domande arrivano in streaming dal modello).
+        La cronologia viene aggiornata quando lo stream è stato consumato per intero: se lo
+        stream viene abbandonato (rerun/stop di Streamlit) il turno viene annullato.
+        """
+        if self.is_finished:
+            yield "Il colloquio è terminato. Grazie per la tua partecipazione! Riceverai l'esito appena avremo valutato il tuo esercizio"
+            return
+        snapshot = self._snapshot_state()
+        started = time.perf_counter()
+        chunks = []
+        try:
+            plan = self._plan_turn(user_input)
+            for chunk in self._stream_reply(plan):
+                chunks.append(chunk)
+                yield chunk
+        except LLMServiceError as e:
+            print(f"[ERRORE] Turno non elaborato: {e}")
+            self._restore_state(snapshot)
+            yield ("\n\n" if chunks else "") + self.SERVICE_UNAVAILABLE_MESSAGE
+            return
+        except BaseException:
+            # GeneratorExit (stream chiuso a metà) o errore imprevisto: _plan_turn ha già
+            # aggiunto il messaggio utente e avanzato lo step, va tutto annullato
+            self._restore_state(snapshot)
+            raise
+        self.conversation_history.append({"role": "assistant", "content": "".join(chunks).strip()})
+        self._record_turn(snapshot, started)
+
+    def _record_turn(self, snapshot: dict, started: float):
+        # Solo i turni conclusi finiscono nella trascrizione: quelli annullati non lasciano traccia
+        self.transcript.record_turn(
+            self.conversation_history[snapshot["history_len"]:],
+            time.perf_counter() - started,
+            snapshot["current_step_id"]
+        )
+
+    def _process_turn(self, user_input: str) -> str:
+        response = self._render_reply(self._plan_turn(user_input))
+        self.conversation_history.append({"role": "assistant", "content": response})
+        return response
+
+    def _plan_turn(self, user_input: str) -> dict:
         self.conversation_history.append({"role": "user", "content": user_input})
-        if self._is_user_input_a_question(user_input):
+        # Il classificatore locale evita la chiamata di classificazione quando è sicuro;
+        # una domanda riconosciuta in locale non richiede nemmeno il planner
+        local_is_question = self._classify_locally(user_input)
+        # Se il planner non restituisce una decisione valida si usano le chiamate separate
+        decision = self._decide_turn(user_input) if self.use_turn_planner and local_is_question is not True else None
+        speculation = None
+        if decision is None and local_is_question is None and self.speculation_mode in ("evaluate", "full"):
+            speculation = run_async(self._speculate_turn(user_input))
+        if local_is_question is not None:
+            is_question = local_is_question
+        elif decision:
+            is_question = decision.input_type == "question"
+        elif speculation:
+            is_question = speculation["is_question"]
+        else:
+            is_question = self._is_user_input_a_question(user_input)
+        if is_question:
             if self.questions_asked_count < self.MAX_QUESTIONS:
-                response = self._answer_candidate_question(user_input)
-            else:
-                response = "Hai esaurito le domande a tua disposizione. Per favore, procedi ora con la tua analisi."
+                return self._answer_candidate_question(user_input, (speculation or {}).get("answer"))
+            return self._static_reply("Hai esaurito le domande a tua disposizione. Per favore, procedi ora con la tua analisi.")
+        self.attempts_on_current_step += 1
+        if decision:
+            is_step_accomplished = decision.step_accomplished
+        elif speculation:
+            is_step_accomplished = speculation["step_accomplished"]
         else:
-            self.attempts_on_current_step += 1
             is_step_accomplished = self._evaluate_step_completion()
-            if is_step_accomplished:
-                self.completed_step_ids.add(self.current_step_id)
-                response = self._transition_to_next_step()
+        planned_next_step_id = decision.next_step_id if decision else None
+        if is_step_accomplished:
+            self._complete_current_step()
+            return self._transition_to_next_step(planned_next_step_id)
+        if self.attempts_on_current_step >= self.MAX_ATTEMPTS:
+            self._complete_current_step()
+            return self._conclude_step_and_transition(planned_next_step_id)
+        return self._provide_guidance()
+
+    def _open_memory_step(self, step_id: int):
+        if self.memory:
+            self.memory.start_step(step_id, self.steps[step_id].get('title', ''), len(self.conversation_history))
+
+    def _complete_current_step(self):
+        self.completed_step_ids.add(self.current_step_id)
+        # Il riassunto dello step parte subito in background, senza bloccare il turno
+        if self.memory:
+            self.memory.close_step(self.conversation_history)
+
+    def _history_text(self) -> str:
+        if self.memory:
+            return self.memory.build_history_text(self.conversation_history)
+        return "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history])
+
+    def _step_full_context(self, step: dict) -> str:
+        return f"Titolo: {step.get('title', 'N/D')}\nDescrizione: {step.get('description', 'N/D')}"
+
+    @staticmethod
+    def _step_skills(step: dict) -> str:
+        return ", ".join([s.get('skill_name', '') for s in step.get('skills_to_test', []) if s.get('skill_name')])
+
+    def _step_options_text(self, available_steps: list) -> str:
+        return "\n".join([f"ID: {s['id']}, Titolo: {s['title']}, Skill: {self._step_skills(s) or 'N/D'}" for s in available_steps])
+
+    def _decide_turn(self, user_input: str) -> TurnDecision | None:
+        """
+        Una sola chiamata strutturata al posto di classificazione, valutazione dello step e
+        selezione dello step successivo. Restituisce None se la risposta non è utilizzabile.
+        """
+        current_step = self.steps[self.current_step_id]
+        history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history[-8:]])
+        available_steps = [step for id, step in self.steps.items() if id not in self.completed_step_ids and id != self.current_step_id]
+        prompt = prompts.create_turn_planner_prompt(
+            user_input=user_input,
+            step_context=self._step_full_context(current_step),
+            criteria=current_step.get('criteria', 'Nessun criterio specifico fornito.'),
+            skills_to_test=self._step_skills(current_step),
+            recent_history_text=history_text,
+            options_text=self._step_options_text(available_steps)
+        )
+        tool_args = get_structured_llm_response(
+            prompt=prompt,
+            model=self.INTERVIEWER_MODEL,
+            system_prompt=prompts.SYSTEM_PROMPT,
+            tool_name="plan_interview_turn",
+            tool_schema=TurnDecision.model_json_schema(),
+            temperature=0.1,
+            max_tokens=60,
+            stage="interview.plan"
+        )
+        if not tool_args:
+            return None
+        try:
+            return TurnDecision.model_validate_json(tool_args)
+        except ValidationError as e:
+            print(f"[TURN PLANNER] Decisione non valida, uso le chiamate separate: {e}")
+            return None
+
+    async def _speculate_turn(self, user_input: str) -> dict:
+        """
+        Avvia insieme classificazione e valutazione dello step (e, in modalità "full", la risposta
+        alla domanda); appena il classificatore risponde annulla il ramo escluso.
+        Non modifica lo stato del colloquio: le decisioni vengono applicate da _plan_turn.
+        """
+        durations = {}
+
+        async def _timed(name: str, coro):
+            started = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                durations[name] = time.perf_counter() - started
+
+        turn_started = time.perf_counter()
+        classify = asyncio.create_task(_timed("classify", aget_llm_response(**self._classification_request(user_input))))
+        branches = {"evaluate": asyncio.create_task(_timed("evaluate", aget_llm_response(**self._evaluation_request())))}
+        if self.speculation_mode == "full" and self.questions_asked_count < self.MAX_QUESTIONS:
+            branches["answer"] = asyncio.create_task(_timed("answer", aget_llm_response(
+                prompt=self._answer_prompt(user_input),
+                model=self.INTERVIEWER_MODEL,
+                system_prompt=prompts.SYSTEM_PROMPT,
+                stage="interview.reply"
+            )))
+        self.speculation_metrics["turns"] += 1
+        self.speculation_metrics["branches_started"] += len(branches)
+
+        try:
+            is_question = "DOMANDA_SUL_CASO" in (await classify).upper()
+        except BaseException:
+            for task in branches.values():
+                task.cancel()
+            await asyncio.gather(*branches.values(), return_exceptions=True)
+            raise
+
+        kept_name = "answer" if is_question else "evaluate"
+        for name, task in branches.items():
+            if name == kept_name:
+                continue
+            if task.done():
+                self.speculation_metrics["branches_discarded"] += 1
             else:
-                if self.attempts_on_current_step >= self.MAX_ATTEMPTS:
-                    self.completed_step_ids.add(self.current_step_id)
-                    response = self._conclude_step_and_transition()
-                else:
-                    response = self._provide_guidance()
-        self.conversation_history.append({"role": "assistant", "content": response})
-        return response
+                task.cancel()
+                self.speculation_metrics["branches_cancelled"] += 1
+        kept = branches.get(kept_name)
+        try:
+            kept_result = await kept if kept else None
+        finally:
+            await asyncio.gather(*(t for n, t in branches.items() if n != kept_name), return_exceptions=True)
 
-    def _evaluate_step_completion(self) -> bool:
+        if kept:
+            sequential = durations["classify"] + durations[kept_name]
+            self.speculation_metrics["latency_saved_s"] += max(sequential - (time.perf_counter() - turn_started), 0.0)
+        return {
+            "is_question": is_question,
+            "step_accomplished": None if is_question else "TRUE" in kept_result.upper(),
+            "answer": kept_result if is_question else None,
+        }
+
+    def get_speculation_metrics(self) -> dict:
+        metrics = dict(self.speculation_metrics)
+        metrics["latency_saved_s"] = round(metrics["latency_saved_s"], 3)
+        return metrics
+
+    def _evaluation_request(self) -> dict:
         current_step = self.steps[self.current_step_id]
         history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history[-8:]])
 
         # Contesto + Criterio + Skill da verificare
-        step_full_context = f"Titolo: {current_step.get('title', 'N/D')}\nDescrizione: {current_step.get('description', 'N/D')}"
-        skills_str = ", ".join([s.get('skill_name', '') for s in current_step.get('skills_to_test', []) if s.get('skill_name')])
-
         prompt = prompts.create_evaluation_prompt(
-            step_context=step_full_context,
+            step_context=self._step_full_context(current_step),
             criteria=current_step.get('criteria', 'Nessun criterio specifico fornito.'),
-            skills_to_test=skills_str,
+            skills_to_test=self._step_skills(current_step),
             history_text=history_text
         )
-
-        evaluation = get_llm_response(
+        return dict(
             prompt=prompt, 
             model=self.INTERVIEWER_MODEL,
             system_prompt=prompts.SYSTEM_PROMPT,
             temperature=0.2, 
-            max_tokens=10
+            max_tokens=10,
+            stage="interview.evaluate"
         )
+
+    def _evaluate_step_completion(self) -> bool:
+        evaluation = get_llm_response(**self._evaluation_request())
         return "TRUE" in evaluation.upper()
 
     def _select_next_step(self) -> int | None:
         available_steps = [step for id, step in self.steps.items() if id not in self.completed_step_ids]
         if not available_steps: 
             return None
-        history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history])
+        history_text = self._history_text()
         # Includi anche le skill per ogni step tra le opzioni
-        def _skills(step):
-            return ", ".join([s.get('skill_name', '') for s in step.get('skills_to_test', []) if s.get('skill_name')]) or "N/D"
-        options_text = "\n".join([f"ID: {s['id']}, Titolo: {s['title']}, Skill: {_skills(s)}" for s in available_steps])
+        options_text = self._step_options_text(available_steps)
         prompt = prompts.create_next_step_selection_prompt(options_text, history_text)
         try:
             next_id_str = get_llm_response(
                 prompt=prompt, model=self.INTERVIEWER_MODEL,
                 system_prompt="Sei un assistente logico.",
-                temperature=0.1, max_tokens=5
+                temperature=0.1, max_tokens=5,
+                stage="interview.select_step"
             )
             next_id = int(''.join(filter(str.isdigit, next_id_str)))
             valid_ids = [s['id'] for s in available_steps]
             return next_id if next_id in valid_ids else available_steps[0]['id']
-        except (ValueError, IndexError): 
+        except (ValueError, IndexError, LLMServiceError): 
             return available_steps[0]['id']
 
-    def _transition_to_next_step(self):
-        next_step_id = self._select_next_step()
+    def _resolve_next_step(self, planned_next_step_id: int | None) -> int | None:
+        # Lo step scelto dal planner è valido solo se ancora da affrontare
+        if planned_next_step_id is not None and planned_next_step_id in self.steps and planned_next_step_id not in self.completed_step_ids:
+            return planned_next_step_id
+        return self._select_next_step()
+
+    def _transition_to_next_step(self, planned_next_step_id: int | None = None) -> dict:
+        next_step_id = self._resolve_next_step(planned_next_step_id)
         if next_step_id is None:
             self.is_finished = True
-            self._save_conversation_history()
-            return prompts.SUCCESSFUL_FINISH_MESSAGE
+            self._on_interview_finished()
+            return self._static_reply(prompts.SUCCESSFUL_FINISH_MESSAGE)
         current_step_info = self.steps[self.current_step_id]
         next_step_info = self.steps[next_step_id]
         prompt = prompts.create_successful_transition_prompt(
@@ -171,14 +593,15 @@ class SmartCaseStudyChatbot:
         )
         self.current_step_id = next_step_id
         self.attempts_on_current_step = 0
-        return get_llm_response(prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT)
+        self._open_memory_step(next_step_id)
+        return self._llm_reply(prompt)
 
-    def _conclude_step_and_transition(self):
-        next_step_id = self._select_next_step()
+    def _conclude_step_and_transition(self, planned_next_step_id: int | None = None) -> dict:
+        next_step_id = self._resolve_next_step(planned_next_step_id)
         if next_step_id is None:
             self.is_finished = True
-            self._save_conversation_history()
-            return prompts.FORCED_FINISH_MESSAGE
+            self._on_interview_finished()
+            return self._static_reply(prompts.FORCED_FINISH_MESSAGE)
 
         current_step_info = self.steps[self.current_step_id]
         next_step_info = self.steps[next_step_id]
@@ -194,11 +617,12 @@ class SmartCaseStudyChatbot:
         )
         self.current_step_id = next_step_id
         self.attempts_on_current_step = 0
-        return get_llm_response(prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT)
+        self._open_memory_step(next_step_id)
+        return self._llm_reply(prompt)
 
-    def _provide_guidance(self):
+    def _provide_guidance(self) -> dict:
         current_step_info = self.steps[self.current_step_id]
-        history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history])
+        history_text = self._history_text()
 
         skills_str = ", ".join([s.get('skill_name', '') for s in current_step_info.get('skills_to_test', [])])
 
@@ -208,4 +632,36 @@ class SmartCaseStudyChatbot:
             skills_str,
             history_text
         )
-        return get_llm_response(prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT, temperature=0.7)
\ No newline at end of file
+        return self._llm_reply(prompt, temperature=0.7)
+
+# --- POOL DI APERTURE PER CASO ---
+# Il messaggio di apertura dipende solo dal caso: può essere generato in fase di data
+# preparation, così il primo messaggio del colloquio compare senza attesa.
+OPENING_POOL_SIZE = int(os.getenv("INTERVIEW_OPENING_POOL_SIZE", "0"))
+
+
+def generate_opening_pool(cases: list, pool_size: int = OPENING_POOL_SIZE) -> dict:
+    """
+    Genera in parallelo 'pool_size' aperture per ogni caso (dizionari di CaseCollection).
+    Restituisce {question_id: [aperture]}; le chiamate fallite vengono semplicemente omesse.
+    """
+    requests = []
+    for case in cases:
+        step_zero = next((s for s in case.get("reasoning_steps", []) if s.get("id") == 0), None)
+        if step_zero is None or not case.get("question_id"):
+            continue
+        request = SmartCaseStudyChatbot.opening_request(case["question_title"], case["question_text"], step_zero)
+        request["stage"] = "data_preparation.openings"
+        # Il seed distingue le varianti: senza, richieste identiche verrebbero accorpate
+        requests.extend((case["question_id"], {**request, "seed": variant}) for variant in range(pool_size))
+
+    async def _generate_all():
+        return await asyncio.gather(*(aget_llm_response(**request) for _, request in requests), return_exceptions=True)
+
+    pool = {}
+    for (case_id, _), result in zip(requests, run_async(_generate_all()) if requests else []):
+        if isinstance(result, BaseException) or not result:
+            print(f"  - Apertura per il caso '{case_id}' non generata: {result}")
+            continue
+        pool.setdefault(case_id, []).append(result)
+    return pool
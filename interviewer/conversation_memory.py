@@ -0,0 +1,190 @@
+# interviewer/conversation_memory.py
+
+import os
+import sys
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from . import prompts
+
+# --- CONFIGURAZIONE ---
+# Memoria incrementale del colloquio: gli ultimi messaggi restano testuali, gli step conclusi
+# vengono riassunti in background, e il testo inserito nei prompt ha un budget di token fisso.
+MEMORY_RECENT_MESSAGES = int(os.getenv("INTERVIEW_MEMORY_RECENT_MESSAGES", "8"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("INTERVIEW_MEMORY_TOKEN_BUDGET", "2000"))
+SUMMARY_MODEL = "gpt-4o-mini"
+
+# Pool condiviso tra tutte le sessioni: i riassunti non sono urgenti
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="interview-summary")
+
+
+def estimate_tokens(text: str) -> int:
+    # Stessa approssimazione dello scheduler: ~4 caratteri per token
+    return len(text) // 4
+
+
+def format_messages(messages: list) -> str:
+    return "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+
+
+def llm_step_summarizer(step_title: str, messages: list) -> str:
+    from .llm_service import get_llm_response
+    return get_llm_response(
+        prompt=prompts.create_step_summary_prompt(step_title, format_messages(messages)),
+        model=SUMMARY_MODEL,
+        system_prompt="Sei un assistente che redige verbali sintetici e fedeli.",
+        temperature=0.2,
+        max_tokens=200,
+        stage="interview.summary"
+    )
+
+
+class ConversationMemory:
+    """
+    Tiene traccia dei segmenti di conversazione di ogni step. Quando uno step si chiude
+    il suo segmento viene riassunto in background; build_history_text() usa i riassunti
+    pronti al posto dei messaggi originali e non attende mai quelli in corso.
+    """
+
+    def __init__(self, recent_messages: int = MEMORY_RECENT_MESSAGES, token_budget: int = MEMORY_TOKEN_BUDGET,
+                 summarizer=llm_step_summarizer):
+        self.recent_messages = recent_messages
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        # Ogni segmento: {"step_id", "title", "start", "end", "summary"}
+        self.segments = []
+        self.open_step = None
+        self._lock = threading.Lock()
+
+    def start_step(self, step_id, title: str, start_index: int):
+        self.open_step = {"step_id": step_id, "title": title, "start": start_index}
+
+    def close_step(self, history: list):
+        """Chiude lo step aperto e avvia il riassunto del suo segmento in background."""
+        if self.open_step is None:
+            return
+        segment = {**self.open_step, "end": len(history), "summary": None}
+        self.segments.append(segment)
+        self.open_step = None
+        messages = [dict(m) for m in history[segment["start"]:segment["end"]]]
+        if not messages:
+            return
+        # Il worker eredita il contesto (sessione/stage per la telemetria)
+        _summary_executor.submit(contextvars.copy_context().run, self._summarize, segment, messages)
+
+    def _summarize(self, segment: dict, messages: list):
+        try:
+            summary = self.summarizer(segment["title"], messages)
+        except Exception as e:
+            print(f"[MEMORIA] Riassunto dello step '{segment['title']}' non disponibile: {e}")
+            return
+        with self._lock:
+            segment["summary"] = summary.strip() if summary else None
+
+    def snapshot(self) -> dict:
+        return {"segments_len": len(self.segments), "open_step": dict(self.open_step) if self.open_step else None}
+
+    def restore(self, snapshot: dict):
+        del self.segments[snapshot["segments_len"]:]
+        self.open_step = snapshot["open_step"]
+
+    def to_state(self) -> dict:
+        with self._lock:
+            segments = [dict(s) for s in self.segments]
+        return {"segments": segments, "open_step": dict(self.open_step) if self.open_step else None}
+
+    @classmethod
+    def from_state(cls, state: dict, history: list, summarizer=llm_step_summarizer) -> "ConversationMemory":
+        """Ricostruisce la memoria; i riassunti rimasti in sospeso vengono rilanciati in background."""
+        memory = cls(summarizer=summarizer)
+        memory.segments = [dict(s) for s in state.get("segments", [])]
+        memory.open_step = dict(state["open_step"]) if state.get("open_step") else None
+        for segment in memory.segments:
+            messages = [dict(m) for m in history[segment["start"]:segment["end"]]]
+            if segment.get("summary") is None and messages:
+                _summary_executor.submit(contextvars.copy_context().run, memory._summarize, segment, messages)
+        return memory
+
+    def build_history_text(self, history: list, token_budget: int | None = None) -> str:
+        """
+        Testo della conversazione per i prompt: riassunti degli step conclusi (se pronti),
+        poi i messaggi non riassunti dal più recente a ritroso finché il budget lo consente.
+        Gli ultimi 'recent_messages' messaggi non vengono mai sostituiti dal riassunto.
+        """
+        budget = token_budget or self.token_budget
+        recent_start = max(len(history) - self.recent_messages, 0)
+        with self._lock:
+            ready = [s for s in self.segments if s["summary"]]
+        covered = set()
+        for segment in ready:
+            covered.update(range(segment["start"], min(segment["end"], recent_start)))
+
+        summary_lines = [f"- Step '{s['title']}': {s['summary']}" for s in ready]
+        summary_text = ("Riepilogo degli step precedenti:\n" + "\n".join(summary_lines)) if summary_lines else ""
+        remaining = budget - estimate_tokens(summary_text)
+
+        kept = []
+        omitted = False
+        for index in range(len(history) - 1, -1, -1):
+            if index in covered:
+                continue
+            line = f"{history[index]['role']}: {history[index]['content']}"
+            cost = estimate_tokens(line) + 1
+            # Il messaggio più recente viene sempre incluso, anche oltre il budget
+            if kept and cost > remaining:
+                omitted = True
+                break
+            kept.append(line)
+            remaining -= cost
+        kept.reverse()
+
+        parts = [summary_text] if summary_text else []
+        if omitted:
+            parts.append("[... messaggi precedenti omessi ...]")
+        parts.append("\n".join(kept))
+        return "\n\n".join(p for p in parts if p)
+
+
+# --- BENCHMARK ---
+
+def _benchmark(steps: int = 4, attempts: int = 5, questions_per_step: int = 2, message_chars: int = 900):
+    """
+    Simula un colloquio lungo (senza chiamate LLM) e confronta i token di prompt della
+    cronologia completa con quelli della memoria a ogni turno.
+    """
+    import time
+
+    def _summarizer(title, messages):
+        # Riassunto simulato di lunghezza costante (~80 parole)
+        return f"Sintesi dello step {title}: " + ("punto chiave discusso dal candidato. " * 12)
+
+    memory = ConversationMemory(summarizer=_summarizer)
+    history = [{"role": "assistant", "content": "Introduzione del caso. " * (message_chars // 23)}]
+    memory.start_step(0, "Step 0", 0)
+    rows = []
+    turn = 0
+    for step in range(steps):
+        for message in range(attempts + questions_per_step):
+            turn += 1
+            history.append({"role": "user", "content": f"Risposta {turn}. " + "contenuto " * (message_chars // 10)})
+            history.append({"role": "assistant", "content": f"Replica {turn}. " + "guida " * (message_chars // 6)})
+            full = estimate_tokens(format_messages(history))
+            bounded = estimate_tokens(memory.build_history_text(history))
+            rows.append((turn, step, full, bounded))
+        memory.close_step(history)
+        memory.start_step(step + 1, f"Step {step + 1}", len(history))
+        # Lascia completare i riassunti in background (in produzione non si attende mai)
+        time.sleep(0.05)
+
+    print(f"{'turno':>5} {'step':>4} {'cronologia completa':>20} {'memoria':>8}")
+    for turn, step, full, bounded in rows:
+        print(f"{turn:>5} {step:>4} {full:>20} {bounded:>8}")
+    print(f"\nToken di prompt all'ultimo turno: {rows[-1][2]} (completa) vs {rows[-1][3]} (memoria, budget {memory.token_budget}).")
+    print(f"Totale su {len(rows)} turni: {sum(r[2] for r in rows)} vs {sum(r[3] for r in rows)}.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        _benchmark()
+    else:
+        print("Uso: python -m interviewer.conversation_memory bench")
@@ -0,0 +1,315 @@
+# interviewer/llm_backends.py
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from .llm_cache import make_cache_key
+
+# --- CONFIGURAZIONE ---
+# Backend alternativi a OpenAI con la stessa interfaccia (client.chat.completions.create),
+# selezionati in llm_service tramite LLM_BACKEND:
+#   "openai" (default) -> provider reale
+#   "fake"             -> risposte offline deterministiche (fixture registrate o sintetizzate)
+#   "record"           -> provider reale + salvataggio delle risposte come fixture
+# Retry, limiti di concorrenza e telemetria restano attivi; i budget rpm/tpm dello scheduler
+# sono disattivati (vedi LLM_RATE_LIMITS_ENABLED): con il backend fake la latenza misurata è
+# quella iniettata più l'overhead della nostra orchestrazione.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+LLM_FIXTURES_DIR = os.getenv("LLM_FIXTURES_DIR", os.path.join(PROJECT_ROOT, "data", "llm_fixtures"))
+LLM_FAKE_LATENCY_MS = float(os.getenv("LLM_FAKE_LATENCY_MS", "0"))
+LLM_FAKE_LATENCY_JITTER_MS = float(os.getenv("LLM_FAKE_LATENCY_JITTER_MS", "0"))
+# Tempo simulato per ogni token di output (tiene conto della lunghezza della risposta)
+LLM_FAKE_MS_PER_TOKEN = float(os.getenv("LLM_FAKE_MS_PER_TOKEN", "0"))
+
+# Regole opzionali in <fixtures>/rules.json: [{"match": "sottostringa del prompt", "content": "..."}]
+# oppure con "tool_arguments" per le chiamate strutturate. Si applicano quando non esiste
+# una fixture registrata per la richiesta esatta.
+_RULES_FILE = "rules.json"
+
+
+# --- FIXTURE ---
+
+class FixtureStore:
+    """Fixture su disco: un file JSON per richiesta, indicizzato con la chiave della cache."""
+
+    def __init__(self, directory: str = LLM_FIXTURES_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._rules = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, api_kwargs: dict) -> dict | None:
+        path = self._path(make_cache_key(api_kwargs))
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return self._match_rule(api_kwargs)
+
+    def save(self, api_kwargs: dict, fixture: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(make_cache_key(api_kwargs))
+        with self._lock:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({**fixture, "model": api_kwargs.get("model")}, f, ensure_ascii=False, indent=2)
+
+    def _load_rules(self) -> list:
+        if self._rules is None:
+            path = os.path.join(self.directory, _RULES_FILE)
+            rules = []
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    rules = json.load(f)
+            self._rules = rules
+        return self._rules
+
+    def _match_rule(self, api_kwargs: dict) -> dict | None:
+        text = "\n".join(str(m.get("content") or "") for m in api_kwargs.get("messages", []))
+        for rule in self._load_rules():
+            if rule.get("match", "") in text:
+                return rule
+        return None
+
+
+# --- SINTESI DA JSON SCHEMA ---
+
+def _resolve_ref(ref: str, root: dict) -> dict:
+    node = root
+    for part in ref.lstrip("#/").split("/"):
+        node = node[part]
+    return node
+
+
+def synthesize_from_schema(schema: dict, rng: random.Random, root: dict | None = None, name: str = "value"):
+    """
+    Genera un valore valido per lo schema (quello prodotto da model_json_schema() di Pydantic):
+    gestisce $ref/$defs, anyOf, enum, vincoli numerici e lunghezza delle liste.
+    """
+    root = root if root is not None else schema
+    if "$ref" in schema:
+        return synthesize_from_schema(_resolve_ref(schema["$ref"], root), rng, root, name)
+    for combinator in ("anyOf", "oneOf", "allOf"):
+        if combinator in schema:
+            options = [s for s in schema[combinator] if s.get("type") != "null"] or schema[combinator]
+            return synthesize_from_schema(options[0], rng, root, name)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "default" in schema and schema.get("type") not in ("object", "array"):
+        return schema["default"]
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "string")
+    if schema_type == "object" or "properties" in schema:
+        return {
+            prop: synthesize_from_schema(prop_schema, rng, root, prop)
+            for prop, prop_schema in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        min_items = schema.get("minItems", 1)
+        max_items = schema.get("maxItems", max(min_items, 3))
+        count = rng.randint(min_items, max(min_items, max_items))
+        item_schema = schema.get("items", {"type": "string"})
+        return [synthesize_from_schema(item_schema, rng, root, f"{name}_{i}") for i in range(count)]
+    if schema_type in ("integer", "number"):
+        low = schema.get("minimum", schema.get("exclusiveMinimum", 0))
+        high = schema.get("maximum", schema.get("exclusiveMaximum", low + 100))
+        value = rng.randint(int(low), int(high))
+        return value if schema_type == "integer" else float(value)
+    if schema_type == "boolean":
+        return rng.random() < 0.5
+    text = f"{name} simulato {rng.randint(1, 999)}"
+    min_length = schema.get("minLength", 0)
+    return text.ljust(min_length, "x")[:schema.get("maxLength", len(text) + min_length)]
+
+
+# --- RISPOSTE IN FORMATO OPENAI ---
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _usage(api_kwargs: dict, output: str):
+    prompt = "".join(str(m.get("content") or "") for m in api_kwargs.get("messages", []))
+    return SimpleNamespace(
+        prompt_tokens=_estimate_tokens(prompt),
+        completion_tokens=_estimate_tokens(output),
+        total_tokens=_estimate_tokens(prompt) + _estimate_tokens(output),
+        prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+    )
+
+
+def _completion(api_kwargs: dict, content: str | None = None, tool_name: str | None = None, arguments: str | None = None):
+    tool_calls = None
+    if tool_name is not None:
+        tool_calls = [SimpleNamespace(
+            id="call_offline",
+            type="function",
+            function=SimpleNamespace(name=tool_name, arguments=arguments),
+        )]
+    message = SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls)
+    return SimpleNamespace(
+        id="chatcmpl-offline",
+        model=api_kwargs.get("model"),
+        choices=[SimpleNamespace(index=0, message=message, finish_reason="tool_calls" if tool_calls else "stop")],
+        usage=_usage(api_kwargs, content or arguments or ""),
+    )
+
+
+class _FakeStream:
+    """Iteratore di chunk come quello restituito da create(stream=True)."""
+
+    def __init__(self, api_kwargs: dict, content: str, chunk_delay_s: float):
+        self._api_kwargs = api_kwargs
+        self._content = content
+        self._chunk_delay_s = chunk_delay_s
+        self._closed = False
+
+    def __iter__(self):
+        words = self._content.split(" ")
+        for i, word in enumerate(words):
+            if self._closed:
+                return
+            if self._chunk_delay_s:
+                time.sleep(self._chunk_delay_s)
+            piece = word if i == 0 else " " + word
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece))], usage=None)
+        # Come con include_usage: ultimo chunk senza choices e con l'usage
+        yield SimpleNamespace(choices=[], usage=_usage(self._api_kwargs, self._content))
+
+    def close(self):
+        self._closed = True
+
+
+# --- BACKEND OFFLINE ---
+
+class FakeLLMBackend:
+    """
+    Produce risposte deterministiche (stessa richiesta -> stessa risposta): prima cerca
+    una fixture registrata, poi una regola, altrimenti sintetizza l'output (argomenti del
+    tool validi rispetto allo schema, oppure un testo segnaposto).
+    """
+
+    def __init__(self, fixtures: FixtureStore | None = None, latency_ms: float = LLM_FAKE_LATENCY_MS,
+                 jitter_ms: float = LLM_FAKE_LATENCY_JITTER_MS, ms_per_token: float = LLM_FAKE_MS_PER_TOKEN):
+        self.fixtures = fixtures or FixtureStore()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_token = ms_per_token
+
+    def _rng(self, api_kwargs: dict) -> random.Random:
+        seed = int(hashlib.sha256(make_cache_key(api_kwargs).encode()).hexdigest()[:16], 16)
+        return random.Random(seed)
+
+    def latency_seconds(self, api_kwargs: dict, output: str) -> float:
+        jitter = self._rng(api_kwargs).uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        total_ms = self.latency_ms + jitter + self.ms_per_token * _estimate_tokens(output)
+        return max(total_ms, 0.0) / 1000.0
+
+    def _tool(self, api_kwargs: dict) -> dict | None:
+        tools = api_kwargs.get("tools") or []
+        return tools[0]["function"] if tools else None
+
+    def respond(self, api_kwargs: dict) -> tuple[dict, str]:
+        """Restituisce (kwargs per _completion, testo di output usato per latenza e usage)."""
+        fixture = self.fixtures.load(api_kwargs) or {}
+        tool = self._tool(api_kwargs)
+        if tool is not None:
+            arguments = fixture.get("tool_arguments")
+            if arguments is None:
+                arguments = synthesize_from_schema(tool["parameters"], self._rng(api_kwargs))
+            if not isinstance(arguments, str):
+                arguments = json.dumps(arguments, ensure_ascii=False)
+            return {"tool_name": tool["name"], "arguments": arguments}, arguments
+        content = fixture.get("content")
+        if content is None:
+            prompt = api_kwargs["messages"][-1].get("content") or ""
+            content = f"[offline] Risposta simulata ({_estimate_tokens(prompt)} token di prompt)."
+        return {"content": content}, content
+
+
+class _FakeCompletions:
+    def __init__(self, backend: FakeLLMBackend):
+        self._backend = backend
+
+    def create(self, **api_kwargs):
+        fields, output = self._backend.respond(api_kwargs)
+        latency = self._backend.latency_seconds(api_kwargs, output)
+        if api_kwargs.get("stream"):
+            # La latenza fissa è il time-to-first-token, il resto viene distribuito sui chunk
+            time.sleep(self._backend.latency_ms / 1000.0)
+            words = max(1, len(output.split(" ")))
+            return _FakeStream(api_kwargs, output, max(latency - self._backend.latency_ms / 1000.0, 0.0) / words)
+        time.sleep(latency)
+        return _completion(api_kwargs, **fields)
+
+
+class _AsyncFakeCompletions(_FakeCompletions):
+    async def create(self, **api_kwargs):
+        fields, output = self._backend.respond(api_kwargs)
+        await asyncio.sleep(self._backend.latency_seconds(api_kwargs, output))
+        return _completion(api_kwargs, **fields)
+
+
+class FakeOpenAI:
+    """Sostituto in-process di openai.OpenAI, senza rete."""
+
+    def __init__(self, backend: FakeLLMBackend | None = None):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(backend or FakeLLMBackend()))
+
+
+class AsyncFakeOpenAI:
+    """Sostituto in-process di openai.AsyncOpenAI, senza rete."""
+
+    def __init__(self, backend: FakeLLMBackend | None = None):
+        self.chat = SimpleNamespace(completions=_AsyncFakeCompletions(backend or FakeLLMBackend()))
+
+
+# --- REGISTRAZIONE DELLE FIXTURE ---
+
+def _fixture_from_response(response) -> dict:
+    message = response.choices[0].message
+    if message.tool_calls:
+        return {"tool_arguments": message.tool_calls[0].function.arguments}
+    return {"content": message.content or ""}
+
+
+class _RecordingCompletions:
+    def __init__(self, completions, fixtures: FixtureStore):
+        self._completions = completions
+        self._fixtures = fixtures
+
+    def create(self, **api_kwargs):
+        response = self._completions.create(**api_kwargs)
+        # Gli stream non vengono registrati: in replay il testo arriva dalle chiamate non in streaming
+        if not api_kwargs.get("stream"):
+            self._fixtures.save(api_kwargs, _fixture_from_response(response))
+        return response
+
+
+class _AsyncRecordingCompletions(_RecordingCompletions):
+    async def create(self, **api_kwargs):
+        response = await self._completions.create(**api_kwargs)
+        if not api_kwargs.get("stream"):
+            self._fixtures.save(api_kwargs, _fixture_from_response(response))
+        return response
+
+
+class RecordingOpenAI:
+    """Avvolge un client reale e salva ogni risposta come fixture per il backend fake."""
+
+    def __init__(self, client, fixtures: FixtureStore | None = None):
+        self.chat = SimpleNamespace(completions=_RecordingCompletions(client.chat.completions, fixtures or FixtureStore()))
+
+
+class AsyncRecordingOpenAI:
+    def __init__(self, client, fixtures: FixtureStore | None = None):
+        self.chat = SimpleNamespace(completions=_AsyncRecordingCompletions(client.chat.completions, fixtures or FixtureStore()))
@@ -0,0 +1,254 @@
+# interviewer/llm_batch.py
+
+import os
+import json
+import time
+import uuid
+import contextvars
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from . import llm_service
+from . import llm_telemetry
+from .llm_telemetry import llm_context
+from .llm_service import (
+    _build_messages,
+    _build_structured_kwargs,
+    _cache_lookup,
+    _cache_store,
+    _create_completion,
+    LLMServiceError,
+    LLMConfigurationError,
+)
+
+# --- CONFIGURAZIONE ---
+# Modalità batch per carichi massivi non interattivi (screening, normalizzazione notturna):
+# le richieste vengono scritte in un file JSONL, inviate alla Batch API (costo dimezzato,
+# nessun round trip seriale) e i risultati ricollegati tramite custom_id.
+#   "openai" -> Batch API del provider (default con il backend reale)
+#   "local"  -> stand-in locale: esegue le righe del job tramite llm_service, in parallelo
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+LLM_BATCH_BACKEND = os.getenv("LLM_BATCH_BACKEND", "openai" if llm_service.LLM_BACKEND != "fake" else "local")
+LLM_BATCH_DIR = os.getenv("LLM_BATCH_DIR", os.path.join(PROJECT_ROOT, "data", "batch_jobs"))
+LLM_BATCH_POLL_SECONDS = float(os.getenv("LLM_BATCH_POLL_SECONDS", "30"))
+LLM_BATCH_TIMEOUT_SECONDS = float(os.getenv("LLM_BATCH_TIMEOUT_SECONDS", str(24 * 3600)))
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+# --- COSTRUZIONE DEL JOB ---
+
+def build_text_request(custom_id: str, prompt: str, model: str, system_prompt: str, **kwargs) -> dict:
+    """Richiesta batch equivalente a get_llm_response."""
+    return {"custom_id": custom_id, "body": {"model": model, "messages": _build_messages(prompt, system_prompt), **kwargs}}
+
+
+def build_structured_request(custom_id: str, prompt: str, model: str, system_prompt: str, tool_name: str,
+                             tool_schema: dict, temperature: float | None = None, max_tokens: int | None = None) -> dict:
+    """Richiesta batch equivalente a get_structured_llm_response."""
+    body = _build_structured_kwargs(prompt, model, system_prompt, tool_name, tool_schema, temperature, max_tokens)
+    return {"custom_id": custom_id, "body": body}
+
+
+def write_job_file(requests: list, path: str) -> str:
+    """Scrive il job nel formato JSONL della Batch API (una richiesta per riga)."""
+    custom_ids = [r["custom_id"] for r in requests]
+    if len(set(custom_ids)) != len(custom_ids):
+        raise ValueError("I custom_id di un job batch devono essere univoci.")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            line = {"custom_id": request["custom_id"], "method": "POST", "url": BATCH_ENDPOINT, "body": request["body"]}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+
+def _read_jsonl(text: str) -> list:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+# --- CONVERSIONE DELLE RISPOSTE ---
+
+def _response_to_body(response) -> dict:
+    """Serializza una risposta (client reale o fake) nel formato 'body' dell'output batch."""
+    message = response.choices[0].message
+    tool_calls = [
+        {"type": "function", "function": {"name": call.function.name, "arguments": call.function.arguments}}
+        for call in (message.tool_calls or [])
+    ]
+    usage = response.usage
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "model": getattr(response, "model", None),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": message.content, "tool_calls": tool_calls or None}}],
+        "usage": {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+            "completion_tokens": getattr(usage, "completion_tokens", 0),
+            "prompt_tokens_details": {"cached_tokens": getattr(details, "cached_tokens", 0) or 0},
+        },
+    }
+
+
+def _output_from_body(body: dict) -> str | None:
+    """Testo della risposta oppure, per le chiamate strutturate, gli argomenti del tool."""
+    choices = body.get("choices") or []
+    if not choices:
+        return None
+    message = choices[0].get("message") or {}
+    if message.get("tool_calls"):
+        return message["tool_calls"][0]["function"]["arguments"]
+    content = message.get("content")
+    return content.strip() if content is not None else None
+
+
+def _usage_from_body(body: dict):
+    usage = body.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    return SimpleNamespace(
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        prompt_tokens_details=SimpleNamespace(cached_tokens=details.get("cached_tokens", 0)),
+    )
+
+
+# --- BACKEND ---
+
+class OpenAIBatchBackend:
+    """Invia il job alla Batch API di OpenAI e attende il completamento con polling."""
+
+    def submit(self, job_path: str) -> str:
+        client = llm_service.client
+        if client is None or not hasattr(client, "batches"):
+            raise LLMConfigurationError("La Batch API richiede il client OpenAI reale (LLM_BACKEND=openai).")
+        with open(job_path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        return batch.id
+
+    def wait(self, batch_id: str, poll_seconds: float, timeout_seconds: float) -> list:
+        client = llm_service.client
+        deadline = time.monotonic() + timeout_seconds
+        while True:
+            batch = client.batches.retrieve(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            if counts is not None:
+                print(f"[LLM BATCH] {batch_id}: {batch.status} ({counts.completed}/{counts.total} completate, {counts.failed} fallite)")
+            if batch.status in _FINAL_STATUSES:
+                break
+            if time.monotonic() > deadline:
+                raise LLMServiceError(f"Batch {batch_id} non completato entro {timeout_seconds:.0f}s (stato: {batch.status}).")
+            time.sleep(poll_seconds)
+
+        lines = []
+        # Anche un batch scaduto o annullato può avere risultati parziali
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(_read_jsonl(client.files.content(file_id).text))
+        if batch.status != "completed":
+            print(f"[LLM BATCH] Batch {batch_id} terminato con stato '{batch.status}': {len(lines)} risultati recuperati.")
+        return lines
+
+
+class LocalBatchBackend:
+    """
+    Stand-in locale della Batch API: esegue le righe del job tramite llm_service
+    (scheduler, limiti di concorrenza, backend fake) e produce lo stesso formato di output.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers or llm_service.MAX_CONCURRENT_LLM_REQUESTS
+        self._results = {}
+
+    def _execute(self, line: dict) -> dict:
+        try:
+            response = _create_completion(line["body"])
+            return {"custom_id": line["custom_id"], "response": {"status_code": 200, "body": _response_to_body(response)}, "error": None}
+        except LLMServiceError as e:
+            return {"custom_id": line["custom_id"], "response": None, "error": {"code": type(e).__name__, "message": str(e)}}
+
+    def submit(self, job_path: str) -> str:
+        with open(job_path, "r", encoding="utf-8") as f:
+            lines = _read_jsonl(f.read())
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Ogni worker riceve una copia del contesto (stage/sessione per la telemetria)
+            futures = [executor.submit(contextvars.copy_context().run, self._execute, line) for line in lines]
+            self._results[batch_id] = [future.result() for future in futures]
+        return batch_id
+
+    def wait(self, batch_id: str, poll_seconds: float, timeout_seconds: float) -> list:
+        return self._results.pop(batch_id, [])
+
+
+def get_batch_backend(name: str = LLM_BATCH_BACKEND):
+    return LocalBatchBackend() if name == "local" else OpenAIBatchBackend()
+
+
+# --- ESECUZIONE ---
+
+def run_batch(requests: list, job_name: str | None = None, use_cache: bool = False, stage: str | None = None,
+              backend=None, poll_seconds: float = LLM_BATCH_POLL_SECONDS,
+              timeout_seconds: float = LLM_BATCH_TIMEOUT_SECONDS) -> dict:
+    """
+    Esegue un insieme di richieste (build_text_request / build_structured_request) come job batch.
+
+    Restituisce {custom_id: output}, dove output è il testo della risposta o gli argomenti
+    del tool in JSON, oppure None se la singola richiesta è fallita. Con use_cache=True le
+    richieste già presenti nella cache delle risposte non vengono inviate.
+    """
+    results = {}
+    pending = []
+    cache_keys = {}
+    for request in requests:
+        cache_key, cached = _cache_lookup(request["body"], use_cache, stage)
+        if cached is not None:
+            results[request["custom_id"]] = cached
+            continue
+        cache_keys[request["custom_id"]] = cache_key
+        pending.append(request)
+
+    if not pending:
+        return results
+
+    job_name = job_name or f"job-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    job_path = write_job_file(pending, os.path.join(LLM_BATCH_DIR, f"{job_name}.jsonl"))
+    backend = backend or get_batch_backend()
+    print(f"[LLM BATCH] Invio di {len(pending)} richieste ({len(results)} dalla cache) tramite {type(backend).__name__}...")
+
+    started = time.perf_counter()
+    with llm_context(stage=stage):
+        batch_id = backend.submit(job_path)
+        lines = backend.wait(batch_id, poll_seconds, timeout_seconds)
+    elapsed = time.perf_counter() - started
+
+    models = {r["custom_id"]: r["body"]["model"] for r in pending}
+    local = isinstance(backend, LocalBatchBackend)
+    for line in lines:
+        custom_id = line.get("custom_id")
+        if custom_id not in models:
+            continue
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            print(f"[LLM BATCH] Richiesta '{custom_id}' fallita: {line.get('error') or response.get('body')}")
+            results[custom_id] = None
+            continue
+        body = response["body"]
+        output = _output_from_body(body)
+        results[custom_id] = output
+        _cache_store(cache_keys.get(custom_id), output, models[custom_id])
+        # Lo stand-in locale ha già emesso la telemetria per ogni chiamata
+        if not local:
+            llm_telemetry.emit(llm_telemetry.build_record(
+                models[custom_id], _usage_from_body(body), elapsed / len(pending), stage=stage, batch=True
+            ))
+
+    for custom_id in models:
+        results.setdefault(custom_id, None)
+    failed = sum(1 for custom_id in models if results[custom_id] is None)
+    print(f"[LLM BATCH] Job '{job_name}' completato in {elapsed:.1f}s: {len(models) - failed} risultati, {failed} falliti.")
+    return results
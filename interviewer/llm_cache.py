@@ -0,0 +1,154 @@
+# interviewer/llm_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# --- CONFIGURAZIONE ---
+# La cache è attiva solo per le chiamate che la richiedono esplicitamente (use_cache=True);
+# LLM_CACHE_ENABLED=0 la disattiva globalmente.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(PROJECT_ROOT, "data", "cache", "llm_responses.sqlite"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Parametri della richiesta che influenzano l'output e quindi entrano nella chiave
+_KEY_FIELDS = ("model", "messages", "tools", "tool_choice", "temperature", "max_tokens", "top_p", "response_format", "seed")
+
+
+def make_cache_key(api_kwargs: dict) -> str:
+    """
+    Calcola la chiave content-addressed di una richiesta: hash di modello, messaggi
+    (system prompt + prompt), schema del tool e parametri di campionamento.
+    """
+    payload = {field: api_kwargs.get(field) for field in _KEY_FIELDS if api_kwargs.get(field) is not None}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Cache su disco (SQLite) delle risposte LLM, con scadenza TTL, eviction LRU
+    e limiti su numero di voci e dimensione totale.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                    conn.commit()
+                    self.stats["hits"] += 1
+                    return row[0]
+                if row:
+                    # Voce scaduta
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    self.stats["evictions"] += 1
+                self.stats["misses"] += 1
+                return None
+        except sqlite3.Error as e:
+            print(f"[LLM CACHE] Errore in lettura: {e}")
+            return None
+
+    def set(self, key: str, value: str, model: str = ""):
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, model, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, value, len(value.encode("utf-8")), now, now)
+                )
+                self.stats["writes"] += 1
+                self._evict(conn, now)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"[LLM CACHE] Errore in scrittura: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        expired = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        self.stats["evictions"] += max(expired, 0)
+
+        count, total_size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+        # Rimuove le voci usate meno di recente finché non si rientra nei limiti
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall():
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count -= 1
+            total_size -= size
+            self.stats["evictions"] += 1
+
+    def delete(self, key: str):
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+                self.stats["evictions"] += 1
+        except sqlite3.Error as e:
+            print(f"[LLM CACHE] Errore in cancellazione: {e}")
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    def get_stats(self) -> dict:
+        """Contatori hit/miss più il tasso di hit e l'occupazione corrente."""
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        try:
+            with self._lock:
+                count, total_size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+                ).fetchone()
+            stats["entries"], stats["bytes"] = count, total_size
+        except sqlite3.Error:
+            pass
+        return stats
+
+
+response_cache = LLMResponseCache()
@@ -0,0 +1,269 @@
+# interviewer/llm_scheduler.py
+
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import httpx
+import openai
+
+# --- CONFIGURAZIONE ---
+# Budget per modello: richieste al minuto (rpm) e token al minuto (tpm).
+# I modelli non elencati usano DEFAULT_RATE_LIMITS. I valori di base sono quelli del tier 1
+# di OpenAI: LLM_RATE_LIMITS (JSON) li sovrascrive per modello, con "default" per gli altri:
+#   LLM_RATE_LIMITS='{"gpt-4.1-2025-04-14": {"tpm": 450000}, "default": {"rpm": 5000}}'
+MODEL_RATE_LIMITS = {
+    "gpt-4.1-2025-04-14": {"rpm": 500, "tpm": 30000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+}
+DEFAULT_RATE_LIMITS = {"rpm": 500, "tpm": 30000}
+
+
+def _apply_rate_limit_overrides():
+    raw = os.getenv("LLM_RATE_LIMITS")
+    if not raw:
+        return
+    try:
+        overrides = json.loads(raw)
+    except json.JSONDecodeError as e:
+        print(f"[LLM SCHEDULER] LLM_RATE_LIMITS non è un JSON valido, uso i budget di default: {e}")
+        return
+    for model, limits in overrides.items():
+        if model == "default":
+            DEFAULT_RATE_LIMITS.update(limits)
+        else:
+            MODEL_RATE_LIMITS[model] = {**DEFAULT_RATE_LIMITS, **MODEL_RATE_LIMITS.get(model, {}), **limits}
+
+
+_apply_rate_limit_overrides()
+
+# Con il backend fake non c'è un provider da proteggere: i budget sono disattivati, così i
+# benchmark offline misurano l'orchestrazione e non le attese del token bucket.
+# LLM_RATE_LIMITS_ENABLED=1 li riattiva (es. per simulare il throttling).
+LLM_RATE_LIMITS_ENABLED = os.getenv(
+    "LLM_RATE_LIMITS_ENABLED", "0" if os.getenv("LLM_BACKEND", "openai") == "fake" else "1"
+) == "1"
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60.0"))
+# Stima dei token di output quando la chiamata non specifica max_tokens
+DEFAULT_COMPLETION_TOKENS_ESTIMATE = 1000
+
+_RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+# --- ECCEZIONI TIPIZZATE ---
+
+class LLMServiceError(Exception):
+    """Errore base del servizio LLM."""
+
+
+class LLMConfigurationError(LLMServiceError):
+    """Il servizio non è configurato (es. chiave API mancante)."""
+
+
+class LLMRateLimitError(LLMServiceError):
+    """Limite di richieste/token del provider superato anche dopo i tentativi."""
+
+
+class LLMTransientError(LLMServiceError):
+    """Errore temporaneo (timeout, connessione, 5xx) persistito dopo i tentativi."""
+
+
+class LLMRequestError(LLMServiceError):
+    """Richiesta rifiutata dal provider (non ha senso riprovarla)."""
+
+
+# --- TOKEN BUCKET ---
+
+class TokenBucket:
+    """
+    Token bucket con prenotazione: chi chiede più di quanto disponibile va "in debito"
+    e riceve il tempo di attesa, così le richieste vengono accodate in ordine di arrivo.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Prenota 'amount' token e restituisce i secondi da attendere prima di procedere."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.refill_per_second
+
+    def drain(self, seconds: float):
+        """Blocca il bucket per 'seconds' (es. dopo un 429 con Retry-After)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, -seconds * self.refill_per_second)
+
+
+# --- SCHEDULER ---
+
+def estimate_request_tokens(api_kwargs: dict) -> int:
+    """Stima grossolana (4 caratteri ~ 1 token) dei token consumati da una richiesta."""
+    chars = sum(len(str(m.get("content") or "")) for m in api_kwargs.get("messages", []))
+    chars += len(str(api_kwargs.get("tools") or ""))
+    completion = api_kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS_ESTIMATE
+    return chars // 4 + completion
+
+
+def _retry_after_seconds(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for header in ("retry-after-ms", "retry-after"):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            continue
+        return seconds / 1000.0 if header == "retry-after-ms" else seconds
+    return None
+
+
+def classify_error(error: Exception) -> Exception:
+    """
+    Converte un'eccezione del client OpenAI (o di httpx, es. a metà di uno stream)
+    nell'eccezione tipizzata corrispondente. Tutte le altre (es. TypeError, KeyError: bug
+    nel percorso della richiesta) vengono restituite invariate, così non finiscono tra gli
+    errori del servizio LLM gestiti dai chiamanti.
+    """
+    if isinstance(error, LLMServiceError):
+        return error
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return LLMTransientError(str(error))
+    if isinstance(error, openai.RateLimitError):
+        return LLMRateLimitError(str(error))
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return LLMTransientError(str(error))
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 429:
+            return LLMRateLimitError(str(error))
+        if error.status_code in _RETRYABLE_STATUS_CODES:
+            return LLMTransientError(str(error))
+        return LLMRequestError(str(error))
+    if isinstance(error, openai.OpenAIError):
+        return LLMRequestError(str(error))
+    return error
+
+
+class LLMScheduler:
+    """
+    Applica i budget rpm/tpm per modello e ritenta gli errori temporanei con backoff
+    esponenziale con jitter, rispettando l'header Retry-After.
+    """
+
+    def __init__(self, rate_limits: dict = MODEL_RATE_LIMITS, max_retries: int = LLM_MAX_RETRIES,
+                 enabled: bool = LLM_RATE_LIMITS_ENABLED):
+        self.rate_limits = rate_limits
+        self.max_retries = max_retries
+        self.enabled = enabled
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, model: str) -> tuple[TokenBucket, TokenBucket]:
+        with self._lock:
+            if model not in self._buckets:
+                limits = self.rate_limits.get(model, DEFAULT_RATE_LIMITS)
+                self._buckets[model] = (
+                    TokenBucket(limits["rpm"], limits["rpm"] / 60.0),
+                    TokenBucket(limits["tpm"], limits["tpm"] / 60.0),
+                )
+            return self._buckets[model]
+
+    def limits_for(self, model: str) -> dict | None:
+        """Budget rpm/tpm applicato al modello (None se i budget sono disattivati)."""
+        if not self.enabled:
+            return None
+        return self.rate_limits.get(model, DEFAULT_RATE_LIMITS)
+
+    def _admission_delay(self, model: str, api_kwargs: dict) -> float:
+        if not self.enabled:
+            return 0.0
+        requests_bucket, tokens_bucket = self._buckets_for(model)
+        return max(requests_bucket.reserve(1), tokens_bucket.reserve(estimate_request_tokens(api_kwargs)))
+
+    def _backoff_delay(self, attempt: int, error: Exception, model: str) -> float:
+        delay = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+            if isinstance(classify_error(error), LLMRateLimitError):
+                # Tutte le richieste verso questo modello attendono, non solo quella respinta
+                self._buckets_for(model)[0].drain(retry_after)
+        return delay
+
+    def _should_retry(self, error: LLMServiceError, attempt: int) -> bool:
+        return isinstance(error, (LLMRateLimitError, LLMTransientError)) and attempt < self.max_retries
+
+    def run(self, model: str, api_kwargs: dict, call, stats: dict | None = None):
+        """
+        Esegue call() rispettando budget e politica di retry (versione sincrona).
+        Se fornito, 'stats' riceve il numero di retry effettuati.
+        """
+        attempt = 0
+        stats = stats if stats is not None else {}
+        while True:
+            delay = self._admission_delay(model, api_kwargs)
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                return call()
+            except Exception as e:
+                typed = classify_error(e)
+                if not self._should_retry(typed, attempt):
+                    if typed is e:
+                        raise
+                    raise typed from e
+                delay = self._backoff_delay(attempt, e, model)
+                print(f"[LLM SCHEDULER] {type(typed).__name__} su '{model}', tentativo {attempt + 1}/{self.max_retries}: nuovo tentativo tra {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                stats["retries"] = attempt
+
+    async def arun(self, model: str, api_kwargs: dict, call, stats: dict | None = None):
+        """Versione asincrona di run(): call() deve restituire una coroutine."""
+        attempt = 0
+        stats = stats if stats is not None else {}
+        while True:
+            delay = self._admission_delay(model, api_kwargs)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await call()
+            except Exception as e:
+                typed = classify_error(e)
+                if not self._should_retry(typed, attempt):
+                    if typed is e:
+                        raise
+                    raise typed from e
+                delay = self._backoff_delay(attempt, e, model)
+                print(f"[LLM SCHEDULER] {type(typed).__name__} su '{model}', tentativo {attempt + 1}/{self.max_retries}: nuovo tentativo tra {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                stats["retries"] = attempt
+
+
+scheduler = LLMScheduler()
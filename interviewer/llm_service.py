@@ -1,8 +1,27 @@
 import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
 import streamlit as st
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Iterator
+from .llm_cache import response_cache, make_cache_key, LLM_CACHE_ENABLED
+from . import llm_telemetry
+from .llm_backends import FakeOpenAI, AsyncFakeOpenAI, RecordingOpenAI, AsyncRecordingOpenAI
+from .llm_telemetry import llm_context
+from .llm_scheduler import (
+    scheduler,
+    classify_error,
+    LLMServiceError,
+    LLMConfigurationError,
+    LLMRateLimitError,
+    LLMTransientError,
+    LLMRequestError,
+)
 
 # Carica le variabili dal file .env se presente (per lo sviluppo locale)
 load_dotenv()
@@ -22,9 +41,17 @@ if not API_KEY:
 # --- FINE LOGICA ROBUSTA ---
 
 
-# Inizializza il client OpenAI solo se la chiave API è stata trovata
+# "openai" (default), "fake" (offline, vedi llm_backends) oppure "record"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+# Inizializza i client OpenAI (sincrono e asincrono) solo se la chiave API è stata trovata
 client = None
-if not API_KEY:
+async_client = None
+if LLM_BACKEND == "fake":
+    print("[LLM SERVICE] Backend offline attivo: nessuna chiamata verrà inviata a OpenAI.")
+    client = FakeOpenAI()
+    async_client = AsyncFakeOpenAI()
+elif not API_KEY:
     print("❌ ERRORE CRITICO: OPENAI_API_KEY non trovata. Controlla i secrets in cloud o il file .env in locale.")
     try:
         # Mostra un errore nella UI solo se l'app sta girando
@@ -32,57 +59,340 @@ if not API_KEY:
     except Exception:
         pass 
 else:
-    client = OpenAI(api_key=API_KEY)
+    # I retry sono gestiti dallo scheduler (llm_scheduler), non dal client
+    client = OpenAI(api_key=API_KEY, max_retries=0)
+    async_client = AsyncOpenAI(api_key=API_KEY, max_retries=0)
+    if LLM_BACKEND == "record":
+        # Le risposte reali vengono salvate come fixture per il backend offline
+        client = RecordingOpenAI(client)
+        async_client = AsyncRecordingOpenAI(async_client)
+
+# --- LIMITI DI CONCORRENZA ---
+# Un limite globale per processo e limiti opzionali per singolo modello. Valgono sia per le
+# chiamate sincrone (thread di Streamlit) sia per quelle asincrone (qualsiasi event loop).
+MAX_CONCURRENT_LLM_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+MODEL_CONCURRENCY_LIMITS = {
+    # 5 = i casi del fan-out (case_creator) possono essere in volo insieme; quante richieste
+    # partono davvero lo decide il budget tpm dello scheduler (configurabile con LLM_RATE_LIMITS)
+    "gpt-4.1-2025-04-14": 5,
+    "gpt-4o-mini": 8,
+}
 
-def get_llm_response(prompt: str, model: str, system_prompt: str, **kwargs) -> str:
+
+class ConcurrencyLimiter:
     """
-    Invia un prompt per una risposta testuale semplice.
+    Semaforo condiviso tra thread ed event loop diversi.
+
+    I thread attendono su un threading.Event, le coroutine su un Future del proprio loop;
+    al rilascio lo slot viene ceduto al primo in coda (FIFO).
     """
-    # Controlla se il client è stato inizializzato correttamente
-    if client is None:
-        return "Errore: Il servizio LLM non è configurato a causa di una chiave API mancante."
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": prompt}
-    ]
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return
+            event = threading.Event()
+            self._waiters.append(("sync", event))
+        event.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return
+            future = loop.create_future()
+            waiter = ("async", (loop, future))
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    # Ancora in coda: basta rimuoverci
+                    self._waiters.remove(waiter)
+                    raise
+            # Lo slot ci è già stato ceduto: lo restituiamo
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._in_use -= 1
+                return
+            kind, payload = self._waiters.popleft()
+        # Lo slot passa direttamente al prossimo in coda (in_use invariato)
+        if kind == "sync":
+            payload.set()
+        else:
+            loop, future = payload
+            loop.call_soon_threadsafe(self._wake_async, future)
+
+    def _wake_async(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+_global_limiter = ConcurrencyLimiter(MAX_CONCURRENT_LLM_REQUESTS)
+_model_limiters = {}
+_model_limiters_lock = threading.Lock()
+
+
+def _get_model_limiter(model: str) -> ConcurrencyLimiter | None:
+    limit = MODEL_CONCURRENCY_LIMITS.get(model)
+    if not limit:
+        return None
+    with _model_limiters_lock:
+        if model not in _model_limiters:
+            _model_limiters[model] = ConcurrencyLimiter(limit)
+        return _model_limiters[model]
+
+
+@contextmanager
+def _concurrency_slot(model: str):
+    # Ordine fisso (modello -> globale) per evitare deadlock
+    model_limiter = _get_model_limiter(model)
+    if model_limiter:
+        model_limiter.acquire()
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            **kwargs 
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Errore nella chiamata LLM testuale: {e}")
-        return f"Errore: {e}"
+        _global_limiter.acquire()
+        try:
+            yield
+        finally:
+            _global_limiter.release()
+    finally:
+        if model_limiter:
+            model_limiter.release()
 
-def get_structured_llm_response(
-    prompt: str, 
-    model: str, 
-    system_prompt: str, 
-    tool_name: str, 
-    tool_schema: dict,
-    temperature: Optional[float] = None,  # <-- Parametro opzionale
-    max_tokens: Optional[int] = None      # <-- Nuovo parametro opzionale
-) -> Optional[str]:
+
+@asynccontextmanager
+async def _aconcurrency_slot(model: str):
+    model_limiter = _get_model_limiter(model)
+    if model_limiter:
+        await model_limiter.acquire_async()
+    try:
+        await _global_limiter.acquire_async()
+        try:
+            yield
+        finally:
+            _global_limiter.release()
+    finally:
+        if model_limiter:
+            model_limiter.release()
+
+
+# --- EVENT LOOP DEL CLIENT ASINCRONO ---
+# Il pool di connessioni httpx di AsyncOpenAI è legato all'event loop su cui viene usato, ma
+# run_async apre (e chiude) un loop nuovo a ogni chiamata e i thread in parallelo ne hanno uno
+# ciascuno: le connessioni riusate da un altro loop falliscono e costano un retry dello scheduler.
+# Le richieste al provider girano quindi tutte su un unico loop di lunga durata (stesso schema
+# di services/async_repository._MongoLoop); il resto (scheduler, slot, telemetria) resta sul loop
+# del chiamante.
+class _LLMLoop:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="llm-async")
+        self._thread.start()
+
+
+_llm_loop = None
+_llm_loop_lock = threading.Lock()
+
+
+def _get_llm_loop() -> _LLMLoop:
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = _LLMLoop()
+        return _llm_loop
+
+
+async def _on_llm_loop(coro_fn):
+    """Esegue coro_fn() sul loop del client e la attende dal loop del chiamante (l'annullamento si propaga)."""
+    llm_loop = _get_llm_loop()
+    if asyncio.get_running_loop() is llm_loop.loop:
+        return await coro_fn()
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro_fn(), llm_loop.loop))
+
+
+def run_async(coro):
     """
-    Invia un prompt forzando un output strutturato tramite la definizione di un tool.
+    Esegue una coroutine da codice sincrono (es. pagine Streamlit o pipeline CLI).
+    Se il thread corrente ha già un event loop attivo, la esegue in un thread dedicato.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def _runner():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    # Il thread eredita il contesto corrente (es. stage e sessione per la telemetria)
+    worker = threading.Thread(target=contextvars.copy_context().run, args=(_runner,))
+    worker.start()
+    worker.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+# --- SINGLE-FLIGHT ---
+# Richieste identiche in volo nello stesso momento (es. più sessioni Streamlit sulla stessa
+# posizione) vengono accorpate: una sola chiamata al provider, risultato condiviso.
+LLM_SINGLE_FLIGHT_ENABLED = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "1") == "1"
 
-    Accetta parametri opzionali come 'temperature' e 'max_tokens'. Se non vengono
-    forniti, non vengono inviati all'API, che utilizzerà i propri valori di default.
 
-    Restituisce gli argomenti della funzione chiamata come stringa JSON.
+class _Flight:
+    def __init__(self):
+        self.done = False
+        self.result = None
+        self.error = None
+        self.event = threading.Event()
+        self.async_waiters = []
+
+
+class SingleFlight:
     """
-    # Controlla se il client è stato inizializzato correttamente
-    if client is None:
-        print("Errore: Il servizio LLM non è configurato a causa di una chiave API mancante.")
-        return None
+    Accorpa le chiamate concorrenti con la stessa chiave: il primo chiamante (leader) esegue
+    la funzione, gli altri attendono e ricevono lo stesso risultato o la stessa eccezione.
+    Funziona tra thread diversi e tra event loop diversi, anche misti.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def _join(self, key: str) -> tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats["coalesced"] += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            self.stats["leaders"] += 1
+            return flight, True
+
+    def _finish(self, key: str, flight: _Flight, result=None, error: BaseException | None = None):
+        with self._lock:
+            del self._flights[key]
+            flight.result, flight.error, flight.done = result, error, True
+            waiters = list(flight.async_waiters)
+        flight.event.set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self._wake_async, future)
+
+    @staticmethod
+    def _wake_async(future):
+        if not future.done():
+            future.set_result(None)
+
+    def _outcome(self, flight: _Flight):
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do(self, key: str, fn):
+        """Versione sincrona: fn() viene eseguita una sola volta per le chiamate concorrenti."""
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self._finish(key, flight, error=e)
+                    raise
+                self._finish(key, flight, result=result)
+                return result
+            flight.event.wait()
+            # Se il leader è stato annullato (task asyncio) il risultato non va condiviso: si riprova
+            if not isinstance(flight.error, asyncio.CancelledError):
+                return self._outcome(flight)
 
-    messages = [
+    async def ado(self, key: str, coro_fn):
+        """Versione asincrona: coro_fn() deve restituire una coroutine."""
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                try:
+                    result = await coro_fn()
+                except BaseException as e:
+                    self._finish(key, flight, error=e)
+                    raise
+                self._finish(key, flight, result=result)
+                return result
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self._lock:
+                if not flight.done:
+                    flight.async_waiters.append((loop, future))
+                else:
+                    future.set_result(None)
+            # Un follower annullato non influisce sul leader né sugli altri follower
+            await future
+            if not isinstance(flight.error, asyncio.CancelledError):
+                return self._outcome(flight)
+
+
+_single_flight = SingleFlight()
+
+
+def _flight_key(kind: str, api_kwargs: dict) -> str:
+    return f"{kind}:{make_cache_key(api_kwargs)}"
+
+
+def _coalesced(kind: str, api_kwargs: dict, fn):
+    if not LLM_SINGLE_FLIGHT_ENABLED:
+        return fn()
+    return _single_flight.do(_flight_key(kind, api_kwargs), fn)
+
+
+async def _acoalesced(kind: str, api_kwargs: dict, coro_fn):
+    if not LLM_SINGLE_FLIGHT_ENABLED:
+        return await coro_fn()
+    return await _single_flight.ado(_flight_key(kind, api_kwargs), coro_fn)
+
+
+def get_single_flight_stats() -> dict:
+    """Chiamate eseguite (leaders) e chiamate accorpate a una già in volo (coalesced)."""
+    return dict(_single_flight.stats)
+
+
+# --- COSTRUZIONE DELLE RICHIESTE ---
+
+def _build_messages(prompt: str, system_prompt: str) -> list:
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": prompt}
     ]
+
+
+def _build_structured_kwargs(
+    prompt: str,
+    model: str,
+    system_prompt: str,
+    tool_name: str,
+    tool_schema: dict,
+    temperature: Optional[float],
+    max_tokens: Optional[int]
+) -> dict:
     tools = [
         {
             "type": "function",
@@ -93,33 +403,303 @@ def get_structured_llm_response(
             }
         }
     ]
-    
+
     # Prepariamo gli argomenti per la chiamata API
     # Iniziamo con quelli obbligatori
     api_kwargs = {
         "model": model,
-        "messages": messages,
+        "messages": _build_messages(prompt, system_prompt),
         "tools": tools,
         "tool_choice": {"type": "function", "function": {"name": tool_name}}
     }
-    
+
     # Aggiungiamo i parametri opzionali SOLO se sono stati forniti
     if temperature is not None:
         api_kwargs['temperature'] = temperature
     if max_tokens is not None:
         api_kwargs['max_tokens'] = max_tokens
-        
+    return api_kwargs
+
+
+def _is_valid_output(value: str, validate=None) -> bool:
+    """'validate' è il controllo del chiamante (es. json.loads): non valido se solleva o restituisce False."""
+    if validate is None:
+        return True
     try:
-        # Usiamo l'unpacking del dizionario (**) per passare tutti gli argomenti
-        response = client.chat.completions.create(**api_kwargs)
-        
-        if response.choices and response.choices[0].message.tool_calls:
-            arguments = response.choices[0].message.tool_calls[0].function.arguments
-            return arguments
-        else:
-            print("Errore: La risposta dell'LLM non ha chiamato la funzione richiesta o è vuota.")
-            return None
+        return validate(value) is not False
+    except Exception:
+        return False
+
+
+def _cache_lookup(api_kwargs: dict, use_cache: bool, stage: str | None = None, validate=None) -> tuple[str | None, str | None]:
+    """Restituisce (chiave, valore in cache). La chiave è None se la cache non va usata."""
+    if not (use_cache and LLM_CACHE_ENABLED):
+        return None, None
+    cache_key = make_cache_key(api_kwargs)
+    cached = response_cache.get(cache_key)
+    if cached is not None and not _is_valid_output(cached, validate):
+        # Voce non utilizzabile dal chiamante (es. JSON troncato salvato in passato): si rigenera
+        response_cache.delete(cache_key)
+        cached = None
+    if cached is not None:
+        llm_telemetry.emit(llm_telemetry.build_record(api_kwargs["model"], cache_hit=True, stage=stage))
+    return cache_key, cached
+
+
+def _cache_store(cache_key: str | None, value: str | None, model: str, validate=None):
+    # Si salvano solo le risposte valide: non vuote e, con 'validate', accettate dal chiamante.
+    # Un output malformato non va in cache, altrimenti ogni nuovo tentativo lo rileggerebbe.
+    if cache_key and value and _is_valid_output(value, validate):
+        response_cache.set(cache_key, value, model)
+
+
+def get_cache_stats() -> dict:
+    """Contatori della cache delle risposte LLM (hit, miss, eviction, occupazione)."""
+    return response_cache.get_stats()
+
+
+def _extract_tool_arguments(response) -> Optional[str]:
+    if response.choices and response.choices[0].message.tool_calls:
+        return response.choices[0].message.tool_calls[0].function.arguments
+    print("Errore: La risposta dell'LLM non ha chiamato la funzione richiesta o è vuota.")
+    return None
+
+
+# --- ESECUZIONE DELLE CHIAMATE ---
+# Unico punto di passaggio verso il provider: budget rpm/tpm e retry (scheduler),
+# poi slot di concorrenza per la sola durata della richiesta.
+
+_MISSING_KEY_MESSAGE = "Il servizio LLM non è configurato a causa di una chiave API mancante."
+
+
+# Ogni chiamata produce un record di telemetria (token, latenza, retry, costo stimato).
+
+def _create_completion(api_kwargs: dict, stage: str | None = None):
+    if client is None:
+        raise LLMConfigurationError(_MISSING_KEY_MESSAGE)
+    model = api_kwargs["model"]
+
+    def _call():
+        with _concurrency_slot(model):
+            return client.chat.completions.create(**api_kwargs)
+
+    stats = {"retries": 0}
+    started = time.perf_counter()
+    try:
+        response = scheduler.run(model, api_kwargs, _call, stats)
+    except LLMServiceError as e:
+        llm_telemetry.emit(llm_telemetry.build_record(model, latency_s=time.perf_counter() - started, retries=stats["retries"], status=type(e).__name__, stage=stage))
+        raise
+    llm_telemetry.emit(llm_telemetry.build_record(model, response.usage, time.perf_counter() - started, stats["retries"], stage=stage))
+    return response
+
+
+async def _acreate_completion(api_kwargs: dict, stage: str | None = None):
+    if async_client is None:
+        raise LLMConfigurationError(_MISSING_KEY_MESSAGE)
+    model = api_kwargs["model"]
+
+    async def _call():
+        async with _aconcurrency_slot(model):
+            return await _on_llm_loop(lambda: async_client.chat.completions.create(**api_kwargs))
 
+    stats = {"retries": 0}
+    started = time.perf_counter()
+    try:
+        response = await scheduler.arun(model, api_kwargs, _call, stats)
+    except LLMServiceError as e:
+        llm_telemetry.emit(llm_telemetry.build_record(model, latency_s=time.perf_counter() - started, retries=stats["retries"], status=type(e).__name__, stage=stage))
+        raise
+    except asyncio.CancelledError:
+        # Es. rami speculativi scartati: la richiesta potrebbe comunque essere stata addebitata
+        llm_telemetry.emit(llm_telemetry.build_record(model, latency_s=time.perf_counter() - started, retries=stats["retries"], status="cancelled", stage=stage))
+        raise
+    llm_telemetry.emit(llm_telemetry.build_record(model, response.usage, time.perf_counter() - started, stats["retries"], stage=stage))
+    return response
+
+
+# --- API SINCRONA ---
+
+def get_llm_response(prompt: str, model: str, system_prompt: str, use_cache: bool = False, stage: str | None = None,
+                     validate=None, **kwargs) -> str:
+    """
+    Invia un prompt per una risposta testuale semplice.
+
+    Con use_cache=True la risposta viene letta/salvata nella cache su disco:
+    da usare solo per chiamate deterministiche (es. temperature=0). Con 'validate'
+    (es. json.loads) vengono salvate e rilette solo le risposte che superano il controllo.
+    'stage' etichetta la chiamata nella telemetria (es. "data_preparation.icp").
+    Richieste identiche già in volo vengono accorpate in un'unica chiamata (single-flight).
+
+    Solleva LLMServiceError (o una sua sottoclasse) se la chiamata fallisce
+    dopo i tentativi previsti dallo scheduler.
+    """
+    api_kwargs = {"model": model, "messages": _build_messages(prompt, system_prompt), **kwargs}
+    cache_key, cached = _cache_lookup(api_kwargs, use_cache, stage, validate)
+    if cached is not None:
+        return cached
+
+    def _fetch() -> str:
+        response = _create_completion(api_kwargs, stage)
+        content = (response.choices[0].message.content or "").strip()
+        _cache_store(cache_key, content, model, validate)
+        return content
+
+    try:
+        return _coalesced("text", api_kwargs, _fetch)
+    except LLMServiceError as e:
+        print(f"Errore nella chiamata LLM testuale: {e}")
+        raise
+
+def stream_llm_response(prompt: str, model: str, system_prompt: str, stage: str | None = None, **kwargs) -> Iterator[str]:
+    """
+    Variante in streaming di get_llm_response: restituisce un generatore che produce
+    i frammenti di testo man mano che arrivano dal modello.
+
+    I retry dello scheduler valgono solo per l'apertura dello stream; un errore a metà
+    generazione viene sollevato come LLMServiceError.
+    """
+    api_kwargs = {
+        "model": model,
+        "messages": _build_messages(prompt, system_prompt),
+        "stream": True,
+        # L'ultimo chunk riporta l'usage, necessario per la telemetria
+        "stream_options": {"include_usage": True},
+        **kwargs
+    }
+    if client is None:
+        raise LLMConfigurationError(_MISSING_KEY_MESSAGE)
+
+    def _open_stream():
+        # Come in _create_completion, lo slot copre solo l'apertura dello stream: non i sleep
+        # di backoff dello scheduler né la lettura, che dipende dal consumatore (es. Streamlit)
+        with _concurrency_slot(model):
+            return client.chat.completions.create(**api_kwargs)
+
+    stats = {"retries": 0}
+    usage = None
+    status = "ok"
+    started = time.perf_counter()
+    try:
+        stream = scheduler.run(model, api_kwargs, _open_stream, stats)
+    except LLMServiceError as e:
+        print(f"Errore nella chiamata LLM in streaming: {e}")
+        llm_telemetry.emit(llm_telemetry.build_record(model, latency_s=time.perf_counter() - started, retries=stats["retries"], status=type(e).__name__, streamed=True, stage=stage))
+        raise
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     except Exception as e:
-        print(f"Errore nella chiamata LLM strutturata: {e}")
-        return None
\ No newline at end of file
+        typed = classify_error(e)
+        status = type(typed).__name__
+        if typed is e:
+            raise
+        print(f"Errore durante lo streaming della risposta LLM: {typed}")
+        raise typed from e
+    finally:
+        # Chiude la connessione anche se il consumatore interrompe la lettura
+        stream.close()
+        llm_telemetry.emit(llm_telemetry.build_record(model, usage, time.perf_counter() - started, stats["retries"], status=status, streamed=True, stage=stage))
+
+def get_structured_llm_response(
+    prompt: str, 
+    model: str, 
+    system_prompt: str, 
+    tool_name: str, 
+    tool_schema: dict,
+    temperature: Optional[float] = None,  # <-- Parametro opzionale
+    max_tokens: Optional[int] = None,     # <-- Nuovo parametro opzionale
+    use_cache: bool = False,
+    stage: str | None = None,
+    validate=None
+) -> Optional[str]:
+    """
+    Invia un prompt forzando un output strutturato tramite la definizione di un tool.
+
+    Accetta parametri opzionali come 'temperature' e 'max_tokens'. Se non vengono
+    forniti, non vengono inviati all'API, che utilizzerà i propri valori di default.
+
+    Con use_cache=True l'output viene letto/salvato nella cache su disco; con 'validate'
+    (es. Modello.model_validate_json) solo se supera la validazione del chiamante.
+
+    Restituisce gli argomenti della funzione chiamata come stringa JSON,
+    oppure None se la chiamata fallisce dopo i tentativi dello scheduler.
+    """
+    api_kwargs = _build_structured_kwargs(prompt, model, system_prompt, tool_name, tool_schema, temperature, max_tokens)
+    cache_key, cached = _cache_lookup(api_kwargs, use_cache, stage, validate)
+    if cached is not None:
+        return cached
+
+    def _fetch() -> Optional[str]:
+        response = _create_completion(api_kwargs, stage)
+        arguments = _extract_tool_arguments(response)
+        _cache_store(cache_key, arguments, model, validate)
+        return arguments
+
+    try:
+        return _coalesced("tool", api_kwargs, _fetch)
+    except LLMServiceError as e:
+        print(f"Errore nella chiamata LLM strutturata ({type(e).__name__}): {e}")
+        return None
+
+
+# --- API ASINCRONA ---
+# Gemelle delle funzioni sincrone: stessi parametri e stesso contratto di ritorno.
+# Permettono di lanciare in parallelo chiamate indipendenti con asyncio.gather.
+
+async def aget_llm_response(prompt: str, model: str, system_prompt: str, use_cache: bool = False, stage: str | None = None,
+                            validate=None, **kwargs) -> str:
+    """
+    Versione asincrona di get_llm_response.
+    """
+    api_kwargs = {"model": model, "messages": _build_messages(prompt, system_prompt), **kwargs}
+    cache_key, cached = _cache_lookup(api_kwargs, use_cache, stage, validate)
+    if cached is not None:
+        return cached
+
+    async def _fetch() -> str:
+        response = await _acreate_completion(api_kwargs, stage)
+        content = (response.choices[0].message.content or "").strip()
+        _cache_store(cache_key, content, model, validate)
+        return content
+
+    try:
+        return await _acoalesced("text", api_kwargs, _fetch)
+    except LLMServiceError as e:
+        print(f"Errore nella chiamata LLM testuale (async): {e}")
+        raise
+
+async def aget_structured_llm_response(
+    prompt: str,
+    model: str,
+    system_prompt: str,
+    tool_name: str,
+    tool_schema: dict,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    use_cache: bool = False,
+    stage: str | None = None,
+    validate=None
+) -> Optional[str]:
+    """
+    Versione asincrona di get_structured_llm_response.
+    """
+    api_kwargs = _build_structured_kwargs(prompt, model, system_prompt, tool_name, tool_schema, temperature, max_tokens)
+    cache_key, cached = _cache_lookup(api_kwargs, use_cache, stage, validate)
+    if cached is not None:
+        return cached
+
+    async def _fetch() -> Optional[str]:
+        response = await _acreate_completion(api_kwargs, stage)
+        arguments = _extract_tool_arguments(response)
+        _cache_store(cache_key, arguments, model, validate)
+        return arguments
+
+    try:
+        return await _acoalesced("tool", api_kwargs, _fetch)
+    except LLMServiceError as e:
+        print(f"Errore nella chiamata LLM strutturata (async, {type(e).__name__}): {e}")
+        return None
@@ -0,0 +1,236 @@
+# interviewer/llm_telemetry.py
+
+import os
+import json
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from collections import defaultdict
+
+# --- CONFIGURAZIONE ---
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# "jsonl" (default), "mongo" oppure "none"
+LLM_TELEMETRY_SINK = os.getenv("LLM_TELEMETRY_SINK", "jsonl")
+LLM_TELEMETRY_PATH = os.getenv("LLM_TELEMETRY_PATH", os.path.join(PROJECT_ROOT, "data", "telemetry", "llm_calls.jsonl"))
+LLM_TELEMETRY_COLLECTION = "llm_telemetry"
+
+# Prezzi in USD per milione di token: (input, input in cache, output)
+MODEL_PRICING_PER_MILLION = {
+    "gpt-4.1-2025-04-14": (2.00, 0.50, 8.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+# Le richieste inviate tramite Batch API costano la metà
+BATCH_PRICE_MULTIPLIER = 0.5
+
+# --- CONTESTO DELLA CHIAMATA ---
+# Stage e identificativi vengono propagati implicitamente (thread e task asyncio)
+# così i moduli di business non devono passarli a ogni chiamata LLM.
+_call_context = contextvars.ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def llm_context(stage: str | None = None, session_id: str | None = None, position_id: str | None = None):
+    """Etichetta tutte le chiamate LLM eseguite nel blocco con stage e id di sessione/posizione."""
+    updates = {k: v for k, v in {"stage": stage, "session_id": session_id, "position_id": position_id}.items() if v}
+    token = _call_context.set({**_call_context.get(), **updates})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_context() -> dict:
+    return dict(_call_context.get())
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    input_price, cached_price, output_price = MODEL_PRICING_PER_MILLION.get(model, (0.0, 0.0, 0.0))
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    cost = uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price
+    return round(cost / 1_000_000, 6)
+
+
+def build_record(model: str, usage=None, latency_s: float = 0.0, retries: int = 0,
+                 status: str = "ok", cache_hit: bool = False, streamed: bool = False,
+                 stage: str | None = None, batch: bool = False) -> dict:
+    """
+    Crea il record di telemetria di una chiamata, arricchito con il contesto corrente.
+    Lo stage esplicito ha la precedenza su quello del contesto.
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    context = current_context()
+    cost = 0.0 if cache_hit else estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "model": model,
+        "stage": stage or context.get("stage", "unknown"),
+        "session_id": context.get("session_id"),
+        "position_id": context.get("position_id"),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "latency_s": round(latency_s, 4),
+        "retries": retries,
+        "status": status,
+        "cache_hit": cache_hit,
+        "streamed": streamed,
+        "batch": batch,
+        "cost_usd": round(cost * BATCH_PRICE_MULTIPLIER, 6) if batch else cost,
+    }
+
+
+# --- SINK ---
+
+class JsonlTelemetrySink:
+    """Scrive un record per riga in un file JSONL locale."""
+
+    def __init__(self, path: str = LLM_TELEMETRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def read(self, **filters) -> list:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if all(record.get(k) == v for k, v in filters.items()):
+                    records.append(record)
+        return records
+
+
+class MongoTelemetrySink:
+    """
+    Salva i record in una collection MongoDB. Gli insert avvengono su un thread
+    in background per non aggiungere latenza di rete alle chiamate LLM.
+    """
+
+    def __init__(self, collection_name: str = LLM_TELEMETRY_COLLECTION):
+        self.collection_name = collection_name
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._drain, daemon=True)
+        self._worker.start()
+
+    def _collection(self):
+        from services.data_manager import db
+        return db[self.collection_name] if db is not None else None
+
+    def _drain(self):
+        while True:
+            record = self._queue.get()
+            try:
+                collection = self._collection()
+                if collection is not None:
+                    collection.insert_one(record)
+            except Exception as e:
+                print(f"[LLM TELEMETRY] Errore nel salvataggio su MongoDB: {e}")
+            finally:
+                self._queue.task_done()
+
+    def write(self, record: dict):
+        self._queue.put(dict(record))
+
+    def read(self, **filters) -> list:
+        collection = self._collection()
+        if collection is None:
+            return []
+        return list(collection.find(filters, {"_id": 0}))
+
+
+class NullTelemetrySink:
+    def write(self, record: dict):
+        pass
+
+    def read(self, **filters) -> list:
+        return []
+
+
+def _default_sink():
+    if LLM_TELEMETRY_SINK == "mongo":
+        return MongoTelemetrySink()
+    if LLM_TELEMETRY_SINK == "none":
+        return NullTelemetrySink()
+    return JsonlTelemetrySink()
+
+
+_sink = _default_sink()
+
+
+def set_telemetry_sink(sink):
+    """Sostituisce il sink (qualsiasi oggetto con write(record) e read(**filters))."""
+    global _sink
+    _sink = sink
+
+
+def get_telemetry_sink():
+    return _sink
+
+
+def emit(record: dict):
+    try:
+        _sink.write(record)
+    except Exception as e:
+        # La telemetria non deve mai far fallire una chiamata LLM
+        print(f"[LLM TELEMETRY] Record non salvato: {e}")
+
+
+# --- AGGREGAZIONE ---
+
+def aggregate(records: list, group_by: str) -> dict:
+    """
+    Raggruppa i record per il campo indicato (es. 'stage', 'session_id', 'model')
+    e somma chiamate, token, latenza, retry e costo stimato.
+    """
+    totals = defaultdict(lambda: {
+        "calls": 0, "cache_hits": 0, "errors": 0, "retries": 0,
+        "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+        "latency_s": 0.0, "cost_usd": 0.0,
+    })
+    for record in records:
+        bucket = totals[record.get(group_by) or "unknown"]
+        bucket["calls"] += 1
+        bucket["cache_hits"] += int(bool(record.get("cache_hit")))
+        bucket["errors"] += int(record.get("status", "ok") != "ok")
+        for field in ("retries", "prompt_tokens", "completion_tokens", "cached_tokens", "latency_s", "cost_usd"):
+            bucket[field] += record.get(field) or 0
+    for bucket in totals.values():
+        bucket["latency_s"] = round(bucket["latency_s"], 3)
+        bucket["cost_usd"] = round(bucket["cost_usd"], 6)
+        bucket["avg_latency_s"] = round(bucket["latency_s"] / bucket["calls"], 3) if bucket["calls"] else 0.0
+    # Ordinato per latenza totale: in cima gli stage che dominano il tempo
+    return dict(sorted(totals.items(), key=lambda item: item[1]["latency_s"], reverse=True))
+
+
+def get_session_breakdown(session_id: str) -> dict:
+    """Ripartizione per stage delle chiamate di una sessione candidato."""
+    return aggregate(_sink.read(session_id=session_id), "stage")
+
+
+def get_position_breakdown(position_id: str) -> dict:
+    """Ripartizione per stage delle chiamate legate a una posizione (data preparation)."""
+    return aggregate(_sink.read(position_id=position_id), "stage")
+
+
+def get_stage_breakdown() -> dict:
+    """Ripartizione per stage su tutti i record disponibili."""
+    return aggregate(_sink.read(), "stage")
+
+
+def get_sessions_breakdown() -> dict:
+    """Totali per sessione su tutti i record disponibili."""
+    return aggregate(_sink.read(), "session_id")
@@ -88,6 +88,8 @@ def create_guidance_prompt(step_title: str, criteria: str, skills_to_test: str,
         "Non esagerare con le informazioni; guida per far emergere le evidenze."    
     )
 
+CLASSIFICATION_SYSTEM_PROMPT = "Sei un classificatore di testo estremamente preciso e letterale. Il tuo unico scopo è restituire una delle due opzioni fornite."
+
 def create_input_classification_prompt(user_input: str) -> str:
     """
     Crea un prompt iper-semplificato per classificare l'input dell'utente.
@@ -115,5 +117,38 @@ def create_answer_to_candidate_question_prompt(case_text: str, current_step_desc
         "Formula la tua risposta."
     )
 
+def create_turn_planner_prompt(user_input: str, step_context: str, criteria: str, skills_to_test: str, recent_history_text: str, options_text: str) -> str:
+    """
+    Crea il prompt del "turn planner": in un'unica chiamata classifica l'input, valuta lo step
+    corrente e sceglie lo step successivo (sostituisce classificazione, valutazione e selezione).
+    """
+    return (
+        "Analizza l'ultimo messaggio del candidato e prendi TRE decisioni per il turno corrente del colloquio.\n\n"
+        "1. input_type: 'question' se il messaggio è una domanda che chiede informazioni, dati o chiarimenti relativi al caso di studio; "
+        "'answer' se è una risposta, un commento o una domanda non pertinente al caso. Non farti ingannare da verbi come chiedo o chiederei "
+        "usati in modo discorsivo; il punto di domanda è un buon indicatore ma non infallibile.\n"
+        "2. step_accomplished: solo se input_type è 'answer'. VERO se (A) il criterio dello step è soddisfatto O (B) il candidato ha fornito "
+        "evidenze sufficienti per valutare le skill target e ulteriori domande probabilmente non porterebbero nuove evidenze (saturazione). "
+        "Non essere eccessivamente severo, ricorda che stai interagendo con una persona. Se input_type è 'question' restituisci false.\n"
+        "3. next_step_id: l'ID dell'argomento più naturale e logico da affrontare dopo lo step corrente, scelto tra gli ARGOMENTI DISPONIBILI "
+        "considerando se il candidato ha già accennato a uno di questi temi. Se non ci sono argomenti disponibili restituisci null.\n\n"
+        f"--- Contesto dello Step Attuale ---\n{step_context}\n\n"
+        f"--- Criterio Specifico da Verificare (Accomplishment Criteria) ---\n'{criteria}'\n\n"
+        f"--- Skill da Verificare (uso interno) ---\n[{skills_to_test or 'N/D'}]\n\n"
+        f"--- ARGOMENTI DISPONIBILI ---\n{options_text or 'Nessuno'}\n\n"
+        f"--- Conversazione Recente ---\n{recent_history_text}\n\n"
+        f"--- Ultimo Messaggio del Candidato ---\n\"{user_input}\""
+    )
+
+def create_step_summary_prompt(step_title: str, transcript_text: str) -> str:
+    """Crea il prompt per riassumere uno step concluso (memoria della conversazione)."""
+    return (
+        f"Riassumi in modo fattuale la parte di colloquio relativa allo step '{step_title}'. "
+        "Riporta le idee, le decisioni e gli esempi concreti forniti dal candidato, i dati o chiarimenti ricevuti "
+        "e gli eventuali punti rimasti scoperti. Non esprimere giudizi e non aggiungere informazioni. "
+        "Massimo 80 parole, in un unico paragrafo.\n\n"
+        f"--- Conversazione dello step ---\n{transcript_text}"
+    )
+
 SUCCESSFUL_FINISH_MESSAGE = "Ottimo, direi che abbiamo toccato tutti i punti chiave. La tua analisi è stata molto completa. Grazie mille per il tuo tempo, il colloquio è terminato. Adesso procederemo a valutare il tuo esercizio, per poi ritornare da te con un responso."
 FORCED_FINISH_MESSAGE = "Ok, direi che per questo punto possiamo fermarci qui. Grazie comunque per le tue riflessioni. Il colloquio è concluso."
\ No newline at end of file
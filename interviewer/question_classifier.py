@@ -0,0 +1,218 @@
+# interviewer/question_classifier.py
+
+import os
+import sys
+import json
+import glob
+import time
+import threading
+import statistics
+
+# --- CONFIGURAZIONE ---
+# Classificatore locale domanda/risposta: embedding sentence-transformers + testa lineare
+# (regressione logistica). Se la confidenza è sotto soglia il chatbot usa l'LLM.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+QUESTION_CLASSIFIER_ENABLED = os.getenv("QUESTION_CLASSIFIER_ENABLED", "1") == "1"
+QUESTION_CLASSIFIER_PATH = os.getenv("QUESTION_CLASSIFIER_PATH", os.path.join(PROJECT_ROOT, "data", "models", "question_classifier.joblib"))
+# Modello multilingue già usato dalla recruitment suite (i messaggi sono in italiano)
+QUESTION_CLASSIFIER_EMBEDDING_MODEL = os.getenv("QUESTION_CLASSIFIER_EMBEDDING_MODEL", "paraphrase-multilingual-mpnet-base-v2")
+QUESTION_CLASSIFIER_THRESHOLD = float(os.getenv("QUESTION_CLASSIFIER_THRESHOLD", "0.85"))
+
+TRANSCRIPTS_GLOB = os.path.join(PROJECT_ROOT, "output", "*.json*")
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "question_classifier_examples.json")
+
+
+class LocalQuestionClassifier:
+    """
+    Carica in modo pigro il modello di embedding e la testa lineare salvata su disco.
+    Se il modello non è stato addestrato o le dipendenze mancano, predict() restituisce None.
+    """
+
+    def __init__(self, path: str = QUESTION_CLASSIFIER_PATH, threshold: float = QUESTION_CLASSIFIER_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._encoder = None
+        self._head = None
+        self.stats = {"local": 0, "fallback": 0}
+
+    def _load(self) -> bool:
+        with self._lock:
+            if self._loaded:
+                return self._head is not None
+            self._loaded = True
+            if not os.path.exists(self.path):
+                print(f"[QUESTION CLASSIFIER] Modello non trovato in '{self.path}': uso l'LLM.")
+                return False
+            try:
+                import joblib
+                from sentence_transformers import SentenceTransformer
+                bundle = joblib.load(self.path)
+                self._encoder = SentenceTransformer(bundle["embedding_model"], device="cpu")
+                self._head = bundle["head"]
+                print(f"[QUESTION CLASSIFIER] Modello locale caricato ({bundle['embedding_model']}, {bundle.get('n_samples', '?')} esempi).")
+            except Exception as e:
+                print(f"[QUESTION CLASSIFIER] Impossibile caricare il modello locale: {e}")
+                self._encoder, self._head = None, None
+            return self._head is not None
+
+    def predict_proba(self, text: str) -> float | None:
+        """Probabilità che il testo sia una domanda sul caso, None se il modello non è disponibile."""
+        if not self._load():
+            return None
+        embedding = self._encoder.encode([text], normalize_embeddings=True)
+        return float(self._head.predict_proba(embedding)[0][1])
+
+    def predict(self, text: str) -> bool | None:
+        """
+        Restituisce True/False se la confidenza supera la soglia, altrimenti None
+        (il chiamante deve ricorrere all'LLM).
+        """
+        proba = self.predict_proba(text)
+        if proba is None or max(proba, 1 - proba) < self.threshold:
+            self.stats["fallback"] += 1
+            return None
+        self.stats["local"] += 1
+        return proba >= 0.5
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_question_classifier() -> LocalQuestionClassifier | None:
+    global _classifier
+    if not QUESTION_CLASSIFIER_ENABLED:
+        return None
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = LocalQuestionClassifier()
+        return _classifier
+
+
+# --- DATASET ---
+
+def load_transcript_messages(pattern: str = TRANSCRIPTS_GLOB) -> list:
+    """Messaggi del candidato estratti dalle trascrizioni in output/ (JSONL o vecchi dump JSON)."""
+    from .transcript import read_transcript
+    messages = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            history = read_transcript(path)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"  - File '{path}' ignorato: {e}")
+            continue
+        messages.extend(m["content"] for m in history if m.get("role") == "user" and m.get("content"))
+    return messages
+
+
+def load_labelled_examples(path: str = EXAMPLES_PATH) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [(item["text"], bool(item["is_question"])) for item in json.load(f)]
+
+
+def llm_label(text: str) -> bool:
+    """Etichetta di riferimento: la stessa chiamata LLM usata dal chatbot (con cache)."""
+    from .chatbot import SmartCaseStudyChatbot
+    from .llm_service import get_llm_response
+    from . import prompts
+    response = get_llm_response(
+        prompt=prompts.create_input_classification_prompt(text),
+        model=SmartCaseStudyChatbot.CLASSIFICATION_MODEL,
+        system_prompt=prompts.CLASSIFICATION_SYSTEM_PROMPT,
+        temperature=0.0,
+        max_tokens=10,
+        use_cache=True,
+        stage="interview.classify.labelling"
+    )
+    return "DOMANDA_SUL_CASO" in response.upper()
+
+
+def build_dataset() -> tuple[list, list]:
+    """Esempi etichettati a mano + messaggi delle conversazioni etichettati dall'LLM."""
+    examples = load_labelled_examples()
+    known = {text for text, _ in examples}
+    transcript_messages = [m for m in dict.fromkeys(load_transcript_messages()) if m not in known]
+    print(f"Etichettatura di {len(transcript_messages)} messaggi delle conversazioni tramite LLM...")
+    examples.extend((text, llm_label(text)) for text in transcript_messages)
+    texts = [text for text, _ in examples]
+    labels = [int(label) for _, label in examples]
+    return texts, labels
+
+
+# --- CLI ---
+
+def train(output_path: str = QUESTION_CLASSIFIER_PATH, embedding_model: str = QUESTION_CLASSIFIER_EMBEDDING_MODEL):
+    import joblib
+    from sentence_transformers import SentenceTransformer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import cross_val_score
+
+    texts, labels = build_dataset()
+    print(f"Dataset: {len(texts)} esempi ({sum(labels)} domande, {len(labels) - sum(labels)} risposte).")
+    encoder = SentenceTransformer(embedding_model, device="cpu")
+    embeddings = encoder.encode(texts, normalize_embeddings=True, show_progress_bar=True)
+
+    head = LogisticRegression(max_iter=1000, class_weight="balanced")
+    folds = min(5, min(sum(labels), len(labels) - sum(labels)))
+    if folds >= 2:
+        scores = cross_val_score(head, embeddings, labels, cv=folds)
+        print(f"Accuratezza in cross-validation ({folds} fold): {scores.mean():.3f} ± {scores.std():.3f}")
+    head.fit(embeddings, labels)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    joblib.dump({"embedding_model": embedding_model, "head": head, "n_samples": len(texts)}, output_path)
+    print(f"Modello salvato in '{output_path}'.")
+
+
+def evaluate(threshold: float = QUESTION_CLASSIFIER_THRESHOLD):
+    """Confronta classificatore locale ed LLM sui messaggi delle conversazioni salvate."""
+    classifier = LocalQuestionClassifier(threshold=threshold)
+    messages = list(dict.fromkeys(load_transcript_messages()))
+    if not messages:
+        print("Nessun messaggio trovato nelle trascrizioni in output/.")
+        return
+    if classifier.predict_proba(messages[0]) is None:
+        print("Modello locale non disponibile: eseguire prima 'train'.")
+        return
+
+    local_latencies, llm_latencies = [], []
+    agree = confident = confident_agree = 0
+    for text in messages:
+        started = time.perf_counter()
+        proba = classifier.predict_proba(text)
+        local_latencies.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        reference = llm_label(text)
+        llm_latencies.append(time.perf_counter() - started)
+
+        predicted = proba >= 0.5
+        agree += predicted == reference
+        if max(proba, 1 - proba) >= threshold:
+            confident += 1
+            confident_agree += predicted == reference
+
+    def _ms(values, q):
+        return 1000 * statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else 1000 * values[0]
+
+    total = len(messages)
+    print("\n" + "=" * 50 + "\nVALUTAZIONE CLASSIFICATORE LOCALE vs LLM\n" + "=" * 50)
+    print(f"Messaggi valutati: {total}")
+    print(f"Accordo complessivo: {agree / total:.1%}")
+    print(f"Copertura locale (confidenza >= {threshold}): {confident / total:.1%}")
+    if confident:
+        print(f"Accordo sui casi gestiti localmente: {confident_agree / confident:.1%}")
+    print(f"Latenza locale: p50 {_ms(local_latencies, 50):.1f} ms, p95 {_ms(local_latencies, 95):.1f} ms")
+    # Le etichette LLM sono in cache dopo il primo giro: la latenza reale va misurata a cache vuota
+    print(f"Latenza LLM: p50 {_ms(llm_latencies, 50):.1f} ms, p95 {_ms(llm_latencies, 95):.1f} ms")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "train":
+        train()
+    elif command == "eval":
+        evaluate(float(sys.argv[2]) if len(sys.argv) > 2 else QUESTION_CLASSIFIER_THRESHOLD)
+    else:
+        print("Uso: python -m interviewer.question_classifier train | eval [soglia]")
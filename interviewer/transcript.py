@@ -0,0 +1,127 @@
+# interviewer/transcript.py
+
+import os
+import json
+import threading
+from datetime import datetime
+
+# --- CONFIGURAZIONE ---
+# Trascrizione append-only del colloquio: ogni turno viene scritto appena concluso.
+# Se il chatbot conosce il session_id il turno viene sempre accodato al blob 'conversation'
+# della sessione MongoDB (è l'input della valutazione): il sink decide solo la copia locale.
+#   "jsonl" / "both" -> anche una riga JSONL in output/ (default "both")
+#   "mongo" / "none" -> nessun file locale
+INTERVIEW_TRANSCRIPT_SINK = os.getenv("INTERVIEW_TRANSCRIPT_SINK", "both")
+TRANSCRIPT_DIR = os.getenv("INTERVIEW_TRANSCRIPT_DIR", "output")
+
+
+class TranscriptWriter:
+    """
+    Scrive i messaggi di ciascun turno in coda alla trascrizione. Ogni scrittura costa
+    quanto un turno (non quanto l'intera conversazione) e un crash non perde i turni già chiusi.
+    """
+
+    def __init__(self, case_id: str, session_id: str | None = None, sink: str = INTERVIEW_TRANSCRIPT_SINK,
+                 path: str | None = None, turns: int = 0, pending_mongo: list | None = None):
+        self.case_id = case_id
+        self.session_id = session_id
+        self.sink = sink
+        self.path = path
+        self.turns = turns
+        # Righe non ancora salvate su MongoDB (scrittura fallita): riprovate al turno successivo
+        self.pending_mongo = list(pending_mongo or [])
+        self._lock = threading.Lock()
+
+    def _jsonl_path(self) -> str:
+        if self.path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.path = os.path.join(TRANSCRIPT_DIR, f"{self.case_id}_{timestamp}.jsonl")
+        return self.path
+
+    def _write_jsonl(self, entries: list):
+        path = self._jsonl_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _push_mongo(self, entries: list):
+        from services.data_manager import sessions_collection, append_stage_items
+        if sessions_collection is None or not self.session_id:
+            return
+        # Prima le righe rimaste in sospeso, così l'ordine dei turni resta quello del colloquio
+        entries = self.pending_mongo + entries
+        try:
+            # La conversazione vive nella collection dei blob: il documento di sessione ne tiene solo il riferimento
+            append_stage_items(self.session_id, "conversation", entries)
+            self.pending_mongo = []
+        except Exception as e:
+            self.pending_mongo = entries
+            print(f"\n[ERRORE] Impossibile salvare il turno su MongoDB ({len(entries)} righe in sospeso): {e}")
+
+    def record_turn(self, messages: list, latency_s: float | None = None, step_id: int | None = None):
+        """
+        Accoda i messaggi di un turno concluso. La latenza (tempo di generazione della
+        risposta, quasi interamente chiamate LLM) viene associata al messaggio dell'assistente.
+        """
+        if not messages:
+            return
+        with self._lock:
+            self.turns += 1
+            timestamp = datetime.now().isoformat(timespec="milliseconds")
+            entries = []
+            for message in messages:
+                entry = {**message, "turn": self.turns, "step_id": step_id, "ts": timestamp}
+                if message["role"] == "assistant" and latency_s is not None:
+                    entry["latency_s"] = round(latency_s, 3)
+                entries.append(entry)
+            # La trascrizione non deve mai far fallire il colloquio
+            if self.sink in ("jsonl", "both"):
+                try:
+                    self._write_jsonl(entries)
+                except OSError as e:
+                    print(f"\n[ERRORE] Impossibile scrivere la trascrizione locale: {e}")
+            self._push_mongo(entries)
+
+    def reconcile_mongo(self, messages: list) -> bool:
+        """
+        Allinea stages.conversation alla cronologia completa del chatbot (da chiamare prima
+        della valutazione). Se il blob non coincide con i messaggi (turni persi o duplicati
+        da un retry) viene riscritto per intero; altrimenti resta com'è, con i metadati dei turni.
+        """
+        from services.data_manager import sessions_collection, load_stage_blob, save_stage_output
+        if sessions_collection is None or not self.session_id:
+            return False
+        with self._lock:
+            stored = load_stage_blob(self.session_id, "conversation") or []
+            if [(m.get("role"), m.get("content")) for m in stored] == [(m["role"], m["content"]) for m in messages]:
+                self.pending_mongo = []
+                return True
+            print(f"[INFO] Conversazione su MongoDB non allineata ({len(stored)} righe, {len(messages)} messaggi): la riscrivo.")
+            save_stage_output(self.session_id, "conversation", [dict(m) for m in messages])
+            self.pending_mongo = []
+            return True
+
+    def to_state(self) -> dict:
+        return {"session_id": self.session_id, "path": self.path, "turns": self.turns, "pending_mongo": list(self.pending_mongo)}
+
+    @classmethod
+    def from_state(cls, case_id: str, state: dict) -> "TranscriptWriter":
+        return cls(case_id, session_id=state.get("session_id"), path=state.get("path"), turns=state.get("turns", 0),
+                   pending_mongo=state.get("pending_mongo"))
+
+
+def conversation_messages(entries: list) -> list:
+    """
+    Solo ruolo e testo dei messaggi: le righe della trascrizione hanno anche turno, step,
+    timestamp e latenza, che non devono arrivare ai prompt di valutazione.
+    """
+    return [{"role": entry["role"], "content": entry["content"]} for entry in entries or []]
+
+
+def read_transcript(path: str) -> list:
+    """Legge una trascrizione (JSONL append-only o vecchio dump JSON) come lista di messaggi."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
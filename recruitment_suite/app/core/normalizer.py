@@ -116,7 +116,10 @@ class CVNormalizer:
                 model=settings.LLM_MODEL,
                 system_prompt=settings.LLM_PROMPT_CV_EXTRACTION_NORM,
                 temperature=0.0,
-                max_tokens=2000
+                max_tokens=2000,
+                use_cache=True,
+                validate=json.loads,
+                stage="market.cv_normalization"
             )
             structured_data = json.loads(raw)
             if not structured_data.get("experience"):
@@ -136,7 +139,10 @@ class CVNormalizer:
                 model=settings.LLM_MODEL,
                 system_prompt=settings.LLM_PROMPT_CV_EXTRACTION_NORM,
                 temperature=0.0,
-                max_tokens=2000
+                max_tokens=2000,
+                use_cache=True,
+                validate=json.loads,
+                stage="market.cv_normalization"
             )
             structured_data = json.loads(raw)
             if not structured_data.get("experience"):
@@ -207,7 +213,10 @@ class CVNormalizer:
                     model=settings.LLM_MODEL,
                     system_prompt="Sei un esperto di semantica HR.",
                     temperature=0.15,
-                    max_tokens=800
+                    max_tokens=800,
+                    use_cache=True,
+                    validate=json.loads,
+                    stage="market.cv_enrichment"
                 )
                 enriched_text = json.loads(raw).get("enriched_text")
                 if enriched_text:
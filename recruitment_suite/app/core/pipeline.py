@@ -8,7 +8,8 @@ import openai
 from pydantic import ValidationError
 from sentence_transformers import SentenceTransformer, util
 from tqdm import tqdm
-from interviewer.llm_service import get_structured_llm_response
+from interviewer.llm_service import get_structured_llm_response, LLMServiceError
+from interviewer.llm_batch import build_structured_request, run_batch
 from recruitment_suite.app.models.schemas import EvaluationResponse
 from recruitment_suite.config import settings
 
@@ -23,7 +24,7 @@ class RecruitmentPipeline:
         candidate_embedding = self.embedding_model.encode(candidate_exp_text, convert_to_tensor=True)
         return util.cos_sim(self.offer_embedding, candidate_embedding).item()
 
-    def _get_llm_evaluation_for_batch(self, offer_title: str, offer_desc: str, batch_dossiers: list[dict]) -> list[dict]:
+    def _build_evaluation_prompts(self, offer_title: str, offer_desc: str, batch_dossiers: list[dict]) -> tuple[str, str]:
         profiles_text = "".join([
             f"\n--- CANDIDATO {c['original_index']+1} ---\nID: {c['id']}\nSCORE: {c['score']:.4f}\n"
             f"POSIZIONE: {c['current_position']}\nDESCRIZIONE: {c['enriched_description']}\n-----------------------\n"
@@ -37,7 +38,10 @@ class RecruitmentPipeline:
             f"**ISTRUZIONI**\nAnalizza ogni candidato e produci un JSON. La chiave 'results' deve contenere una lista di oggetti, uno per ogni candidato. "
             f"Ogni oggetto deve avere i campi 'ID' (intero), 'scartato' (boolean) e 'motivazione' (stringa max 20 parole)."
         )
+        return system_prompt, user_prompt
 
+    def _get_llm_evaluation_for_batch(self, offer_title: str, offer_desc: str, batch_dossiers: list[dict]) -> list[dict]:
+        system_prompt, user_prompt = self._build_evaluation_prompts(offer_title, offer_desc, batch_dossiers)
         try:
             structured = get_structured_llm_response(
                 prompt=user_prompt,
@@ -46,7 +50,8 @@ class RecruitmentPipeline:
                 tool_name="save_evaluations",
                 tool_schema=EvaluationResponse.model_json_schema(),
                 temperature=0.2, 
-                max_tokens=30000
+                max_tokens=30000,
+                stage="market.screening"
             )
             if not structured:
                 return []
@@ -56,6 +61,39 @@ class RecruitmentPipeline:
             print(f"ERRORE durante la chiamata LLM per un batch: {e}. Il batch sarà saltato.")
             return []
 
+    def _get_llm_evaluations_via_batch_api(self, offer_title: str, offer_desc: str, batches: list[list[dict]]) -> list[dict]:
+        """Invia tutti i batch di candidati in un unico job della Batch API e ne raccoglie i risultati."""
+        requests = []
+        for i, batch in enumerate(batches):
+            system_prompt, user_prompt = self._build_evaluation_prompts(offer_title, offer_desc, batch)
+            requests.append(build_structured_request(
+                custom_id=f"screening-{i}",
+                prompt=user_prompt,
+                model=settings.LLM_MODEL,
+                system_prompt=system_prompt,
+                tool_name="save_evaluations",
+                tool_schema=EvaluationResponse.model_json_schema(),
+                temperature=0.2,
+                max_tokens=30000
+            ))
+        try:
+            outputs = run_batch(requests, job_name=f"screening-{int(time.time())}", stage="market.screening")
+        except LLMServiceError as e:
+            print(f"ERRORE durante il job batch di screening: {e}")
+            return []
+
+        all_results = []
+        for i in range(len(batches)):
+            structured = outputs.get(f"screening-{i}")
+            if not structured:
+                print(f"--> Batch {i+1} senza risultati, sarà saltato.")
+                continue
+            try:
+                all_results.extend(json.loads(structured).get("results", []))
+            except json.JSONDecodeError as e:
+                print(f"ERRORE nel parsing del batch {i+1}: {e}. Il batch sarà saltato.")
+        return all_results
+
     def run_full_pipeline(self, offer_title: str, offer_desc: str, candidates_data: list[dict]):
         offer_full_text = f"{offer_title} {offer_desc}".strip()
         print("Creazione embedding per l'offerta di lavoro...")
@@ -84,6 +122,11 @@ class RecruitmentPipeline:
         
         all_llm_results = []
         num_batches = math.ceil(len(dossiers_for_llm) / settings.BATCH_SIZE)
+        if settings.USE_BATCH_API:
+            batches = [dossiers_for_llm[i * settings.BATCH_SIZE:(i + 1) * settings.BATCH_SIZE] for i in range(num_batches)]
+            print(f"--> Invio di {num_batches} batch tramite Batch API...")
+            all_llm_results = self._get_llm_evaluations_via_batch_api(offer_title, offer_desc, batches)
+            num_batches = 0
         for i in range(num_batches):
             start_index, end_index = i * settings.BATCH_SIZE, (i + 1) * settings.BATCH_SIZE
             batch = dossiers_for_llm[start_index:end_index]
@@ -3,10 +3,10 @@
 
 import json
 from recruitment_suite.config import settings
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, LLMServiceError
 
 
-def generate_qualitative_llm_report(candidate_json: dict, market_json: dict, job_offer_text: str) -> str:
+def generate_qualitative_llm_report(candidate_json: dict, market_json: dict, job_offer_text: str) -> str | None:
     """
     Usa un LLM per generare un report qualitativo che confronta la carriera di un
     candidato con i trend di mercato, contestualizzandolo rispetto all'offerta di lavoro.
@@ -62,10 +62,15 @@ def generate_qualitative_llm_report(candidate_json: dict, market_json: dict, job
         candidate_data=json.dumps(candidate_json, indent=2, ensure_ascii=False)
     )
 
-    return get_llm_response(
-        prompt=user_prompt,
-        model=settings.LLM_MODEL,
-        system_prompt=system_prompt,
-        temperature=0.4,
-        max_tokens=1000
-    )
\ No newline at end of file
+    try:
+        return get_llm_response(
+            prompt=user_prompt,
+            model=settings.LLM_MODEL,
+            system_prompt=system_prompt,
+            temperature=0.4,
+            max_tokens=1000,
+            stage="market.qualitative_report"
+        )
+    except LLMServiceError as e:
+        print(f"ERRORE durante la generazione del report qualitativo: {e}")
+        return None
\ No newline at end of file
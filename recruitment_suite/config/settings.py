@@ -16,6 +16,8 @@ LLM_MODEL = "gpt-4.1-2025-04-14"
 # --- CONFIGURAZIONE WORKFLOW ---
 AFFINITY_THRESHOLD = 0.6
 BATCH_SIZE = 50
+# Invia lo screening LLM tramite Batch API (job asincrono, costo dimezzato) invece che batch per batch
+USE_BATCH_API = os.getenv("LLM_USE_BATCH_API", "0") == "1"
 MIN_EXPERIENCE_MONTHS_NORM = 6
 TOP_N_MATCHES_NORM = 3
 ID_COLUMN = 'profile_id'
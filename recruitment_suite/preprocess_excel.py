@@ -219,7 +219,60 @@ class CareerNormalizer:
         matches = [{'esco_title': self.occupations_df.iloc[idx.item()]['Title'], 'semantic_similarity': f"{score.item():.4f}"} for score, idx in zip(top_results.values, top_results.indices)]
         return matches
 
-    def process_profiles(self, profiles_df: pd.DataFrame, token_tracker: dict):
+    def _enrich_via_batch_api(self, experiences: list) -> dict:
+        """
+        Arricchisce in un unico job della Batch API le esperienze non presenti nella cache
+        semantica. Restituisce {testo grezzo: testo arricchito}.
+        """
+        from interviewer.llm_batch import run_batch
+
+        pending = {}
+        for exp in experiences:
+            raw_query_text = f"{exp['title']}. {exp['description']}"
+            if raw_query_text in pending or self._find_in_semantic_cache(raw_query_text):
+                continue
+            pending[raw_query_text] = exp
+
+        if not pending:
+            return {}
+        requests = []
+        custom_ids = {}
+        for i, (raw_query_text, exp) in enumerate(pending.items()):
+            custom_id = f"exp-{i}"
+            custom_ids[custom_id] = raw_query_text
+            clean_description = re.sub('<[^<]+?>', '', exp['description'])
+            requests.append({"custom_id": custom_id, "body": {
+                "model": settings.LLM_MODEL,
+                "messages": [{"role": "user", "content": LLM_PROMPT_PARAGRAPH.format(title=exp['title'], description=clean_description)}],
+                "response_format": {"type": "json_object"},
+                "temperature": 0.15,
+            }})
+
+        outputs = run_batch(requests, job_name=f"normalization-{datetime.now():%Y%m%d-%H%M%S}", stage="market.cv_enrichment")
+        enriched = {}
+        for custom_id, raw in outputs.items():
+            try:
+                text = json.loads(raw).get("enriched_text") if raw else None
+            except json.JSONDecodeError:
+                text = None
+            if text:
+                enriched[custom_ids[custom_id]] = text
+                self._add_to_semantic_cache(text)
+        print(f"Batch API: {len(enriched)} esperienze arricchite su {len(pending)} inviate.")
+        return enriched
+
+    def process_profiles(self, profiles_df: pd.DataFrame, token_tracker: dict, use_batch_api: bool = settings.USE_BATCH_API):
+        """
+        Con use_batch_api=True tutte le esperienze da arricchire vengono inviate in un unico
+        job della Batch API (i token sono registrati nella telemetria LLM, non nel token_tracker).
+        """
+        batch_enriched = {}
+        if use_batch_api:
+            all_experiences = []
+            for _, profile in profiles_df.iterrows():
+                all_experiences.extend(parse_and_filter_experiences(profile['Esperienza'], settings.MIN_EXPERIENCE_MONTHS_NORM, settings.NON_JOB_KEYWORDS_NORM))
+            batch_enriched = self._enrich_via_batch_api(all_experiences)
+
         all_normalized_profiles = []
         for _, profile in tqdm(profiles_df.iterrows(), total=len(profiles_df), desc="Normalizzazione Profili"):
             filtered_experiences = parse_and_filter_experiences(profile['Esperienza'], settings.MIN_EXPERIENCE_MONTHS_NORM, settings.NON_JOB_KEYWORDS_NORM)
@@ -228,10 +281,13 @@ class CareerNormalizer:
             normalized_experiences_list = []
             for exp in filtered_experiences:
                 raw_query_text = f"{exp['title']}. {exp['description']}"
-                embedding_text = self._find_in_semantic_cache(raw_query_text)
+                embedding_text = batch_enriched.get(raw_query_text)
+                if not embedding_text:
+                    embedding_text = self._find_in_semantic_cache(raw_query_text)
                 
                 if embedding_text:
-                    token_tracker["semantic_cache_hits"] += 1
+                    if raw_query_text not in batch_enriched:
+                        token_tracker["semantic_cache_hits"] += 1
                 else:
                     embedding_text = get_enriched_text_from_llm(exp['title'], exp['description'], token_tracker)
                     if embedding_text: self._add_to_semantic_cache(embedding_text)
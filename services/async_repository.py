@@ -0,0 +1,175 @@
+# services/async_repository.py
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from pymongo import AsyncMongoClient
+from pymongo.server_api import ServerApi
+from .data_manager import MONGO_URI, DB_NAME, SESSIONS_COLLECTION_NAME, POSITIONS_COLLECTION_NAME
+from .mongo_pool import mongo_client_options, async_pool_metrics
+
+# --- CONFIGURAZIONE ---
+COURSES_COLLECTION_NAME = "courses"
+# Timeout delle chiamate della facciata sincrona (oltre ai timeout del driver)
+ASYNC_REPOSITORY_SYNC_TIMEOUT_S = 120
+
+
+# --- EVENT LOOP DEDICATO ---
+# Un AsyncMongoClient è legato all'event loop su cui viene usato. Le pipeline sincrone
+# (run_async crea un loop per chiamata) e Streamlit usano thread e loop diversi: il client
+# vive quindi su un loop dedicato, così tutte le operazioni condividono un solo pool.
+
+class _MongoLoop:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._client = None
+        self._db = None
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="mongo-async")
+        self._thread.start()
+
+    async def _get_db(self):
+        if self._db is None:
+            if not MONGO_URI:
+                raise ConnectionError("MONGO_CONNECTION_STRING non configurata.")
+            self._client = AsyncMongoClient(MONGO_URI, server_api=ServerApi('1'), **mongo_client_options(async_pool_metrics))
+            self._db = self._client[DB_NAME]
+        return self._db
+
+    async def call(self, operation, *args):
+        return await operation(await self._get_db(), *args)
+
+    def submit(self, operation, *args) -> Future:
+        return asyncio.run_coroutine_threadsafe(self.call(operation, *args), self.loop)
+
+
+_mongo_loop = None
+_mongo_loop_lock = threading.Lock()
+
+
+def _get_mongo_loop() -> _MongoLoop:
+    global _mongo_loop
+    with _mongo_loop_lock:
+        if _mongo_loop is None:
+            _mongo_loop = _MongoLoop()
+        return _mongo_loop
+
+
+async def _run(operation, *args):
+    """Esegue l'operazione sul loop di Mongo e la attende dal loop del chiamante."""
+    mongo_loop = _get_mongo_loop()
+    try:
+        if asyncio.get_running_loop() is mongo_loop.loop:
+            return await mongo_loop.call(operation, *args)
+    except RuntimeError:
+        pass
+    return await asyncio.wrap_future(mongo_loop.submit(operation, *args))
+
+
+def run_in_background(coro) -> Future:
+    """
+    Avvia una coroutine del repository senza attenderla (es. prefetch mentre gira una
+    chiamata LLM). Restituisce un concurrent.futures.Future: .result() per il valore.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_mongo_loop().loop)
+
+
+# --- OPERAZIONI ---
+
+def _projection(fields) -> dict | None:
+    return {field: 1 for field in fields} if fields else None
+
+
+async def _find_one(db, collection: str, query: dict, projection: dict | None):
+    return await db[collection].find_one(query, projection)
+
+
+async def _find(db, collection: str, query: dict, projection: dict | None, limit: int, sort: list | None = None):
+    cursor = db[collection].find(query, projection, limit=limit)
+    if sort:
+        cursor = cursor.sort(sort)
+    return await cursor.to_list(None)
+
+
+async def _update_one(db, collection: str, query: dict, update: dict, upsert: bool):
+    result = await db[collection].update_one(query, update, upsert=upsert)
+    return result.matched_count > 0 or result.upserted_id is not None
+
+
+# --- REPOSITORY ASINCRONI ---
+
+class AsyncSessionRepository:
+    async def get(self, session_id: str, fields=None) -> dict | None:
+        return await _run(_find_one, SESSIONS_COLLECTION_NAME, {"_id": session_id}, _projection(fields))
+
+    async def set_fields(self, session_id: str, fields: dict) -> bool:
+        return await _run(_update_one, SESSIONS_COLLECTION_NAME, {"_id": session_id}, {"$set": fields}, False)
+
+    async def save_stages(self, session_id: str, stages: dict) -> bool:
+        return await self.set_fields(session_id, {f"stages.{name}": value for name, value in stages.items()})
+
+    async def push(self, session_id: str, field: str, items: list) -> bool:
+        return await _run(_update_one, SESSIONS_COLLECTION_NAME, {"_id": session_id}, {"$push": {field: {"$each": items}}}, False)
+
+
+class AsyncPositionRepository:
+    async def get(self, position_id: str, fields=None) -> dict | None:
+        return await _run(_find_one, POSITIONS_COLLECTION_NAME, {"_id": position_id}, _projection(fields))
+
+    async def list_positions(self) -> list:
+        return await _run(_find, POSITIONS_COLLECTION_NAME, {}, {"_id": 1, "position_name": 1}, 0, [("position_name", 1)])
+
+
+class AsyncCourseRepository:
+    async def all(self, fields=None) -> list:
+        return await _run(_find, COURSES_COLLECTION_NAME, {}, _projection(fields), 0)
+
+
+class AsyncSuiteRepository:
+    """Collection della recruitment suite (nomi in recruitment_suite.config.settings)."""
+
+    async def find(self, collection: str, query: dict | None = None, fields=None, limit: int = 0) -> list:
+        return await _run(_find, collection, query or {}, _projection(fields), limit)
+
+    async def find_one(self, collection: str, query: dict | None = None, fields=None) -> dict | None:
+        return await _run(_find_one, collection, query or {}, _projection(fields))
+
+
+class AsyncRepositories:
+    def __init__(self):
+        self.sessions = AsyncSessionRepository()
+        self.positions = AsyncPositionRepository()
+        self.courses = AsyncCourseRepository()
+        self.suite = AsyncSuiteRepository()
+
+
+# --- FACCIATA SINCRONA ---
+
+class SyncFacade:
+    """
+    Espone gli stessi metodi di un repository asincrono come funzioni bloccanti:
+    la coroutine gira sul loop di Mongo, il thread chiamante attende il risultato.
+    """
+
+    def __init__(self, repository, timeout: float = ASYNC_REPOSITORY_SYNC_TIMEOUT_S):
+        self._repository = repository
+        self._timeout = timeout
+
+    def __getattr__(self, name):
+        method = getattr(self._repository, name)
+
+        def _call(*args, **kwargs):
+            return run_in_background(method(*args, **kwargs)).result(self._timeout)
+
+        return _call
+
+
+class SyncRepositories:
+    def __init__(self, repositories: AsyncRepositories):
+        self.sessions = SyncFacade(repositories.sessions)
+        self.positions = SyncFacade(repositories.positions)
+        self.courses = SyncFacade(repositories.courses)
+        self.suite = SyncFacade(repositories.suite)
+
+
+async_repositories = AsyncRepositories()
+sync_repositories = SyncRepositories(async_repositories)
@@ -1,8 +1,18 @@
 import os
+import copy
+import time
+import queue
+import threading
+from collections import OrderedDict
 import streamlit as st
+import bson
+from datetime import datetime
+from pymongo import UpdateOne, ReplaceOne
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
+from services.mongo_pool import mongo_client_options, sync_pool_metrics, get_pool_metrics
+from services.mongo_indexes import MONGO_ENSURE_INDEXES, ensure_indexes
 
 # Carica le variabili dal file .env se presente (per lo sviluppo locale)
 load_dotenv()
@@ -38,11 +48,18 @@ if not MONGO_URI:
         pass
 else:
     try:
-        client = MongoClient(MONGO_URI, server_api=ServerApi('1'))
+        # Pool, timeout e compressione configurabili (vedi services/mongo_pool.py): con il
+        # serverSelectionTimeoutMS ridotto il ping all'avvio non blocca più per 30 secondi
+        client = MongoClient(MONGO_URI, server_api=ServerApi('1'), **mongo_client_options(sync_pool_metrics))
         db = client[DB_NAME]
         sessions_collection = db[SESSIONS_COLLECTION_NAME]
         client.admin.command('ping')
         print("✅ Connessione a MongoDB Atlas stabilita con successo!")
+        if MONGO_ENSURE_INDEXES:
+            try:
+                ensure_indexes(db)
+            except Exception as e:
+                print(f"⚠️ Verifica degli indici MongoDB non riuscita: {e}")
     except Exception as e:
         print(f"❌ ERRORE CRITICO: Impossibile connettersi a MongoDB Atlas. Dettagli: {e}")
         try:
@@ -50,6 +67,120 @@ else:
         except Exception:
             pass
 
+# --- REPOSITORY DELLE POSIZIONI ---
+# I documenti di 'positions_data' contengono casi, criteri, ICP e KB: sono grandi e cambiano
+# solo quando gira la data preparation. Cache in-process LRU + TTL, invalidata dalle scritture
+# che passano dal repository; il TTL limita la staleness tra repliche diverse.
+POSITION_CACHE_MAX_ENTRIES = int(os.getenv("POSITION_CACHE_MAX_ENTRIES", "64"))
+POSITION_CACHE_TTL_SECONDS = float(os.getenv("POSITION_CACHE_TTL_SECONDS", "300"))
+POSITIONS_COLLECTION_NAME = "positions_data"
+
+class PositionRepository:
+    """
+    Accesso ai documenti delle posizioni con cache. Le letture con 'fields' usano una
+    proiezione MongoDB (viste leggere); una lettura proiettata viene servita anche dal
+    documento completo, se è già in cache. I documenti restituiti sono copie.
+    """
+
+    _LIST_KEY = ("__list__", None)
+
+    def __init__(self, max_entries: int = POSITION_CACHE_MAX_ENTRIES, ttl_seconds: float = POSITION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._cache = OrderedDict()  # (position_id, fields) -> (scadenza, documento)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _collection(self):
+        return db[POSITIONS_COLLECTION_NAME] if db is not None else None
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _cache_put(self, key, value):
+        self._cache[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, position_id: str, fields: tuple | list | None = None, use_cache: bool = True) -> dict | None:
+        fields = tuple(sorted(fields)) if fields else None
+        key = (position_id, fields)
+        if use_cache:
+            with self._lock:
+                cached = self._cache_get(key)
+                if cached is None and fields is not None:
+                    full = self._cache_get((position_id, None))
+                    if full is not None:
+                        cached = {k: v for k, v in full.items() if k == "_id" or k in fields}
+                if cached is not None:
+                    self.stats["hits"] += 1
+                    return copy.deepcopy(cached)
+                self.stats["misses"] += 1
+
+        collection = self._collection()
+        if collection is None:
+            return None
+        projection = {field: 1 for field in fields} if fields else None
+        document = collection.find_one({"_id": position_id}, projection)
+        # Le posizioni inesistenti non vengono messe in cache: potrebbero essere create a breve
+        if document is not None:
+            with self._lock:
+                self._cache_put(key, document)
+        return copy.deepcopy(document)
+
+    def list_positions(self) -> list:
+        """Elenco leggero (_id, position_name) per le pagine di selezione."""
+        with self._lock:
+            cached = self._cache_get(self._LIST_KEY)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return copy.deepcopy(cached)
+            self.stats["misses"] += 1
+        collection = self._collection()
+        if collection is None:
+            return []
+        # Ordinamento lato DB sull'indice 'position_name' (vedi services/mongo_indexes.py)
+        positions = list(collection.find({}, {"_id": 1, "position_name": 1}).sort("position_name", 1))
+        with self._lock:
+            self._cache_put(self._LIST_KEY, positions)
+        return copy.deepcopy(positions)
+
+    def update(self, position_id: str, fields: dict, upsert: bool = False) -> bool:
+        collection = self._collection()
+        if collection is None:
+            return False
+        collection.update_one({"_id": position_id}, {"$set": fields}, upsert=upsert)
+        self.invalidate(position_id)
+        return True
+
+    def invalidate(self, position_id: str | None = None):
+        """Rimuove dalla cache tutte le viste di una posizione (e l'elenco), o tutto se None."""
+        with self._lock:
+            keys = [k for k in self._cache if position_id is None or k[0] in (position_id, self._LIST_KEY[0])]
+            for key in keys:
+                del self._cache[key]
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "entries": len(self._cache), "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0}
+
+
+position_repository = PositionRepository()
+
+def get_position_cache_stats() -> dict:
+    return position_repository.get_stats()
+
 # --- Funzioni di Gestione Dati ---
 
 def create_or_update_position(position_id: str, payload: dict) -> bool:
@@ -61,10 +192,9 @@ def create_or_update_position(position_id: str, payload: dict) -> bool:
         print("DB non disponibile per create_or_update_position")
         return False
     try:
-        collection = db["positions_data"]
         payload = payload.copy()
         payload["_id"] = position_id
-        collection.update_one({"_id": position_id}, {"$set": payload}, upsert=True)
+        position_repository.update(position_id, payload, upsert=True)
         print(f"📄 Posizione upserted su MongoDB con ID: {position_id}")
         return True
     except Exception as e:
@@ -85,53 +215,328 @@ def create_new_session(session_id: str, position_id: str, candidate_name: str =
 def save_stage_output(session_id: str, stage_name: str, data_content: dict | str):
     if sessions_collection is None: return
     try:
-        update_query = {"$set": {f"stages.{stage_name}": data_content}}
-        sessions_collection.update_one({"_id": session_id}, update_query)
+        # _bulk_set sposta gli stage pesanti nella collection dei blob (vedi sotto)
+        _bulk_set({session_id: {f"stages.{stage_name}": data_content}})
         print(f"💾 Dati per lo stage '{stage_name}' salvati per la sessione {session_id}.")
     except Exception as e:
         print(f"Errore durante il salvataggio dello stage '{stage_name}': {e}")
 
-def get_session_data(session_id: str) -> dict | None:
+def get_session_data(session_id: str, stages: tuple | list | None = None, resolve_blobs: bool = True) -> dict | None:
+    """
+    Documento della sessione. Con 'stages' vengono letti solo i campi di base e gli stage
+    indicati (proiezione); senza, l'intero documento. Gli stage spostati nella collection
+    dei blob vengono caricati solo se richiesti (resolve_blobs=False lascia i riferimenti,
+    da caricare poi con load_stage_blob).
+    """
     if sessions_collection is None: return None
+    # Read-your-writes: le scritture in write-behind ancora in coda per questa sessione vanno applicate prima di leggere
+    flush_pending_session_writes(session_id)
+    projection = None
+    if stages is not None:
+        projection = {field: 1 for field in SESSION_BASE_FIELDS}
+        projection.update({f"stages.{stage}": 1 for stage in stages})
     try:
-        return sessions_collection.find_one({"_id": session_id})
+        session = sessions_collection.find_one({"_id": session_id}, projection)
+        if session and resolve_blobs:
+            _resolve_stage_blobs(session.get("stages") or {})
+        return session
     except Exception as e:
         print(f"Errore nel recupero della sessione {session_id}: {e}")
         return None
 
+# --- PAYLOAD PESANTI DELLA SESSIONE ---
+# CV, conversazione, report lunghi e grafici base64 non restano nel documento di sessione:
+# vengono salvati in una collection a parte e nel documento resta solo un riferimento
+# {"blob_ref": "<session_id>:<stage>", "size": <byte>}. Le letture della sessione restano
+# piccole e i payload si caricano solo quando uno stage viene effettivamente richiesto.
+SESSION_BLOBS_COLLECTION_NAME = "session_blobs"
+# Stage sempre spostati (la conversazione cresce turno per turno con $push sul blob)
+SESSION_BLOB_STAGES = {"uploaded_cv_text", "conversation", "market_chart_categories_base64"}
+# Qualsiasi altro stage oltre questa dimensione (BSON) viene spostato
+SESSION_BLOB_THRESHOLD_BYTES = int(os.getenv("SESSION_BLOB_THRESHOLD_BYTES", "16384"))
+# Campi di primo livello sempre inclusi nelle letture con proiezione
+SESSION_BASE_FIELDS = ("position_id", "candidate_name", "status")
+
+def _blob_id(session_id: str, stage_name: str) -> str:
+    return f"{session_id}:{stage_name}"
+
+def _is_blob_ref(value) -> bool:
+    return isinstance(value, dict) and "blob_ref" in value and set(value) <= {"blob_ref", "size"}
+
+def _offload_stages(session_id: str, fields: dict) -> tuple[dict, list]:
+    """Sostituisce gli stage pesanti con riferimenti; restituisce (campi, scritture dei blob)."""
+    blob_writes = []
+    session_fields = {}
+    for field, value in fields.items():
+        stage_name = field.removeprefix("stages.")
+        if field == stage_name or "." in stage_name or value is None or _is_blob_ref(value):
+            session_fields[field] = value
+            continue
+        size = len(bson.encode({"data": value}))
+        if stage_name not in SESSION_BLOB_STAGES and size <= SESSION_BLOB_THRESHOLD_BYTES:
+            session_fields[field] = value
+            continue
+        blob_id = _blob_id(session_id, stage_name)
+        blob_writes.append(ReplaceOne(
+            {"_id": blob_id},
+            {"_id": blob_id, "session_id": session_id, "stage": stage_name, "data": value, "size": size, "updated_at": datetime.now()},
+            upsert=True
+        ))
+        session_fields[field] = {"blob_ref": blob_id, "size": size}
+    return session_fields, blob_writes
+
+def _resolve_stage_blobs(stages: dict):
+    """Sostituisce in place i riferimenti con i payload, con una sola query per tutti i blob."""
+    refs = {stage: value["blob_ref"] for stage, value in stages.items() if _is_blob_ref(value)}
+    if not refs:
+        return
+    blobs = {
+        blob["_id"]: blob.get("data")
+        for blob in db[SESSION_BLOBS_COLLECTION_NAME].find({"_id": {"$in": list(refs.values())}}, {"data": 1})
+    }
+    for stage, blob_id in refs.items():
+        stages[stage] = blobs.get(blob_id)
+
+def load_stage_blob(session_id: str, stage_name: str):
+    """Carica su richiesta il payload di uno stage spostato nella collection dei blob."""
+    if db is None: return None
+    flush_pending_session_writes(session_id)
+    try:
+        blob = db[SESSION_BLOBS_COLLECTION_NAME].find_one({"_id": _blob_id(session_id, stage_name)}, {"data": 1})
+        return blob.get("data") if blob else None
+    except Exception as e:
+        print(f"Errore nel recupero dello stage '{stage_name}' della sessione {session_id}: {e}")
+        return None
+
+def append_stage_items(session_id: str, stage_name: str, items: list):
+    """Accoda elementi a uno stage-lista salvato come blob (es. la conversazione, turno per turno)."""
+    if db is None or not items: return
+    blob_id = _blob_id(session_id, stage_name)
+    db[SESSION_BLOBS_COLLECTION_NAME].update_one(
+        {"_id": blob_id},
+        {
+            "$push": {"data": {"$each": items}},
+            "$setOnInsert": {"session_id": session_id, "stage": stage_name},
+            "$set": {"updated_at": datetime.now()},
+        },
+        upsert=True
+    )
+    sessions_collection.update_one({"_id": session_id}, {"$set": {f"stages.{stage_name}": {"blob_ref": blob_id}}})
+
+# --- UNIT OF WORK DELLA SESSIONE ---
+# Le scritture di stage di una stessa fase vengono accumulate e inviate con un solo update
+# ($set di più campi). In modalità write-behind il flush avviene su un thread in background
+# (più sessioni in coda -> un solo bulk_write), così la UI non attende la latenza di Atlas.
+SESSION_WRITE_BEHIND = os.getenv("SESSION_WRITE_BEHIND", "0") == "1"
+
+def _bulk_set(updates: dict):
+    """updates: {session_id: {campo: valore}} -> update_one se una sola sessione, altrimenti bulk_write."""
+    blob_writes = []
+    for session_id in list(updates):
+        updates[session_id], writes = _offload_stages(session_id, updates[session_id])
+        blob_writes.extend(writes)
+    # I blob vanno scritti prima dei riferimenti, così una lettura non trova mai un riferimento orfano
+    if blob_writes:
+        db[SESSION_BLOBS_COLLECTION_NAME].bulk_write(blob_writes, ordered=False)
+    if len(updates) == 1:
+        session_id, fields = next(iter(updates.items()))
+        sessions_collection.update_one({"_id": session_id}, {"$set": fields})
+    else:
+        sessions_collection.bulk_write(
+            [UpdateOne({"_id": session_id}, {"$set": fields}) for session_id, fields in updates.items()],
+            ordered=False
+        )
+
+class _SessionWriteBehind:
+    """Coda di $set applicati da un thread in background, accorpati per sessione."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        # Scritture accodate e non ancora applicate, per sessione: una lettura attende solo le proprie
+        self._pending = {}
+        self._pending_cond = threading.Condition()
+        self._worker = threading.Thread(target=self._drain, daemon=True, name="session-write-behind")
+        self._worker.start()
+
+    def submit(self, session_id: str, fields: dict):
+        with self._pending_cond:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self._queue.put((session_id, fields))
+
+    def _drain(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            merged = {}
+            for session_id, fields in batch:
+                merged.setdefault(session_id, {}).update(fields)
+            try:
+                if sessions_collection is not None:
+                    _bulk_set(merged)
+            except Exception as e:
+                print(f"Errore durante il salvataggio in background di {len(merged)} sessioni: {e}")
+            finally:
+                with self._pending_cond:
+                    for session_id, _ in batch:
+                        self._pending[session_id] -= 1
+                        if not self._pending[session_id]:
+                            del self._pending[session_id]
+                    self._pending_cond.notify_all()
+
+    def wait(self, session_id: str | None = None):
+        """Attende le scritture accodate per 'session_id' (None = per tutte le sessioni)."""
+        with self._pending_cond:
+            if session_id is None:
+                self._pending_cond.wait_for(lambda: not self._pending)
+            else:
+                self._pending_cond.wait_for(lambda: session_id not in self._pending)
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+def _get_write_behind() -> _SessionWriteBehind:
+    global _write_behind
+    with _write_behind_lock:
+        if _write_behind is None:
+            _write_behind = _SessionWriteBehind()
+        return _write_behind
+
+def flush_pending_session_writes(session_id: str | None = None):
+    """
+    Attende che le scritture in write-behind già accodate siano state applicate: solo
+    quelle della sessione indicata, o tutte senza session_id (es. in chiusura).
+    """
+    if _write_behind is not None:
+        _write_behind.wait(session_id)
+
+class SessionUnitOfWork:
+    """
+    Accumula i $set di una sessione e li invia insieme con flush(). Usata come context
+    manager fa il flush all'uscita, anche in caso di eccezione (gli stage già calcolati
+    non vanno persi).
+    """
+
+    def __init__(self, session_id: str, write_behind: bool | None = None):
+        self.session_id = session_id
+        self.write_behind = SESSION_WRITE_BEHIND if write_behind is None else write_behind
+        self._pending = {}
+
+    def set(self, field: str, value):
+        self._pending[field] = value
+
+    def save_stage_output(self, stage_name: str, data_content: dict | str):
+        self.set(f"stages.{stage_name}", data_content)
+
+    def flush(self) -> bool:
+        if not self._pending:
+            return True
+        fields, self._pending = self._pending, {}
+        if sessions_collection is None: return False
+        if self.write_behind:
+            _get_write_behind().submit(self.session_id, fields)
+            return True
+        try:
+            _bulk_set({self.session_id: fields})
+            stages = ", ".join(f.removeprefix("stages.") for f in fields)
+            print(f"💾 Dati per gli stage [{stages}] salvati per la sessione {self.session_id}.")
+            return True
+        except Exception as e:
+            print(f"Errore durante il salvataggio degli stage per la sessione {self.session_id}: {e}")
+            return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+def save_interview_state(session_id: str, state: dict) -> bool:
+    """Scrive lo stato completo del colloquio (caso, contatori, memoria, trascrizione) nel campo 'interview'."""
+    if sessions_collection is None: return False
+    try:
+        sessions_collection.update_one({"_id": session_id}, {"$set": {"interview": state, "status": "interview"}})
+        print(f"💾 Stato del colloquio salvato per la sessione {session_id}.")
+        return True
+    except Exception as e:
+        print(f"Errore durante il salvataggio dello stato del colloquio {session_id}: {e}")
+        return False
+
+def append_interview_turn(session_id: str, counters: dict, memory: dict | None, transcript: dict | None = None) -> bool:
+    """
+    Aggiornamento per turno: $set di contatori, memoria e trascrizione. I messaggi non
+    vengono duplicati nel documento di sessione: sono già nel blob 'conversation'.
+    """
+    if sessions_collection is None: return False
+    update = {"$set": {"interview.counters": counters, "interview.memory": memory}}
+    if transcript is not None:
+        # Contatore dei turni e righe della conversazione ancora da salvare sul blob
+        update["$set"]["interview.transcript"] = transcript
+    try:
+        result = sessions_collection.update_one({"_id": session_id, "interview": {"$exists": True}}, update)
+        return result.matched_count == 1
+    except Exception as e:
+        print(f"Errore durante il salvataggio del turno per la sessione {session_id}: {e}")
+        return False
+
+def load_interview_state(session_id: str) -> dict | None:
+    """
+    Restituisce lo stato del colloquio salvato (o None), insieme alla posizione della sessione
+    e alla conversazione, letta dal blob 'conversation'.
+    """
+    if sessions_collection is None: return None
+    flush_pending_session_writes(session_id)
+    try:
+        doc = sessions_collection.find_one({"_id": session_id}, {"interview": 1, "position_id": 1})
+    except Exception as e:
+        print(f"Errore nel recupero dello stato del colloquio {session_id}: {e}")
+        return None
+    if not doc or not doc.get("interview"):
+        return None
+    conversation = load_stage_blob(session_id, "conversation") or []
+    return {"position_id": doc.get("position_id"), "state": doc["interview"], "conversation": conversation}
+
 def save_pdf_report(pdf_bytes: bytes, session_id: str) -> str:
-    output_dir = os.path.join("data", "sessions", session_id)
-    os.makedirs(output_dir, exist_ok=True)
-    file_path = os.path.join(output_dir, "Report_Feedback_Candidato.pdf")
+    """Salva il PDF nello store dei report (GridFS o locale) e restituisce l'id del report ("" se fallisce)."""
+    from services.report_store import get_report_store
+    store = get_report_store()
     try:
-        with open(file_path, "wb") as f:
-            f.write(pdf_bytes)
-        print(f"📄 PDF salvato localmente in: {file_path}")
-        return file_path
+        report_id = store.save(session_id, pdf_bytes)
+        print(f"📄 PDF salvato ({store.backend}, {len(pdf_bytes)} byte): {report_id}")
+        return report_id
     except Exception as e:
         print(f"Errore nel salvataggio del PDF: {e}")
         return ""
 
-@st.cache_data
+def iter_pdf_report(report_id: str):
+    """Chunk del report dallo store condiviso (leggibile da qualunque replica); nessun chunk se non esiste."""
+    from services.report_store import get_report_store, iter_report_chunks
+    try:
+        yield from iter_report_chunks(get_report_store(), report_id)
+    except Exception as e:
+        print(f"Errore nel recupero del PDF {report_id}: {e}")
+
 def get_available_positions_from_db():
     if db is None: 
         print("DB non disponibile per get_available_positions_from_db")
         return []
     try:
-        collection = db["positions_data"]
-        positions = list(collection.find({}, {"_id": 1, "position_name": 1}))
-        return sorted(positions, key=lambda p: p['position_name'])
+        return position_repository.list_positions()
     except Exception as e:
         print(f"Errore nel recupero delle posizioni dal DB: {e}")
         return []
 
-def get_single_position_data_from_db(_position_id: str):
+def get_single_position_data_from_db(_position_id: str, fields: tuple | list | None = None):
+    """Documento della posizione (dalla cache se disponibile); 'fields' limita i campi restituiti."""
     if db is None: 
         print(f"DB non disponibile per get_single_position_data_from_db per ID: {_position_id}")
         return None
     try:
-        collection = db["positions_data"]
-        return collection.find_one({"_id": _position_id})
+        return position_repository.get(_position_id, fields)
     except Exception as e:
         print(f"Errore nel recupero dei dati per la posizione {_position_id}: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,126 @@
+# services/mongo_indexes.py
+
+import os
+import sys
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+# --- CONFIGURAZIONE ---
+# Gli indici vengono creati all'avvio (data_manager) se MONGO_ENSURE_INDEXES=1, oppure da CLI:
+#   python -m services.mongo_indexes ensure | explain
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1") == "1"
+
+# --- INDICI RICHIESTI ---
+# Le query su _id usano l'indice di default e non vanno dichiarate.
+REQUIRED_INDEXES = {
+    # Caricamento a chunk degli embedding: find({"embedding_id"}).sort("chunk_index")
+    "suite_embeddings": [
+        IndexModel([("embedding_id", ASCENDING), ("chunk_index", ASCENDING)], name="embedding_id_chunk_index", unique=True),
+    ],
+    # Sessioni per posizione/stato (dashboard, pulizia delle sessioni abbandonate)
+    "user_sessions": [
+        IndexModel([("position_id", ASCENDING), ("status", ASCENDING)], name="position_id_status"),
+    ],
+    # Payload pesanti delle sessioni (pulizia per sessione)
+    "session_blobs": [
+        IndexModel([("session_id", ASCENDING)], name="session_id"),
+    ],
+    # Elenco delle posizioni ordinato per nome
+    "positions_data": [
+        IndexModel([("position_name", ASCENDING)], name="position_name"),
+    ],
+    # Breakdown della telemetria LLM per sessione, posizione e stage
+    "llm_telemetry": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING)], name="session_id_timestamp"),
+        IndexModel([("position_id", ASCENDING), ("timestamp", ASCENDING)], name="position_id_timestamp"),
+        IndexModel([("stage", ASCENDING)], name="stage"),
+    ],
+}
+
+# --- QUERY CRITICHE ---
+# (descrizione, collection, filtro, ordinamento): verificate con explain() per escludere i COLLSCAN
+HOT_QUERIES = [
+    ("caricamento embedding a chunk", "suite_embeddings", {"embedding_id": "embeddings"}, [("chunk_index", ASCENDING)]),
+    ("sessione per id", "user_sessions", {"_id": "explain-check"}, None),
+    ("sessioni per posizione e stato", "user_sessions", {"position_id": "explain-check", "status": "interview"}, None),
+    ("posizione per id", "positions_data", {"_id": "explain-check"}, None),
+    ("elenco posizioni ordinato", "positions_data", {}, [("position_name", ASCENDING)]),
+    ("telemetria di una sessione", "llm_telemetry", {"session_id": "explain-check"}, [("timestamp", ASCENDING)]),
+]
+
+
+def ensure_indexes(db, collections: list | None = None) -> dict:
+    """
+    Crea gli indici dichiarati (idempotente: un indice già presente con la stessa
+    definizione non viene toccato). Restituisce {collection: [nomi creati/verificati]}.
+    """
+    result = {}
+    for collection_name, indexes in REQUIRED_INDEXES.items():
+        if collections is not None and collection_name not in collections:
+            continue
+        try:
+            result[collection_name] = db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            # Tipicamente un indice con lo stesso nome ma definizione diversa: va rimosso a mano
+            print(f"  - ERRORE: indici non creati su '{collection_name}': {e}")
+            result[collection_name] = []
+    return result
+
+
+def _plan_stages(plan) -> list:
+    """Tutti gli stage di un piano di esecuzione (anche annidati, es. SBE o SORT sopra IXSCAN)."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def explain_hot_queries(db) -> list:
+    """
+    Esegue explain() sulle query critiche e segnala quelle che usano un COLLSCAN
+    o un ordinamento in memoria (SORT bloccante).
+    """
+    report = []
+    for description, collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning_plan)
+        report.append({
+            "query": description,
+            "collection": collection_name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+        })
+    return report
+
+
+# --- CLI ---
+
+if __name__ == "__main__":
+    from services.data_manager import db
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if db is None:
+        print("ERRORE: connessione a MongoDB non disponibile.")
+        sys.exit(1)
+    if command == "ensure":
+        for collection_name, names in ensure_indexes(db).items():
+            print(f"  - {collection_name}: {', '.join(names) or 'nessun indice'}")
+    elif command == "explain":
+        problems = 0
+        for entry in explain_hot_queries(db):
+            flag = "COLLSCAN" if entry["collscan"] else ("SORT IN MEMORIA" if entry["in_memory_sort"] else "ok")
+            problems += flag != "ok"
+            print(f"  [{flag:>15}] {entry['collection']}: {entry['query']} -> {' > '.join(entry['stages'])}")
+        sys.exit(1 if problems else 0)
+    else:
+        print("Uso: python -m services.mongo_indexes ensure | explain")
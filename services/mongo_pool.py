@@ -0,0 +1,113 @@
+# services/mongo_pool.py
+
+import os
+import threading
+from collections import deque
+from pymongo import monitoring
+
+# --- CONFIGURAZIONE DEL POOL ---
+# Valori condivisi dal client sincrono (data_manager) e da quello asincrono (async_repository).
+# Il default di pymongo (100 connessioni, 30s di server selection) su Streamlit + pipeline
+# parallele produce attese lunghe e poco visibili: qui sono espliciti e misurati.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+# Tempo massimo di attesa di una connessione libera dal pool
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "60000"))
+# "zlib" non richiede dipendenze; "zstd" e "snappy" richiedono i pacchetti relativi
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
+
+
+class PoolWaitMetrics(monitoring.ConnectionPoolListener):
+    """
+    Listener di pymongo che misura il tempo di attesa per ottenere una connessione dal pool
+    (checkout). Attese alte indicano un pool sottodimensionato rispetto alla concorrenza.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self.counters = {"checkouts": 0, "checkout_failures": 0, "connections_created": 0, "connections_closed": 0, "pool_cleared": 0}
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    def _record_wait(self, duration):
+        if duration is None:
+            return
+        self._waits.append(duration)
+        self.total_wait_s += duration
+        self.max_wait_s = max(self.max_wait_s, duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.counters["checkouts"] += 1
+            self._record_wait(getattr(event, "duration", None))
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.counters["checkout_failures"] += 1
+            self._record_wait(getattr(event, "duration", None))
+
+    def connection_created(self, event):
+        with self._lock:
+            self.counters["connections_created"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.counters["connections_closed"] += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.counters["pool_cleared"] += 1
+
+    def connection_check_out_started(self, event): pass
+    def connection_checked_in(self, event): pass
+    def connection_ready(self, event): pass
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            checkouts = self.counters["checkouts"]
+
+            def _pct(q):
+                return round(1000 * waits[min(int(q * len(waits)), len(waits) - 1)], 2) if waits else 0.0
+
+            return {
+                **self.counters,
+                "avg_wait_ms": round(1000 * self.total_wait_s / checkouts, 2) if checkouts else 0.0,
+                "p50_wait_ms": _pct(0.50),
+                "p95_wait_ms": _pct(0.95),
+                "max_wait_ms": round(1000 * self.max_wait_s, 2),
+            }
+
+
+# Un listener per client, così le metriche di sync e async restano distinte
+sync_pool_metrics = PoolWaitMetrics()
+async_pool_metrics = PoolWaitMetrics()
+
+
+def mongo_client_options(metrics: PoolWaitMetrics | None = None) -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    if metrics is not None:
+        options["event_listeners"] = [metrics]
+    return options
+
+
+def get_pool_metrics() -> dict:
+    return {"sync": sync_pool_metrics.snapshot(), "async": async_pool_metrics.snapshot()}
@@ -0,0 +1,97 @@
+# services/report_store.py
+
+import os
+import threading
+import gridfs
+from gridfs.errors import NoFile
+
+# --- CONFIGURAZIONE ---
+# I report PDF vengono salvati direttamente dai byte generati in memoria, senza file temporanei.
+#   "gridfs" -> bucket GridFS su MongoDB: il report è leggibile da qualunque replica (default)
+#   "local"  -> filesystem locale (sviluppo/test, o in assenza di MongoDB)
+REPORT_STORE_BACKEND = os.getenv("REPORT_STORE_BACKEND", "gridfs")
+REPORT_BUCKET_NAME = os.getenv("REPORT_BUCKET_NAME", "feedback_reports")
+REPORT_LOCAL_DIR = os.path.join("data", "sessions")
+REPORT_FILENAME = "Report_Feedback_Candidato.pdf"
+# Dimensione dei chunk in scrittura (GridFS) e in lettura (streaming)
+REPORT_CHUNK_SIZE = int(os.getenv("REPORT_CHUNK_SIZE", str(255 * 1024)))
+
+
+def _report_id(session_id: str) -> str:
+    return f"{session_id}/{REPORT_FILENAME}"
+
+
+class GridFSReportStore:
+    """Report su un bucket GridFS, con id deterministico per sessione (un nuovo salvataggio sostituisce il precedente)."""
+
+    backend = "gridfs"
+
+    def __init__(self, db, bucket_name: str = REPORT_BUCKET_NAME):
+        self._bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=REPORT_CHUNK_SIZE)
+
+    def save(self, session_id: str, pdf_bytes: bytes) -> str:
+        report_id = _report_id(session_id)
+        try:
+            self._bucket.delete(report_id)
+        except NoFile:
+            pass
+        self._bucket.upload_from_stream_with_id(
+            report_id, REPORT_FILENAME, pdf_bytes,
+            metadata={"session_id": session_id, "content_type": "application/pdf"}
+        )
+        return report_id
+
+    def open(self, report_id: str):
+        """File-like in sola lettura (GridOut): i chunk vengono letti da MongoDB man mano."""
+        try:
+            return self._bucket.open_download_stream(report_id)
+        except NoFile:
+            return None
+
+
+class LocalReportStore:
+    """Stessa interfaccia su filesystem locale: data/sessions/<session_id>/Report_Feedback_Candidato.pdf."""
+
+    backend = "local"
+
+    def __init__(self, root: str = REPORT_LOCAL_DIR):
+        self.root = root
+
+    def save(self, session_id: str, pdf_bytes: bytes) -> str:
+        report_id = _report_id(session_id)
+        path = os.path.join(self.root, report_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(pdf_bytes)
+        return report_id
+
+    def open(self, report_id: str):
+        path = os.path.join(self.root, report_id)
+        return open(path, "rb") if os.path.exists(path) else None
+
+
+def iter_report_chunks(store, report_id: str, chunk_size: int = REPORT_CHUNK_SIZE):
+    """Restituisce il report a chunk, senza caricarlo tutto in memoria."""
+    stream = store.open(report_id)
+    if stream is None:
+        return
+    with stream:
+        while chunk := stream.read(chunk_size):
+            yield chunk
+
+
+_report_store = None
+_report_store_lock = threading.Lock()
+
+
+def get_report_store():
+    """Store configurato; senza connessione a MongoDB si ripiega sul filesystem locale."""
+    global _report_store
+    with _report_store_lock:
+        if _report_store is None:
+            from services.data_manager import db
+            if REPORT_STORE_BACKEND == "gridfs" and db is not None:
+                _report_store = GridFSReportStore(db)
+            else:
+                _report_store = LocalReportStore()
+        return _report_store
@@ -4,6 +4,8 @@ import sys
 import json
 import random
 import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import fitz
 from io import BytesIO
 
@@ -67,13 +69,20 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from interviewer.chatbot import SmartCaseStudyChatbot
+from interviewer.llm_service import LLMServiceError
+from interviewer.llm_telemetry import llm_context
 from analyzer.run_analyzer import run_cv_analysis_pipeline
 from corrector.run_final_evaluation import execute_case_evaluation
 from services.data_manager import (
     db,
     create_new_session,
     save_stage_output,
+    SessionUnitOfWork,
     get_session_data,
+    iter_pdf_report,
+    save_interview_state,
+    append_interview_turn,
+    load_interview_state,
     get_available_positions_from_db,
     get_single_position_data_from_db,
     create_or_update_position
@@ -84,7 +93,7 @@ from data_preparation.analyzer.run_production_pipeline import run_full_generatio
 # --- FINE IMPORT ---
 
 # --- FUNZIONE AGGIORNATA: inizializzazione chatbot con case selezionato opzionale ---
-def initialize_chatbot_for_position(position_id: str, selected_case_id: str | None = None):
+def initialize_chatbot_for_position(position_id: str, selected_case_id: str | None = None, session_id: str | None = None):
     """
     Inizializza il chatbot per una data posizione, unendo i "reasoning_steps"
     con i loro "accomplishment_criteria" corrispondenti. Permette di selezionare
@@ -93,7 +102,9 @@ def initialize_chatbot_for_position(position_id: str, selected_case_id: str | No
     print(f"--- [INIT CHATBOT] Inizializzazione per posizione: {position_id}. ---")
 
     # 1. Recupera tutti i dati della posizione
-    position_data = get_single_position_data_from_db(position_id)
+    position_data = get_single_position_data_from_db(
+        position_id, fields=("all_cases", "all_criteria", "seniority_level", "interview_openings")
+    )
     if not position_data:
         st.error(f"Dati non trovati nel DB per la posizione '{position_id}'")
         return None, None, None
@@ -144,9 +155,16 @@ def initialize_chatbot_for_position(position_id: str, selected_case_id: str | No
         steps=steps_dict,
         case_title=selected_case['question_title'],
         case_text=selected_case['question_text'],
-        case_id=selected_case_id
+        case_id=selected_case_id,
+        session_id=session_id
     )
 
+    # 6. Apertura dal pool pre-generato in data preparation, se presente
+    pooled_openings = position_data.get("interview_openings", {}).get(selected_case_id, [])
+    if pooled_openings:
+        chatbot_instance.prepared_opening = random.choice(pooled_openings)
+        print(f"--- [INIT CHATBOT] Apertura presa dal pool del caso ({len(pooled_openings)} disponibili). ---")
+
     seniority = position_data.get("seniority_level", "Mid-Level")
     print("--- [INIT CHATBOT] Chatbot inizializzato con dati completi. ---")
     return chatbot_instance, selected_case_id, seniority
@@ -190,6 +208,39 @@ def render_intro_page():
             st.session_state.page = "configurazione"
             st.rerun()
 
+# --- PERSISTENZA DELLO STATO DEL COLLOQUIO ---
+# Lo stato del chatbot viene salvato nel documento di sessione a ogni turno: dopo un refresh,
+# un riavvio o su un'altra replica la pagina lo ricostruisce da ?session=<id>.
+def persist_interview_state(session_id: str, chatbot: SmartCaseStudyChatbot):
+    # I messaggi sono già nel blob 'conversation' (scritti dalla trascrizione a fine turno):
+    # qui si salvano solo caso e configurazione (la prima volta), contatori, memoria e trascrizione
+    if not chatbot.state_persisted:
+        if save_interview_state(session_id, chatbot.to_state()):
+            chatbot.mark_state_persisted()
+        return
+    update = chatbot.pending_state_update()
+    append_interview_turn(session_id, update["counters"], update["memory"], update["transcript"])
+    # Se il salvataggio fallisce i contatori vengono riscritti interi al turno successivo
+
+
+def rehydrate_interview(session_id: str) -> bool:
+    saved = load_interview_state(session_id)
+    if not saved:
+        return False
+    try:
+        chatbot = SmartCaseStudyChatbot.from_state(saved["state"], saved["conversation"])
+    except (KeyError, ValueError) as e:
+        print(f"[ERRORE] Stato del colloquio {session_id} non ripristinabile: {e}")
+        return False
+    st.session_state.session_id = session_id
+    st.session_state.selected_position = saved["position_id"]
+    st.session_state.chatbot = chatbot
+    st.session_state.messages = [dict(m) for m in chatbot.conversation_history]
+    st.session_state.preparation_done = True
+    st.session_state.page = "interview"
+    print(f"--- [INIT CHATBOT] Colloquio {session_id} ripristinato ({len(chatbot.conversation_history)} messaggi). ---")
+    return True
+
 # --- App Streamlit ---
 st.set_page_config(
     page_title="Vertigo AI - Simulazione",
@@ -203,6 +254,9 @@ if "page" not in st.session_state:
     st.session_state.clear()
     st.session_state.page = "intro"
     st.session_state.messages = []
+    resume_session_id = st.query_params.get("session")
+    if resume_session_id and not rehydrate_interview(resume_session_id):
+        st.query_params.clear()
 
 # --- PAGINE DELL'APPLICAZIONE ---
 if st.session_state.page == "intro":
@@ -276,7 +330,7 @@ elif st.session_state.page == "position_setup":
             if not ok:
                 st.error("Errore durante il salvataggio della posizione su MongoDB.")
             else:
-                with st.spinner("Esecuzione pipeline di preparazione dati..."):
+                with st.spinner("Esecuzione pipeline di preparazione dati..."), llm_context(position_id=position_id):
                     pipeline_ok = run_full_generation_pipeline(position_id)
                 if pipeline_ok:
                     st.success("Data preparation completata. Puoi visualizzare e selezionare un Case.")
@@ -300,7 +354,7 @@ elif st.session_state.page == "case_selection":
             st.session_state.page = "configurazione"
             st.rerun()
     else:
-        pos_data = get_single_position_data_from_db(pos_id)
+        pos_data = get_single_position_data_from_db(pos_id, fields=("all_cases",))
         cases = (pos_data or {}).get("all_cases", {}).get("cases", [])
         if not cases:
             st.error("Nessun case disponibile per questa posizione.")
@@ -374,7 +428,7 @@ elif st.session_state.page == "configurazione":
         effective_position = selected_position_id_from_state
 
         if effective_position:
-            pos_details = get_single_position_data_from_db(effective_position)
+            pos_details = get_single_position_data_from_db(effective_position, fields=("position_name", "job_description"))
             st.success(f"Posizione selezionata: {pos_details.get('position_name', effective_position)}")
             with st.expander("Visualizza Job Description Completa"):
                 if pos_details:
@@ -392,7 +446,7 @@ elif st.session_state.page == "configurazione":
             if not effective_position:
                 selected_position_from_radio = st.radio("Seleziona un ruolo:", options=list(pos_map.keys()), format_func=lambda pid: pos_map[pid], horizontal=False)
                 with st.expander("Visualizza Job Description Completa"):
-                    position_details = get_single_position_data_from_db(selected_position_from_radio)
+                    position_details = get_single_position_data_from_db(selected_position_from_radio, fields=("position_name", "job_description"))
                     if position_details:
                         st.text_area("JD", position_details.get("job_description", "N/D"), height=200, label_visibility="collapsed", key="jd_display_radio")
                 
@@ -435,6 +489,7 @@ elif st.session_state.page == "preparazione":
         with st.spinner("Creazione sessione sicura..."):
             session_id = str(uuid.uuid4())
             st.session_state.session_id = session_id
+            st.query_params["session"] = session_id
             # Nome candidato di default: nome file senza estensione se disponibile
             cand_name = (st.session_state.uploaded_cv.name.split('.')[0]) if st.session_state.get("uploaded_cv") else "Candidato"
             create_new_session(session_id, st.session_state.selected_position, cand_name)
@@ -448,23 +503,38 @@ elif st.session_state.page == "preparazione":
                 cv_text = cv_file.read().decode("utf-8")
             save_stage_output(session_id, "uploaded_cv_text", cv_text)
 
-        with st.spinner("Analisi del tuo profilo in corso..."):
-            analysis_success = run_cv_analysis_pipeline(session_id)
-
-        if analysis_success:
-            with st.spinner("Configurazione del colloquio..."):
-                selected_case_id = st.session_state.get("selected_case_id")  # Da case_selection, se presente
-                chatbot_instance, selected_case_id, seniority = initialize_chatbot_for_position(
-                    st.session_state.selected_position,
-                    selected_case_id=selected_case_id
-                )
-            if chatbot_instance:
-                st.session_state.chatbot = chatbot_instance
-                save_stage_output(st.session_state.session_id, "case_id", selected_case_id)
-                save_stage_output(st.session_state.session_id, "seniority_level", seniority)
-                st.session_state.preparation_done = True
-            else:
-                st.error("Impossibile inizializzare il colloquio.")
+        with st.spinner("Configurazione del colloquio..."):
+            selected_case_id = st.session_state.get("selected_case_id")  # Da case_selection, se presente
+            chatbot_instance, selected_case_id, seniority = initialize_chatbot_for_position(
+                st.session_state.selected_position,
+                selected_case_id=selected_case_id,
+                session_id=session_id
+            )
+
+        with st.spinner("Analisi del tuo profilo in corso..."), llm_context(session_id=session_id):
+            # L'apertura dipende solo dal caso: la generiamo in parallelo all'analisi del CV
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                opening_future = None
+                if chatbot_instance and not chatbot_instance.prepared_opening:
+                    opening_future = executor.submit(contextvars.copy_context().run, chatbot_instance.generate_opening)
+                analysis_success = run_cv_analysis_pipeline(session_id)
+                if opening_future:
+                    try:
+                        chatbot_instance.prepared_opening = opening_future.result()
+                    except LLMServiceError as e:
+                        # Verrà generata all'avvio del colloquio
+                        print(f"[ERRORE] Pre-generazione dell'apertura fallita: {e}")
+
+        if analysis_success and chatbot_instance:
+            st.session_state.chatbot = chatbot_instance
+            with SessionUnitOfWork(st.session_state.session_id) as uow:
+                uow.save_stage_output("case_id", selected_case_id)
+                uow.save_stage_output("seniority_level", seniority)
+                if chatbot_instance.prepared_opening:
+                    uow.save_stage_output("interview_opening", chatbot_instance.prepared_opening)
+            st.session_state.preparation_done = True
+        elif not chatbot_instance:
+            st.error("Impossibile inizializzare il colloquio.")
         else:
             st.error("Qualcosa è andato storto nell'analisi del CV.")
         st.rerun()
@@ -489,9 +559,15 @@ elif st.session_state.page == "interview":
     st.divider()
 
     if not st.session_state.messages:
-        with st.spinner("Vertigo sta formulando la prima domanda..."):
-            initial_message = chatbot.start_interview()
+        with st.spinner("Vertigo sta formulando la prima domanda..."), llm_context(session_id=st.session_state.session_id):
+            try:
+                initial_message = chatbot.start_interview()
+            except LLMServiceError as e:
+                print(f"[ERRORE] Avvio colloquio fallito: {e}")
+                st.error("Il servizio è momentaneamente sovraccarico. Ricarica la pagina tra qualche istante.")
+                st.stop()
         st.session_state.messages = [{"role": "assistant", "content": initial_message}]
+        persist_interview_state(st.session_state.session_id, chatbot)
 
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
@@ -503,19 +579,20 @@ elif st.session_state.page == "interview":
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-            with st.chat_message("assistant"):
-                with st.spinner("Vertigo sta elaborando la tua risposta..."):
-                    response = chatbot.process_user_response(prompt)
-                    st.markdown(response)
+            with st.chat_message("assistant"), llm_context(session_id=st.session_state.session_id):
+                # I token vengono mostrati man mano che arrivano dal modello
+                response = st.write_stream(chatbot.process_user_response_stream(prompt))
 
             st.session_state.messages.append({"role": "assistant", "content": response})
+            persist_interview_state(st.session_state.session_id, chatbot)
             st.rerun()
     else:
         st.success("Colloquio completato!")
         st.info("La tua conversazione è stata salvata. Ora puoi procedere con la valutazione finale.")
         if st.button("Procedi alla Valutazione e al Feedback", use_container_width=True, type="primary"):
-            with st.spinner("Salvataggio conversazione..."):
-                save_stage_output(st.session_state.session_id, "conversation", chatbot.conversation_history)
+            # Ogni turno è già stato accodato a stages.conversation appena concluso: qui si verifica
+            # che il blob coincida con la cronologia (turni falliti o duplicati) prima di valutarla
+            chatbot.transcript.reconcile_mongo(chatbot.conversation_history)
             st.session_state.show_feedback_hint = True
             st.session_state.page = "feedback_processing"
             st.rerun()
@@ -528,12 +605,12 @@ elif st.session_state.page == "feedback_processing":
     st.markdown("I nostri agenti AI stanno analizzando la tua performance nel colloquio per preparare il tuo report di feedback personalizzato (essendo un processo complesso, ci possono volere fino a 5 minuti).")
 
     if "feedback_pipeline_complete" not in st.session_state:
-        with st.spinner("Fase 1/2: Valutazione della performance..."):
+        with st.spinner("Fase 1/2: Valutazione della performance..."), llm_context(session_id=st.session_state.session_id):
             eval_success = execute_case_evaluation(session_id=st.session_state.session_id)
 
         # Scoring delle skill (CV + colloquio)
         if eval_success:
-            with st.spinner("Fase extra: Valutazione delle skill (CV + colloquio)..."):
+            with st.spinner("Fase extra: Valutazione delle skill (CV + colloquio)..."), llm_context(session_id=st.session_state.session_id):
                 sr_ok = compute_and_save_skill_relevance(session_id=st.session_state.session_id)
                 if sr_ok:
                     st.success("Valutazione skill completata.")
@@ -544,12 +621,12 @@ elif st.session_state.page == "feedback_processing":
 
         if eval_success:
             st.success("Valutazione della performance completata.")
-            with st.spinner("Fase 2/2: Creazione del report di feedback personalizzato..."):
+            with st.spinner("Fase 2/2: Creazione del report di feedback personalizzato..."), llm_context(session_id=st.session_state.session_id):
                 from feedback_generator.run_feedback_generator import run_feedback_pipeline
-                pdf_path = run_feedback_pipeline(session_id=st.session_state.session_id)
+                report_id = run_feedback_pipeline(session_id=st.session_state.session_id)
 
-            if pdf_path:
-                st.session_state.feedback_pdf_path = pdf_path
+            if report_id:
+                st.session_state.feedback_report_id = report_id
                 st.session_state.feedback_pipeline_complete = True
                 st.session_state.page = "feedback_display"
                 st.rerun()
@@ -567,22 +644,30 @@ elif st.session_state.page == "feedback_processing":
 elif st.session_state.page == "feedback_display":
     st.header("Il Tuo Report di Feedback Personalizzato")
     st.success("Report pronto!")
-    pdf_path = st.session_state.get("feedback_pdf_path")
-    if pdf_path and os.path.exists(pdf_path):
-        with open(pdf_path, "rb") as pdf_file:
-            st.download_button(
-                label="⬇️ Scarica il tuo Report in PDF",
-                data=pdf_file.read(),
-                file_name=f"Report_Feedback_{st.session_state.selected_position}.pdf",
-                mime='application/pdf',
-                use_container_width=True
-            )
+    # Il report è nello store condiviso (GridFS): nessun file sul disco della replica.
+    # st.download_button vuole l'intero contenuto, quindi il download non è in streaming: i chunk
+    # vengono letti una sola volta per report e tenuti in sessione, non a ogni rerun della pagina.
+    report_id = st.session_state.get("feedback_report_id")
+    cached_report = st.session_state.get("feedback_report_pdf")
+    if report_id and (not cached_report or cached_report["report_id"] != report_id):
+        cached_report = {"report_id": report_id, "bytes": b"".join(iter_pdf_report(report_id))}
+        if cached_report["bytes"]:
+            st.session_state.feedback_report_pdf = cached_report
+    pdf_bytes = cached_report["bytes"] if report_id and cached_report else b""
+    if pdf_bytes:
+        st.download_button(
+            label="⬇️ Scarica il tuo Report in PDF",
+            data=pdf_bytes,
+            file_name=f"Report_Feedback_{st.session_state.selected_position}.pdf",
+            mime='application/pdf',
+            use_container_width=True
+        )
     else:
         st.error("File PDF non trovato.")
 
     # Recupero dati di sessione UNA SOLA VOLTA
     try:
-        session_data = get_session_data(st.session_state.session_id)
+        session_data = get_session_data(st.session_state.session_id, stages=("skill_relevance",))
     except Exception:
         session_data = {}
 